@@ -5,21 +5,43 @@ Serial ↔ ESP32 | SQLite | Virtual sensors | Flask UI
 
 import os
 import json
+import queue
 import socket
 import sqlite3
 import sys
 import threading
 import time
 import argparse
-import keyboard
-from datetime import datetime, timedelta
+import atexit
+import hashlib
+import itertools
+import multiprocessing
+import signal
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 from contextlib import contextmanager
 
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, render_template, request, jsonify
+import numpy as np
 import serial
 import serial.tools.list_ports
 import warnings
 
+import farm_model
+from farm_config import config
+from farm_model import (
+    CATEGORICAL_INPUTS, FLAT_MODEL_PATH, FLOW_RATE_L_PER_MIN, IDEAL_MOISTURE, LIGHT_WATT,
+    MODEL_INPUTS, MODEL_PATH, MOTOR_WATT, PIPELINE_OUTPUTS, QUANTIZE_STEPS, STAGE_WEIGHTS,
+    as_columns, model_stamp, power_kwh, water_liters,
+)
+import ml_worker
+from serial_framing import FRAME_JSON, LineFramer, parse_frame
+import schedule_planner
+from sensor_ingest import SensorLog
+from usage_forecast import UsageHistory
+
 # Suppress sklearn warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="sklearn.utils.validation")
 
@@ -28,67 +50,6 @@ import logging
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
-# Load configuration
-def load_config():
-    """Load configuration from config.json file."""
-    config_path = os.path.join(os.path.dirname(__file__), "config.json")
-    try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"⚠️ Config file not found: {config_path}")
-        print("📝 Creating default config file...")
-        create_default_config()
-        return load_config()
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parsing config.json: {e}")
-        sys.exit(1)
-
-def create_default_config():
-    """Create default configuration file."""
-    default_config = {
-        "serial": {
-            "com_port": "COM13",
-            "baud_rate": 115200,
-            "timeout": 0.1,
-            "auto_detect": True
-        },
-        "devices": {
-            "motor": {
-                "name": "Bore Pump",
-                "gpio": 25,
-                "active_low": True,
-                "flow_rate_l_per_min": 20.0,
-                "power_watt": 750.0
-            },
-            "light": {
-                "name": "Grow Light",
-                "gpio": 26,
-                "active_low": True,
-                "power_watt": 100.0
-            }
-        },
-        "ml": {
-            "ideal_moisture": 0.65,
-            "stage_weights": {
-                "seedling": 1.2,
-                "vegetative": 1.0,
-                "flowering": 1.1,
-                "fruiting": 1.15
-            }
-        },
-        "ui": {
-            "poll_interval_ms": 2000,
-            "host": "0.0.0.0",
-            "port": 5000
-        }
-    }
-    
-    config_path = os.path.join(os.path.dirname(__file__), "config.json")
-    with open(config_path, 'w') as f:
-        json.dump(default_config, f, indent=2)
-    print(f"✅ Default config created: {config_path}")
-
 def parse_arguments():
     """Parse command line arguments for COM port selection."""
     parser = argparse.ArgumentParser(description='Smart Farm Server')
@@ -96,6 +57,8 @@ def parse_arguments():
                        help='Specify COM port (e.g., COM13, /dev/ttyUSB0)')
     parser.add_argument('--list-ports', '-l', action='store_true',
                        help='List available COM ports and exit')
+    parser.add_argument('--export-models', action='store_true',
+                       help='Write the memory-mapped model file (ml.flat_model), verify it and exit')
     return parser.parse_args()
 
 def list_com_ports():
@@ -117,89 +80,422 @@ def list_com_ports():
         for port in esp_ports:
             print(f"  🎯 {port.device} - {port.description}")
 
-# Parse arguments before loading config
-args = parse_arguments()
-
-# Load configuration
-config = load_config()
-
-# Override config with command line arguments
-if args.port:
-    config["serial"]["com_port"] = args.port
-    print(f"🔧 Using command-line COM port: {args.port}")
-
-if args.list_ports:
-    list_com_ports()
-    sys.exit(0)
-
-# ML Models - Required
-import sys
-import os
+# ML Models - loaded in the background by warm_up_models(), so importing this
+# module stays cheap and the server answers before scikit-learn is imported.
 sys.path.append(os.path.join(os.path.dirname(__file__), "model"))
-try:
-    from prediction_functions import SmartFarmPredictor
-    MODEL_PATH = os.path.join(os.path.dirname(__file__), "model")
-    ml_predictor = SmartFarmPredictor(MODEL_PATH)
-    HAS_ML_MODELS = True
-except Exception as e:
-    print(f"Error loading ML models: {e}")
-    HAS_ML_MODELS = False
-    ml_predictor = None
-    sys.exit(1)  # Exit if models cannot be loaded - no fallback
+# Bumped on every (re)load so caches keyed on model outputs can drop stale entries
+model_generation = 0
+ml_predictor = None
+HAS_ML_MODELS = False
+# "loading" until warm_up_models() finishes, then "ready" or "failed"
+models_state = {"status": "loading", "error": None, "load_ms": None, "format": None}
+models_ready = threading.Event()
+# Guards ml_predictor/model_generation so a scoring call sees a matching pair
+models_lock = threading.Lock()
+
+
+def load_models():
+    """(Re)load the predictor from MODEL_PATH (or its flat export)."""
+    global ml_predictor, HAS_ML_MODELS, model_generation
+    predictor, models_state["format"] = ml_worker.open_predictor(MODEL_PATH, FLAT_MODEL_PATH)
+    with models_lock:
+        ml_predictor = predictor
+        HAS_ML_MODELS = True
+        model_generation += 1
+
+
+def live_predictor() -> tuple:
+    """(predictor, generation) of the model version being served."""
+    with models_lock:
+        return ml_predictor, model_generation
 
 # --- Config-based Constants ---
 DB_PATH = os.path.join(os.path.dirname(__file__), "farm.db")
 SERIAL_BAUD = config["serial"]["baud_rate"]
 SERIAL_TIMEOUT = config["serial"]["timeout"]
-FLOW_RATE_L_PER_MIN = config["devices"]["motor"]["flow_rate_l_per_min"]
-MOTOR_WATT = config["devices"]["motor"]["power_watt"]
-LIGHT_WATT = config["devices"]["light"]["power_watt"]
-IDEAL_MOISTURE = config["ml"]["ideal_moisture"]
-STAGE_WEIGHTS = config["ml"]["stage_weights"]
-
-app = Flask(__name__)
-serial_port = None
-serial_lock = threading.Lock()
-# In-memory relay state (we control it via serial)
-relay_state = {"motor": False, "light": False}
-# Last runtime received (for immediate UI update)
-last_runtimes = {"motor": 0, "light": 0}
-# Track when relays were turned ON (for real-time analytics)
-relay_start_times = {"motor": None, "light": None}
+SERIAL_ACK = config["serial"].get("ack", True)
+SERIAL_ACK_TIMEOUT = config["serial"].get("ack_timeout_ms", 500) / 1000.0
+SERIAL_RETRIES = config["serial"].get("retries", 2)
+SERIAL_RECONNECT_MIN = config["serial"].get("reconnect_min_ms", 250) / 1000.0
+SERIAL_RECONNECT_MAX = config["serial"].get("reconnect_max_ms", 10000) / 1000.0
+STATUS_TICK_SEC = config["ui"].get("status_tick_ms", 1000) / 1000.0
+SEASON_DAYS = config.get("analytics", {}).get("season_days", 120)
+RAW_RETENTION_DAYS = config.get("analytics", {}).get("raw_retention_days", 180)
+FORECAST_DAYS = config.get("analytics", {}).get("forecast_days", 60)
+FORECAST_MIN_DAYS = config.get("analytics", {}).get("forecast_min_days", 8)
+DB_JOURNAL_MODE = config.get("database", {}).get("journal_mode", "WAL")
+DB_SYNCHRONOUS = config.get("database", {}).get("synchronous", "NORMAL")
+DB_BUSY_TIMEOUT_MS = config.get("database", {}).get("busy_timeout_ms", 5000)
+DB_CACHED_STATEMENTS = config.get("database", {}).get("cached_statements", 256)
+DB_POOL_SIZE = config.get("database", {}).get("pool_size", 8)
+USAGE_WRITER_BATCH = config.get("database", {}).get("writer_batch_size", 64)
+USAGE_WRITER_FLUSH_MS = config.get("database", {}).get("writer_flush_ms", 250)
+USAGE_WRITER_QUEUE_MAX = config.get("database", {}).get("writer_queue_max", 10000)
+PREDICTION_CACHE_SIZE = config["ml"].get("cache", {}).get("max_size", 4096)
+ML_WORKERS = config["ml"].get("workers", 0)
+ML_TIMEOUT = config["ml"].get("timeout_ms", 5000) / 1000.0
+MODEL_WATCH = config["ml"].get("reload", {}).get("watch", True)
+MODEL_POLL_SEC = config["ml"].get("reload", {}).get("poll_ms", 2000) / 1000.0
+SHADOW_BATCHES = config["ml"].get("reload", {}).get("shadow_batches", 5)
+SHADOW_TIMEOUT = config["ml"].get("reload", {}).get("shadow_timeout_ms", 60000) / 1000.0
+SHADOW_MAX_DIVERGENCE = config["ml"].get("reload", {}).get("max_divergence")
+IRRIGATION_AUTO = config.get("irrigation", {}).get("auto", False)
+IRRIGATION_INTERVAL_SEC = config.get("irrigation", {}).get("interval_ms", 5000) / 1000.0
+IRRIGATION_HYSTERESIS = config.get("irrigation", {}).get("hysteresis", 0.05)
+IRRIGATION_STRESS_ON = config.get("irrigation", {}).get("stress_on", 0.6)
+IRRIGATION_MIN_ON_SEC = config.get("irrigation", {}).get("min_on_sec", 120)
+IRRIGATION_MIN_OFF_SEC = config.get("irrigation", {}).get("min_off_sec", 600)
+IRRIGATION_MAX_ON_SEC = config.get("irrigation", {}).get("max_on_sec", 1800)
+IRRIGATION_WATER_BUDGET = config.get("irrigation", {}).get("daily_water_liters")
+IRRIGATION_ENERGY_BUDGET = config.get("irrigation", {}).get("daily_energy_kwh")
+SCHEDULER_AUTO = config.get("scheduler", {}).get("enabled", False)
+SCHEDULER_TICK_SEC = config.get("scheduler", {}).get("tick_ms", 5000) / 1000.0
+SCHEDULER_REPLAN_SEC = config.get("scheduler", {}).get("replan_ms", 300000) / 1000.0
+SCHEDULER_SLOT_MINUTES = config.get("scheduler", {}).get("slot_minutes", 60)
+SCHEDULER_STEP_MINUTES = config.get("scheduler", {}).get("step_minutes", 5)
+SCHEDULER_MAX_PUMP_MINUTES = config.get("scheduler", {}).get("max_pump_minutes", 240)
+SCHEDULER_LIGHT_MINUTES = config.get("scheduler", {}).get("light_minutes")
+SCHEDULER_LIGHT_HOURS = config.get("scheduler", {}).get("light_hours", [[18, 24], [0, 6]])
+SCHEDULER_TARIFF = schedule_planner.parse_tariff(config.get("scheduler", {}).get("tariff", [["00:00", 0.15]]))
+SENSOR_STALE_SEC = config.get("sensors", {}).get("stale_sec", 300)
+SENSOR_SMOOTHING_SEC = config.get("sensors", {}).get("smoothing_sec", 30)
+SENSOR_DAYLIGHT_LUX = config.get("sensors", {}).get("daylight_lux", 1000)
+SENSOR_FLUSH_SEC = config.get("sensors", {}).get("flush_ms", 5000) / 1000.0
+SENSOR_RETENTION_DAYS = config.get("sensors", {}).get("minute_retention_days", 14)
+SIMULATION_MAX_WORKERS = max(1, config.get("simulation", {}).get("max_workers", 2))
+SIMULATION_MAX_JOBS = config.get("simulation", {}).get("max_jobs", 4)
+
+bp = Blueprint("farm", __name__)
+# Field that owns pre-multi-field data and the un-scoped API routes
+DEFAULT_FIELD = "main"
 
 
 # --- Database ---
+# Connections are opened once, tuned (WAL, synchronous, busy_timeout) and kept
+# in a pool, so the per-connection prepared-statement cache survives between
+# calls. A thread holds one connection for the duration of a db() block; nested
+# db() blocks in the same thread share it and only the outermost commits.
+db_pool = queue.LifoQueue()
+db_local = threading.local()
+
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
     return conn
 
 
 @contextmanager
 def db():
-    conn = get_db()
+    conn = getattr(db_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    try:
+        conn = db_pool.get_nowait()
+    except queue.Empty:
+        conn = get_db()
+    db_local.conn = conn
     try:
         yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        db_local.conn = None
+        if db_pool.qsize() < DB_POOL_SIZE:
+            db_pool.put(conn)
+        else:
+            conn.close()
+
+
+# --- Rolling usage counters ---
+class RollingCounter:
+    """Sum of values over a sliding time window, kept in a ring of fixed-width
+    buckets. add() and total() are O(1) amortized: buckets are zeroed and
+    subtracted from the running total as they fall out of the window."""
+
+    def __init__(self, window_sec: int = 86400, bucket_sec: int = 60):
+        self.bucket_sec = bucket_sec
+        self.size = window_sec // bucket_sec
+        self.buckets = [0] * self.size
+        self.head = None  # absolute slot number of the newest bucket
+        self.running_total = 0
+        self.lock = threading.Lock()
+
+    def _advance(self, slot: int):
+        if self.head is None:
+            self.head = slot
+            return
+        if slot <= self.head:
+            return
+        for s in range(self.head + 1, self.head + 1 + min(slot - self.head, self.size)):
+            i = s % self.size
+            self.running_total -= self.buckets[i]
+            self.buckets[i] = 0
+        self.head = slot
+
+    def add(self, ts: float, value: int):
+        slot = int(ts) // self.bucket_sec
+        with self.lock:
+            self._advance(slot)
+            if slot <= self.head - self.size:
+                return  # already outside the window
+            self.buckets[slot % self.size] += value
+            self.running_total += value
+
+    def total(self, now: float = None) -> int:
+        with self.lock:
+            self._advance(int(now if now is not None else time.time()) // self.bucket_sec)
+            return self.running_total
+
+    def reset(self):
+        with self.lock:
+            self.buckets = [0] * self.size
+            self.head = None
+            self.running_total = 0
+
+
+# 24 h runtime per field and device in one-minute buckets (Controller.usage_counters);
+# log_usage keeps them in step with the usage table and rebuild_usage_counters()
+# reloads them on startup.
+USAGE_COUNTER_WINDOW_SEC = 24 * 3600
+usage_counters_ready = False
+
+
+def rebuild_usage_counters():
+    global usage_counters_ready
+    since = int(time.time()) - USAGE_COUNTER_WINDOW_SEC
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT field, device, (ts / 60) * 60 AS minute, SUM(runtime_sec) AS runtime_sec FROM usage "
+            "WHERE device IN ('motor', 'light') AND ts >= ? GROUP BY field, device, minute ORDER BY minute",
+            (since,),
+        ).fetchall()
+    for ctl in controllers.values():
+        for counter in ctl.usage_counters.values():
+            counter.reset()
+    for r in rows:
+        ctl = controllers.get(r["field"])
+        if ctl is not None:
+            ctl.usage_counters[r["device"]].add(r["minute"], r["runtime_sec"])
+    usage_counters_ready = True
+
+
+# Hourly runtime history per field (Controller.usage_history) for the next-day
+# forecast; loaded from usage_hourly on startup, then kept up to date by log_usage.
+def rebuild_usage_history():
+    now = time.time()
+    since = int(now) // 3600 * 3600 - FORECAST_DAYS * 86400
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT field, device, bucket, runtime_sec FROM usage_hourly "
+            "WHERE device IN ('motor', 'light') AND bucket >= ? ORDER BY bucket",
+            (since,),
+        ).fetchall()
+    by_field = {field: [] for field in controllers}
+    for r in rows:
+        if r["field"] in by_field:
+            by_field[r["field"]].append((r["bucket"], r["device"], r["runtime_sec"]))
+    for field, history in by_field.items():
+        controllers[field].usage_history.load(history, now)
+
+
+# --- Schema migrations ---
+# PRAGMA user_version records how many of MIGRATIONS have been applied.
+def migrate_v1(conn):
+    """Original schema: ISO-text timestamps."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage (
+            time TEXT,
+            device TEXT,
+            runtime_sec INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
 
 
-def init_db():
-    with db() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS usage (
-                time TEXT,
-                device TEXT,
-                runtime_sec INTEGER
-            )
+def migrate_v2(conn):
+    """Epoch-second timestamps plus a covering (device, ts) index, so time
+    windows are index range scans instead of string compares over the table."""
+    conn.execute("""
+        CREATE TABLE usage_v2 (
+            ts INTEGER NOT NULL,
+            device TEXT NOT NULL,
+            runtime_sec INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        INSERT INTO usage_v2 (ts, device, runtime_sec)
+        SELECT CAST(strftime('%s', time) AS INTEGER), device, COALESCE(runtime_sec, 0)
+        FROM usage
+        WHERE strftime('%s', time) IS NOT NULL AND device IS NOT NULL
+        ORDER BY time
+    """)
+    conn.execute("DROP TABLE usage")
+    conn.execute("ALTER TABLE usage_v2 RENAME TO usage")
+    conn.execute("CREATE INDEX idx_usage_device_ts ON usage (device, ts, runtime_sec)")
+
+
+def migrate_v3(conn):
+    """Hourly and daily per-device rollups, back-filled from raw usage."""
+    motor_lps, motor_kps = usage_rates("motor")
+    light_lps, light_kps = usage_rates("light")
+    for bucket_name, table in ROLLUP_TABLES.items():
+        size = USAGE_BUCKETS[bucket_name]
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                device TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                runtime_sec INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                water_liters REAL NOT NULL,
+                power_kwh REAL NOT NULL,
+                PRIMARY KEY (device, bucket)
+            ) WITHOUT ROWID
         """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
+        # Schema-v3 back-fill; rebuild_rollups() has since gained the field column
+        conn.execute(
+            f"INSERT INTO {table} (device, bucket, runtime_sec, events, water_liters, power_kwh) "
+            "SELECT device, (ts / ?) * ? AS b, SUM(runtime_sec), COUNT(*), "
+            "SUM(runtime_sec) * (CASE device WHEN 'motor' THEN ? ELSE ? END), "
+            "SUM(runtime_sec) * (CASE device WHEN 'motor' THEN ? ELSE ? END) "
+            "FROM usage WHERE device IN ('motor', 'light') GROUP BY device, b",
+            (size, size, motor_lps, light_lps, motor_kps, light_kps),
+        )
+
+
+def migrate_v4(conn):
+    """Field registry; usage and rollups gain a field column. Existing rows
+    belong to the default field."""
+    conn.execute("""
+        CREATE TABLE fields (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            com_port TEXT,
+            vid TEXT,
+            pid TEXT
+        )
+    """)
+    conn.execute("INSERT INTO fields (id, name) VALUES (?, 'Main Field')", (DEFAULT_FIELD,))
+    conn.execute(f"ALTER TABLE usage ADD COLUMN field TEXT NOT NULL DEFAULT '{DEFAULT_FIELD}'")
+    conn.execute("DROP INDEX idx_usage_device_ts")
+    conn.execute("CREATE INDEX idx_usage_field_device_ts ON usage (field, device, ts, runtime_sec)")
+    for table in ROLLUP_TABLES.values():
+        conn.execute(f"""
+            CREATE TABLE {table}_v4 (
+                field TEXT NOT NULL,
+                device TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                runtime_sec INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                water_liters REAL NOT NULL,
+                power_kwh REAL NOT NULL,
+                PRIMARY KEY (field, device, bucket)
+            ) WITHOUT ROWID
         """)
+        conn.execute(
+            f"INSERT INTO {table}_v4 SELECT ?, device, bucket, runtime_sec, events, water_liters, power_kwh "
+            f"FROM {table}",
+            (DEFAULT_FIELD,),
+        )
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_v4 RENAME TO {table}")
+
+
+def migrate_v5(conn):
+    """Auto-irrigation decision log."""
+    conn.execute("""
+        CREATE TABLE irrigation_log (
+            ts INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            action TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            motor INTEGER NOT NULL,
+            soil_moisture REAL,
+            csi REAL,
+            target REAL NOT NULL,
+            water_liters_24h REAL NOT NULL,
+            power_kwh_24h REAL NOT NULL,
+            decision_ms REAL NOT NULL,
+            command_ms REAL,
+            ok INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_irrigation_log_field_ts ON irrigation_log (field, ts)")
+
+
+def migrate_v6(conn):
+    """Sensor time series: one row per field, sensor and minute (kept for
+    sensors.minute_retention_days) and per hour (kept)."""
+    for table in SENSOR_TABLES.values():
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                field TEXT NOT NULL,
+                sensor TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                mean REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (field, sensor, bucket)
+            ) WITHOUT ROWID
+        """)
+
+
+def migrate_v7(conn):
+    """Settings revision, bumped by triggers in the same transaction as every
+    settings write (from any process)."""
+    conn.execute("""
+        CREATE TABLE settings_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            revision INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO settings_revision (id, revision) VALUES (0, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f"CREATE TRIGGER settings_revision_{event.lower()} AFTER {event} ON settings "
+            "BEGIN UPDATE settings_revision SET revision = revision + 1; END"
+        )
+
+
+MIGRATIONS = [migrate_v1, migrate_v2, migrate_v3, migrate_v4, migrate_v5, migrate_v6, migrate_v7]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate_db(conn):
+    """Apply pending migrations, each in its own transaction."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"🗄️ Database migrated to schema v{target}")
+
+
+def init_db():
+    with db() as conn:
+        migrate_db(conn)
         # Default settings
         for key, value in [
             ("motor_name", "Bore Pump"),
@@ -211,260 +507,1012 @@ def init_db():
                 "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
                 (key, value),
             )
+    load_settings()
+    load_fields()
+    compact_usage()
+    rebuild_usage_counters()
+    rebuild_usage_history()
+    rebuild_sensor_logs()
+
+
+def log_usage(device: str, runtime_sec: int, field: str = DEFAULT_FIELD):
+    """Record a completed runtime. The in-memory counters update immediately;
+    the row reaches farm.db through the batched usage writer."""
+    ts = int(time.time())
+    ctl = controllers.get(field)
+    if ctl is not None:
+        ctl.usage_counters[device].add(ts, runtime_sec)
+        ctl.usage_history.add(ts, device, runtime_sec)
+    enqueue_usage((ts, field, device, runtime_sec))
+
+
+def write_usage_batch(rows: list):
+    """Insert (ts, field, device, runtime_sec) rows and update rollups in one transaction."""
+    with db() as conn:
+        conn.executemany("INSERT INTO usage (ts, field, device, runtime_sec) VALUES (?, ?, ?, ?)", rows)
+        for ts, field, device, runtime_sec in rows:
+            add_to_rollups(conn, field, device, ts, runtime_sec)
+
+
+# --- Usage writer ---
+# The serial reader hands rows to a queue; one writer thread commits them every
+# USAGE_WRITER_BATCH rows or USAGE_WRITER_FLUSH_MS, whichever comes first. The
+# queue is bounded: when it is full the producer blocks (counted as
+# backpressure) rather than dropping a runtime.
+usage_queue = queue.Queue(maxsize=USAGE_WRITER_QUEUE_MAX)
+usage_writer_stop = threading.Event()
+usage_writer = None
+usage_writer_stats = {
+    "enqueued": 0,
+    "written": 0,
+    "batches": 0,
+    "blocked": 0,
+    "errors": 0,
+    "max_depth": 0,
+    "last_batch": 0,
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+}
+
+
+def enqueue_usage(row: tuple):
+    if usage_writer is None or not usage_writer.is_alive():
+        write_usage_batch([row])  # writer not running (startup, tools): write inline
+        usage_writer_stats["written"] += 1
+        return
+    usage_writer_stats["enqueued"] += 1
+    try:
+        usage_queue.put_nowait(row)
+    except queue.Full:
+        usage_writer_stats["blocked"] += 1
+        usage_queue.put(row)
+    usage_writer_stats["max_depth"] = max(usage_writer_stats["max_depth"], usage_queue.qsize())
 
 
-def log_usage(device: str, runtime_sec: int):
-    with db() as conn:
+def flush_usage_rows(rows: list):
+    """Commit rows, retrying until it succeeds so a transient lock or I/O error
+    never loses a runtime (the bounded queue applies backpressure meanwhile)."""
+    delay = 0.1
+    while True:
+        started = time.perf_counter()
+        try:
+            write_usage_batch(rows)
+            break
+        except sqlite3.Error as e:
+            usage_writer_stats["errors"] += 1
+            print(f"❌ Usage write failed ({len(rows)} rows), retrying: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    usage_writer_stats["written"] += len(rows)
+    usage_writer_stats["batches"] += 1
+    usage_writer_stats["last_batch"] = len(rows)
+    usage_writer_stats["last_flush_ms"] = round(elapsed_ms, 2)
+    usage_writer_stats["max_flush_ms"] = round(max(usage_writer_stats["max_flush_ms"], elapsed_ms), 2)
+
+
+def usage_writer_thread():
+    """Background: drain usage_queue in batches until stopped and empty."""
+    while True:
+        try:
+            rows = [usage_queue.get(timeout=0.5)]
+        except queue.Empty:
+            if usage_writer_stop.is_set():
+                return
+            continue
+        deadline = time.monotonic() + USAGE_WRITER_FLUSH_MS / 1000.0
+        while len(rows) < USAGE_WRITER_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(usage_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        flush_usage_rows(rows)
+        for _ in rows:
+            usage_queue.task_done()
+
+
+def start_usage_writer():
+    global usage_writer
+    usage_writer_stop.clear()
+    usage_writer = threading.Thread(target=usage_writer_thread, daemon=True)
+    usage_writer.start()
+
+
+def stop_usage_writer(timeout: float = 10.0):
+    """Flush everything queued and stop the writer (registered with atexit)."""
+    global usage_writer
+    if usage_writer is None:
+        return
+    usage_writer_stop.set()
+    usage_writer.join(timeout)
+    leftover = []
+    while True:
+        try:
+            leftover.append(usage_queue.get_nowait())
+        except queue.Empty:
+            break
+    if leftover:
+        flush_usage_rows(leftover)
+    usage_writer = None
+
+
+def usage_writer_info() -> dict:
+    return dict(
+        usage_writer_stats,
+        queue_depth=usage_queue.qsize(),
+        queue_max=USAGE_WRITER_QUEUE_MAX,
+        batch_size=USAGE_WRITER_BATCH,
+        flush_ms=USAGE_WRITER_FLUSH_MS,
+        running=bool(usage_writer and usage_writer.is_alive()),
+    )
+
+
+# --- Usage rollups ---
+# Materialized per-field, per-device totals so long windows never touch raw events.
+ROLLUP_TABLES = {"hour": "usage_hourly", "day": "usage_daily"}
+USAGE_BUCKETS = {"hour": 3600, "day": 86400}
+
+
+def usage_rates(device: str) -> tuple:
+    """(litres per second, kWh per second) of runtime for a device."""
+    if device == "motor":
+        return water_liters(1), power_kwh(1, MOTOR_WATT)
+    return 0.0, power_kwh(1, LIGHT_WATT)
+
+
+def add_to_rollups(conn, field: str, device: str, ts: int, runtime_sec: int):
+    liters_per_sec, kwh_per_sec = usage_rates(device)
+    for bucket_name, table in ROLLUP_TABLES.items():
+        size = USAGE_BUCKETS[bucket_name]
         conn.execute(
-            "INSERT INTO usage (time, device, runtime_sec) VALUES (?, ?, ?)",
-            (datetime.utcnow().isoformat(), device, runtime_sec),
+            f"INSERT INTO {table} (field, device, bucket, runtime_sec, events, water_liters, power_kwh) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (field, device, bucket) DO UPDATE SET "
+            "runtime_sec = runtime_sec + excluded.runtime_sec, events = events + 1, "
+            "water_liters = water_liters + excluded.water_liters, "
+            "power_kwh = power_kwh + excluded.power_kwh",
+            (field, device, ts // size * size, runtime_sec,
+             runtime_sec * liters_per_sec, runtime_sec * kwh_per_sec),
         )
 
 
-def get_setting(key: str, default: str = "") -> str:
+def rebuild_rollups(conn, start: int = None, end: int = None):
+    """Recompute rollup buckets from raw usage rows in [start, end).
+
+    start defaults to the oldest raw row and is snapped to a UTC day, so only
+    buckets whose raw rows are all still present are rewritten; rollups of
+    compacted history are left alone."""
+    if start is None:
+        start = conn.execute("SELECT MIN(ts) FROM usage").fetchone()[0]
+        if start is None:
+            return
+    start = start // 86400 * 86400
+    end = end if end is not None else 2 ** 62
+    motor_lps, motor_kps = usage_rates("motor")
+    light_lps, light_kps = usage_rates("light")
+    for bucket_name, table in ROLLUP_TABLES.items():
+        size = USAGE_BUCKETS[bucket_name]
+        conn.execute(f"DELETE FROM {table} WHERE bucket >= ? AND bucket < ?", (start, end))
+        conn.execute(
+            f"INSERT INTO {table} (field, device, bucket, runtime_sec, events, water_liters, power_kwh) "
+            "SELECT field, device, (ts / ?) * ? AS b, SUM(runtime_sec), COUNT(*), "
+            "SUM(runtime_sec) * (CASE device WHEN 'motor' THEN ? ELSE ? END), "
+            "SUM(runtime_sec) * (CASE device WHEN 'motor' THEN ? ELSE ? END) "
+            "FROM usage WHERE device IN ('motor', 'light') AND ts >= ? AND ts < ? "
+            "GROUP BY field, device, b",
+            (size, size, motor_lps, light_lps, motor_kps, light_kps, start, end),
+        )
+
+
+def compact_usage(retention_days: int = None) -> int:
+    """Fold raw usage older than retention_days (cut at a UTC midnight) into the
+    rollups and delete it. Returns the number of raw rows removed."""
+    retention_days = RAW_RETENTION_DAYS if retention_days is None else retention_days
+    if not retention_days or retention_days <= 0:
+        return 0
+    cutoff = (int(time.time()) - retention_days * 86400) // 86400 * 86400
+    with db() as conn:
+        rebuild_rollups(conn, end=cutoff)
+        removed = conn.execute("DELETE FROM usage WHERE ts < ?", (cutoff,)).rowcount
+    if removed:
+        print(f"🗜️ Compacted {removed} raw usage rows older than {retention_days} days")
+    return removed
+
+
+# --- Sensor log ---
+# Sensor frames are downsampled in memory per field (Controller.sensors, a
+# SensorLog); the serial reader never writes them. Every SENSOR_FLUSH_SEC the
+# sensor writer takes the finished minutes of all fields and upserts them into
+# sensor_minute and sensor_hourly in one transaction.
+SENSOR_TABLES = {"minute": "sensor_minute", "hour": "sensor_hourly"}
+SENSOR_BUCKETS = {"minute": 60, "hour": 3600}
+sensor_pending = []
+sensor_write_lock = threading.Lock()
+sensor_writer_stats = {
+    "written": 0,
+    "batches": 0,
+    "errors": 0,
+    "last_batch": 0,
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+}
+
+
+def write_sensor_batch(rows: list):
+    """Upsert (field, bucket, sensor, samples, mean, min, max) minute rows into
+    both tables; a bucket written twice is merged, not replaced."""
+    with db() as conn:
+        for bucket_name, table in SENSOR_TABLES.items():
+            size = SENSOR_BUCKETS[bucket_name]
+            conn.executemany(
+                f"INSERT INTO {table} (field, sensor, bucket, samples, mean, min, max) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (field, sensor, bucket) DO UPDATE SET "
+                "mean = (mean * samples + excluded.mean * excluded.samples) / (samples + excluded.samples), "
+                "samples = samples + excluded.samples, "
+                "min = MIN(min, excluded.min), max = MAX(max, excluded.max)",
+                [(field, sensor, bucket // size * size, samples, mean, low, high)
+                 for field, bucket, sensor, samples, mean, low, high in rows],
+            )
+
+
+def flush_sensor_readings(final: bool = False) -> int:
+    """Write the finished sensor minutes of every field (with final, the open
+    ones too). Rows that fail to write stay pending for the next flush."""
+    with sensor_write_lock:
+        now = time.time() + (60 if final else 0)
+        for ctl in list(controllers.values()):
+            sensor_pending.extend((ctl.field,) + row for row in ctl.sensors.take_finished(now))
+        if not sensor_pending:
+            return 0
+        started = time.perf_counter()
+        try:
+            write_sensor_batch(sensor_pending)
+        except sqlite3.Error as e:
+            sensor_writer_stats["errors"] += 1
+            print(f"❌ Sensor write failed ({len(sensor_pending)} rows), retrying next flush: {e}")
+            return 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        written = len(sensor_pending)
+        sensor_pending.clear()
+    sensor_writer_stats["written"] += written
+    sensor_writer_stats["batches"] += 1
+    sensor_writer_stats["last_batch"] = written
+    sensor_writer_stats["last_flush_ms"] = round(elapsed_ms, 2)
+    sensor_writer_stats["max_flush_ms"] = round(max(sensor_writer_stats["max_flush_ms"], elapsed_ms), 2)
+    return written
+
+
+def sensor_writer_thread():
+    """Background: flush finished sensor minutes every SENSOR_FLUSH_SEC."""
+    while True:
+        time.sleep(SENSOR_FLUSH_SEC)
+        try:
+            flush_sensor_readings()
+        except Exception as e:
+            print(f"❌ Sensor writer error: {e}")
+
+
+def rebuild_sensor_logs():
+    """Reload the last 24 h of light and rain minutes, so daily light hours
+    and rainfall survive a restart."""
+    since = int(time.time()) - 24 * 3600
     with db() as conn:
-        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
-        return row["value"] if row else default
+        rows = conn.execute(
+            "SELECT field, bucket, sensor, samples, mean FROM sensor_minute "
+            "WHERE sensor IN ('lux', 'rain_mm') AND bucket >= ?",
+            (since,),
+        ).fetchall()
+    by_field = {field: [] for field in controllers}
+    for r in rows:
+        if r["field"] in by_field:
+            by_field[r["field"]].append((r["bucket"], r["sensor"], r["samples"], r["mean"]))
+    for field, history in by_field.items():
+        controllers[field].sensors.load(history)
+
+
+def prune_sensor_minutes(retention_days: int = None) -> int:
+    """Drop minute rows older than retention_days; the hourly rows stay."""
+    retention_days = SENSOR_RETENTION_DAYS if retention_days is None else retention_days
+    if not retention_days or retention_days <= 0:
+        return 0
+    with db() as conn:
+        return conn.execute(
+            "DELETE FROM sensor_minute WHERE bucket < ?", (int(time.time()) - retention_days * 86400,)
+        ).rowcount
 
 
-def set_setting(key: str, value: str):
+def get_sensor_series(seconds: int, bucket: str, field: str = DEFAULT_FIELD) -> list:
+    """Per-sensor minute or hourly rows covering the last `seconds`."""
+    size = SENSOR_BUCKETS[bucket]
     with db() as conn:
-        conn.execute(
+        rows = conn.execute(
+            f"SELECT bucket, sensor, samples, mean, min, max FROM {SENSOR_TABLES[bucket]} "
+            "WHERE field = ? AND bucket >= ? ORDER BY bucket, sensor",
+            (field, (int(time.time()) - seconds) // size * size),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+# --- Settings store ---
+# Write-through cache of the settings table. settings_version is bumped whenever
+# a value changes so dependent caches can tell crop/stage moved. Edits made to
+# farm.db by other processes are noticed on a dedicated connection: PRAGMA
+# data_version changes after any other connection commits (the usage and
+# sensor writers too), so it only gates a read of settings_revision, which the
+# settings triggers bump; the table itself is re-read only when that moved.
+settings_cache = {}
+settings_lock = threading.Lock()
+settings_version = 0
+settings_conn = None
+settings_data_version = None
+settings_revision = None
+
+
+def _settings_revision() -> int:
+    return settings_conn.execute("SELECT revision FROM settings_revision").fetchone()[0]
+
+
+def _reload_settings_locked():
+    """Re-read the settings table into the cache. Caller holds settings_lock."""
+    global settings_cache, settings_version, settings_data_version, settings_revision
+    settings_data_version = settings_conn.execute("PRAGMA data_version").fetchone()[0]
+    settings_revision = _settings_revision()
+    rows = settings_conn.execute("SELECT key, value FROM settings").fetchall()
+    fresh = {r["key"]: r["value"] for r in rows}
+    if fresh != settings_cache:
+        settings_cache = fresh
+        settings_version += 1
+        return True
+    return False
+
+
+def load_settings():
+    global settings_conn
+    with settings_lock:
+        if settings_conn is None:
+            settings_conn = get_db()
+        _reload_settings_locked()
+
+
+def check_settings() -> bool:
+    """Reload the cache if farm.db changed since the last check.
+    Returns True if any setting value changed."""
+    if settings_conn is None:
+        load_settings()
+        return False
+    global settings_data_version
+    with settings_lock:
+        data_version = settings_conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == settings_data_version:
+            return False
+        if _settings_revision() == settings_revision:
+            settings_data_version = data_version  # some other table was written
+            return False
+        changed = _reload_settings_locked()
+    if changed:
+        request_status_refresh()
+    return changed
+
+
+def get_setting(key: str, default: str = "") -> str:
+    check_settings()
+    return settings_cache.get(key, default)
+
+
+def set_settings(values: dict):
+    """Write several settings in one transaction, then update the cache."""
+    global settings_cache, settings_version
+    with db() as conn:
+        conn.executemany(
             "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-            (key, value),
+            list(values.items()),
         )
+    with settings_lock:
+        fresh = dict(settings_cache, **values)
+        if fresh != settings_cache:
+            settings_cache = fresh
+            settings_version += 1
+    request_status_refresh()
+
+
+def set_setting(key: str, value: str):
+    set_settings({key: value})
 
 
-def get_recent_usage(hours: int = 24):
+def get_recent_usage(hours: int = 24, field: str = DEFAULT_FIELD):
     with db() as conn:
-        since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        since = int(time.time()) - hours * 3600
         rows = conn.execute(
-            "SELECT time, device, runtime_sec FROM usage WHERE time >= ? ORDER BY time DESC",
-            (since,),
+            "SELECT ts, device, runtime_sec FROM usage "
+            "WHERE field = ? AND device IN ('motor', 'light') AND ts >= ? ORDER BY ts DESC",
+            (field, since),
         ).fetchall()
-        return [dict(r) for r in rows]
+        return [
+            {
+                "time": datetime.utcfromtimestamp(r["ts"]).isoformat(),
+                "device": r["device"],
+                "runtime_sec": r["runtime_sec"],
+            }
+            for r in rows
+        ]
 
 
-def get_usage_for_ml(days: int = 30):
-    """Return list of (runtime_sec, day_offset) for pump for ML."""
+def get_usage_for_ml(days: int = 30, field: str = DEFAULT_FIELD):
+    """Return list of (runtime_sec, day_start_ts) of daily pump totals for ML."""
     with db() as conn:
-        since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        since = (int(time.time()) - days * 86400) // 86400 * 86400
         rows = conn.execute(
-            "SELECT time, device, runtime_sec FROM usage WHERE time >= ? AND device = 'motor'",
-            (since,),
+            "SELECT bucket, runtime_sec FROM usage_daily "
+            "WHERE field = ? AND device = 'motor' AND bucket >= ? ORDER BY bucket",
+            (field, since),
         ).fetchall()
-        return [(r["runtime_sec"], r["time"]) for r in rows]
+        return [(r["runtime_sec"], r["bucket"]) for r in rows]
+
+
+# Named analytics windows and rollup bucket sizes (seconds)
+USAGE_WINDOWS = {
+    "1h": 3600,
+    "24h": 86400,
+    "7d": 7 * 86400,
+    "30d": 30 * 86400,
+    "season": SEASON_DAYS * 86400,
+}
+
+
+def parse_window(value: str) -> int:
+    """Window length in seconds from a name in USAGE_WINDOWS or '<n>h' / '<n>d'."""
+    if value in USAGE_WINDOWS:
+        return USAGE_WINDOWS[value]
+    units = {"h": 3600, "d": 86400}
+    if len(value) > 1 and value[-1] in units and value[:-1].isdigit() and int(value[:-1]) > 0:
+        return int(value[:-1]) * units[value[-1]]
+    raise ValueError(f"Invalid window: {value!r}")
+
+
+def get_runtime_totals(seconds: int, field: str = DEFAULT_FIELD) -> dict:
+    """Total logged runtime per device over the last `seconds`, summed in SQLite."""
+    totals = {"motor": 0, "light": 0}
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT device, SUM(runtime_sec) AS total FROM usage "
+            "WHERE field = ? AND device IN ('motor', 'light') AND ts >= ? GROUP BY device",
+            (field, int(time.time()) - seconds),
+        ).fetchall()
+    for r in rows:
+        totals[r["device"]] = r["total"]
+    return totals
+
+
+def get_usage_rollup(seconds: int, bucket: str, field: str = DEFAULT_FIELD):
+    """Per-device hourly or daily rollup rows covering the last `seconds`.
+    The first bucket is the one containing the window start."""
+    size = USAGE_BUCKETS[bucket]
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT bucket, device, runtime_sec, events, water_liters, power_kwh "
+            f"FROM {ROLLUP_TABLES[bucket]} WHERE field = ? AND device IN ('motor', 'light') AND bucket >= ? "
+            "ORDER BY bucket, device",
+            (field, (int(time.time()) - seconds) // size * size),
+        ).fetchall()
+        return [dict(r) for r in rows]
 
 
 # --- Serial ---
-def find_esp32_port():
-    # Check for manual override first
-    manual_port = os.getenv("ESP32_COM_PORT")
-    if manual_port:
-        print(f"🔧 Using manual COM port override: {manual_port}")
-        return manual_port
-    
-    # Use config port if auto-detect is disabled
-    if not config["serial"]["auto_detect"]:
-        config_port = config["serial"]["com_port"]
-        print(f"🔧 Using configured COM port: {config_port}")
-        return config_port
-    
-    # Get all available ports
-    available_ports = serial.tools.list_ports.comports()
-    if not available_ports:
-        print("❌ No serial ports found")
-        return None
-    
-    print("\n🔍 Available COM ports:")
-    for i, port in enumerate(available_ports, 1):
-        print(f"  {i}. {port.device} - {port.description}")
-    
-    # Try to auto-detect ESP32
-    esp_ports = []
-    for port in available_ports:
-        if "USB" in port.description or "Serial" in port.description or "CP210" in port.description or "CH340" in port.description or "Silicon Labs" in port.description:
-            esp_ports.append(port)
-    
-    if esp_ports:
-        print(f"\n✅ Found {len(esp_ports)} potential ESP32 port(s):")
-        for i, port in enumerate(esp_ports, 1):
-            print(f"  {i}. {port.device} - {port.description}")
-        
-        # If only one ESP32 port found, use it
-        if len(esp_ports) == 1:
-            selected_port = esp_ports[0].device
-            print(f"\n🎯 Auto-selected: {selected_port}")
-            return selected_port
-        
-        # If multiple ESP32 ports, let user choose
-        while True:
-            try:
-                choice = input(f"\n📝 Select ESP32 port (1-{len(esp_ports)}) or press Enter to scan all: ").strip()
-                if not choice:
-                    break
-                choice_idx = int(choice) - 1
-                if 0 <= choice_idx < len(esp_ports):
-                    selected_port = esp_ports[choice_idx].device
-                    print(f"🎯 Selected: {selected_port}")
-                    return selected_port
-                else:
-                    print("❌ Invalid selection. Try again.")
-            except ValueError:
-                print("❌ Please enter a number.")
-    
-    # If no ESP32 ports found or user wants to see all ports
-    print("\n📝 Please select COM port manually:")
-    for i, port in enumerate(available_ports, 1):
-        print(f"  {i}. {port.device} - {port.description}")
-    
+# Each Controller's reader thread is the only place that opens its port.
+# Request handlers see the controller's link state (connected / last_seen) and
+# never enumerate ports or prompt. The last good device path and its USB
+# VID/PID are kept in settings so a restart or re-plug reconnects without
+# scanning, even if the OS renumbers the port.
+ESP32_PORT_HINTS = ("USB", "Serial", "CP210", "CH340", "Silicon Labs")
+
+
+def prompt_for_port(ports: list, prompt: str):
+    """Console selection from a list of ports (startup only)."""
     while True:
         try:
-            choice = input(f"\n📝 Select COM port (1-{len(available_ports)}): ").strip()
+            choice = input(prompt).strip()
+            if not choice:
+                return None
             choice_idx = int(choice) - 1
-            if 0 <= choice_idx < len(available_ports):
-                selected_port = available_ports[choice_idx].device
+            if 0 <= choice_idx < len(ports):
+                selected_port = ports[choice_idx].device
                 print(f"🎯 Selected: {selected_port}")
                 return selected_port
             else:
                 print("❌ Invalid selection. Try again.")
         except ValueError:
             print("❌ Please enter a number.")
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n👋 Exiting...")
             return None
 
 
-def open_serial():
-    global serial_port
-    if serial_port and serial_port.is_open:
-        return True
-    port = find_esp32_port()
-    if not port:
-        print("❌ Cannot open serial: No ESP32 port found")
-        return False
-    try:
-        print(f"🔌 Attempting to open serial port: {port}")
-        serial_port = serial.Serial(port, SERIAL_BAUD, timeout=SERIAL_TIMEOUT)
-        print(f"✅ Serial port opened successfully: {port}")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to open serial port {port}: {e}")
-        return False
+# --- Command channel ---
+class PendingCommand:
+    """One in-flight command awaiting its {"ack": seq} frame."""
+
+    def __init__(self, seq: int, cmd: str):
+        self.seq = seq
+        self.cmd = cmd
+        self.attempts = 0
+        self.sent_at = None
+        self.ack = None
+        self.latency_ms = None
+        self.done = threading.Event()
+
+    def result(self) -> dict:
+        ack = self.ack or {}
+        return {
+            "cmd": self.cmd,
+            "seq": self.seq,
+            "ok": bool(ack.get("ok")),
+            "acked": self.ack is not None,
+            "attempts": self.attempts,
+            "latency_ms": self.latency_ms,
+            "state": {d: bool(ack[d]) for d in ("motor", "light") if d in ack},
+        }
+
+
+class CommandChannel:
+    """Sequence-numbered commands with matched acknowledgements.
 
+    Commands go out as "CMD#seq"; the firmware executes them and answers with
+    {"ack": seq, "ok": ..., "motor": ..., "light": ...}, which the reader
+    thread passes to resolve(). send_many() writes every command before
+    waiting, so several commands share one round trip. A command that is not
+    acknowledged within `timeout` is re-sent with the same seq (relay commands
+    are idempotent) up to `retries` times."""
 
-def send_command(cmd: str) -> bool:
-    global serial_port  # Add global declaration here
-    with serial_lock:
-        if not open_serial():
+    def __init__(self, write, timeout: float, retries: int):
+        self.write = write
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.next_seq = 1
+        self.pending = {}
+
+    def _transmit(self, pending: PendingCommand):
+        pending.attempts += 1
+        if pending.sent_at is None:
+            pending.sent_at = time.perf_counter()
+        self.write(f"{pending.cmd}#{pending.seq}\n".encode())
+
+    def resolve(self, ack: dict) -> bool:
+        try:
+            seq = int(ack.get("ack"))
+        except (TypeError, ValueError):
             return False
+        with self.lock:
+            pending = self.pending.pop(seq, None)
+        if pending is None:
+            return False  # late ack of a command that already timed out
+        pending.latency_ms = round((time.perf_counter() - pending.sent_at) * 1000, 2)
+        pending.ack = ack
+        pending.done.set()
+        return True
+
+    def send_many(self, cmds: list) -> list:
+        with self.lock:
+            batch = []
+            for cmd in cmds:
+                pending = PendingCommand(self.next_seq, cmd.strip())
+                self.next_seq = self.next_seq % 1000000 + 1
+                self.pending[pending.seq] = pending
+                batch.append(pending)
         try:
-            command_to_send = cmd.strip() + "\n"
-            print(f"🔌 Sending command: {repr(command_to_send)}")
-            serial_port.write(command_to_send.encode())
-            serial_port.flush()
-            print(f"✅ Command sent successfully: {cmd.strip()}")
-            return True
+            for pending in batch:
+                self._transmit(pending)
+            for pending in batch:
+                while not pending.done.wait(self.timeout):
+                    if pending.attempts > self.retries:
+                        break
+                    self._transmit(pending)
         except Exception as e:
-            print(f"❌ Failed to send command '{cmd}': {e}")
-            serial_port = None
-            return False
+            print(f"❌ Failed to send commands {[p.cmd for p in batch]}: {e}")
+        finally:
+            with self.lock:
+                for pending in batch:
+                    self.pending.pop(pending.seq, None)
+        return [pending.result() for pending in batch]
+
+    def send(self, cmd: str) -> dict:
+        return self.send_many([cmd])[0]
+
+
+# --- Fields & controllers ---
+# A field is one plot with its own ESP32. The registry lives in the fields
+# table (seeded from config["fields"]); per-field crop/stage and the serial
+# port cache are settings keyed through field_key(). The default field keeps
+# the original un-prefixed keys and serves the un-scoped API routes.
+controllers = {}
+controllers_lock = threading.Lock()
+
+
+def field_key(field: str, key: str) -> str:
+    return key if field == DEFAULT_FIELD else f"{field}.{key}"
+
+
+class Controller:
+    """One ESP32 and the field it serves: serial link, relay state, runtimes,
+    usage counters and command channel. Every controller runs its own reader
+    thread, so a slow or unplugged port never holds up the others."""
+
+    def __init__(self, field: str, name: str, com_port: str = None, vid: str = None, pid: str = None):
+        self.field = field
+        self.name = name
+        self.com_port = com_port
+        self.vid = vid
+        self.pid = pid
+        self.port = None
+        self.lock = threading.Lock()
+        self.link = {
+            "connected": False,
+            "port": None,
+            "vid": None,
+            "pid": None,
+            "last_seen": None,
+            "connected_at": None,
+            "last_error": None,
+            "attempts": 0,
+            "reconnects": 0,
+            "retry_in": 0.0,
+        }
+        # In-memory relay state (we control it via serial)
+        self.relay_state = {"motor": False, "light": False}
+        # Last runtime received (for immediate UI update)
+        self.last_runtimes = {"motor": 0, "light": 0}
+        # Track when relays were turned ON (for real-time analytics)
+        self.relay_start_times = {"motor": None, "light": None}
+        # Recent non-JSON lines printed by the ESP32 firmware (for /api/debug)
+        self.firmware_log = deque(maxlen=50)
+        self.usage_counters = {d: RollingCounter(USAGE_COUNTER_WINDOW_SEC, 60) for d in ("motor", "light")}
+        self.usage_history = UsageHistory(FORECAST_DAYS, FORECAST_MIN_DAYS)
+        # Sensor frames downsampled to minutes, with smoothed latest values
+        self.sensors = SensorLog(SENSOR_SMOOTHING_SEC, SENSOR_DAYLIGHT_LUX)
+        self.channel = CommandChannel(self.write, SERIAL_ACK_TIMEOUT, SERIAL_RETRIES)
+        self.thread = None
+
+    def setting(self, key: str, default: str = "") -> str:
+        return get_setting(field_key(self.field, key), default)
+
+    def connected(self) -> bool:
+        """Cheap connection check; reconnecting is left to the reader thread."""
+        handle = self.port
+        return bool(handle and handle.is_open)
+
+    def manual_port(self):
+        if self.field == DEFAULT_FIELD:
+            return os.getenv("ESP32_COM_PORT") or (
+                None if config["serial"]["auto_detect"] else config["serial"]["com_port"])
+        return self.com_port
+
+    def find_port(self, interactive: bool = False):
+        """Pick the port: configured port, then the cached or configured
+        VID/PID. Only the default field falls back to guessing from the usual
+        USB-serial chips, and only it prompts (when interactive)."""
+        manual_port = self.manual_port()
+        if manual_port:
+            return manual_port
+
+        # Get all available ports
+        available_ports = serial.tools.list_ports.comports()
+        if not available_ports:
+            return None
 
+        # Same board as last time, wherever it was enumerated now
+        vid = self.vid or self.setting("serial_vid")
+        pid = self.pid or self.setting("serial_pid")
+        if vid and pid:
+            for port in available_ports:
+                if str(port.vid) == str(vid) and str(port.pid) == str(pid):
+                    return port.device
+        if self.field != DEFAULT_FIELD:
+            return None
 
-def serial_reader_thread():
-    """Background: read lines from ESP32, parse JSON runtime, store in DB."""
-    global serial_port  # so except block can set serial_port = None
-    buffer = b""
-    while True:
+        # Try to auto-detect ESP32, skipping ports other fields own
+        taken = claimed_ports(self)
+        available_ports = [p for p in available_ports if p.device not in taken]
+        esp_ports = [p for p in available_ports if any(h in p.description for h in ESP32_PORT_HINTS)]
+        if len(esp_ports) == 1 or (esp_ports and not interactive):
+            return esp_ports[0].device
+        if not interactive or not available_ports:
+            return None
+
+        if esp_ports:
+            print(f"\n✅ Found {len(esp_ports)} potential ESP32 port(s):")
+            for i, port in enumerate(esp_ports, 1):
+                print(f"  {i}. {port.device} - {port.description}")
+            selected_port = prompt_for_port(
+                esp_ports, f"\n📝 Select ESP32 port (1-{len(esp_ports)}) or press Enter to scan all: ")
+            if selected_port:
+                return selected_port
+
+        # If no ESP32 ports found or user wants to see all ports
+        print("\n📝 Please select COM port manually:")
+        for i, port in enumerate(available_ports, 1):
+            print(f"  {i}. {port.device} - {port.description}")
+        return prompt_for_port(available_ports, f"\n📝 Select COM port (1-{len(available_ports)}): ")
+
+    def remember_port(self, port: str):
+        """Cache the device path and USB VID/PID of a port that just opened."""
+        info = next((p for p in serial.tools.list_ports.comports() if p.device == port), None)
+        vid = str(info.vid) if info and info.vid is not None else ""
+        pid = str(info.pid) if info and info.pid is not None else ""
+        self.link.update(port=port, vid=vid or None, pid=pid or None)
+        values = {field_key(self.field, k): v for k, v in
+                  (("serial_port", port), ("serial_vid", vid), ("serial_pid", pid))}
+        if any(get_setting(k) != v for k, v in values.items()):
+            set_settings(values)
+
+    def try_open(self, port: str) -> bool:
         try:
-            if serial_port and serial_port.is_open:
-                buffer += serial_port.read(serial_port.in_waiting or 1)
-                while b"\n" in buffer or b"}" in buffer:
-                    line = buffer.split(b"\n")[0].decode("utf-8", errors="ignore").strip()
-                    if "}" in line:
-                        line = line[: line.index("}") + 1]
-                    buffer = buffer[buffer.find(b"\n") + 1:] if b"\n" in buffer else b""
-                    if "device" in line and "runtime" in line:
-                        try:
-                            data = json.loads(line)
-                            device = data.get("device", "")
-                            runtime = int(data.get("runtime", 0))
-                            if device in ("motor", "light") and runtime >= 0:
-                                log_usage(device, runtime)
-                                last_runtimes[device] = runtime
-                        except json.JSONDecodeError:
-                            pass
-            else:
-                open_serial()
-        except Exception:
-            serial_port = None
-        time.sleep(0.05)
+            handle = serial.Serial(port, SERIAL_BAUD, timeout=SERIAL_TIMEOUT)
+        except Exception as e:
+            self.link["last_error"] = f"{port}: {e}"
+            return False
+        with self.lock:
+            self.port = handle
+        return True
 
+    def open(self, interactive: bool = False) -> bool:
+        """Open the ESP32 port; called by the reader thread (and once at startup)."""
+        if self.connected():
+            return True
+        self.link["attempts"] += 1
+        # Fast path: the last good device path, no enumeration
+        cached = self.manual_port() or self.setting("serial_port")
+        opened = cached if cached and self.try_open(cached) else None
+        if not opened:
+            port = self.find_port(interactive)
+            if not port:
+                self.link["last_error"] = "No ESP32 port found"
+                return False
+            if port == cached or not self.try_open(port):
+                return False
+            opened = port
+        print(f"✅ [{self.field}] Serial port opened: {opened}")
+        self.remember_port(opened)
+        now = time.time()
+        self.link.update(connected=True, connected_at=now, last_seen=now, last_error=None, retry_in=0.0)
+        request_status_refresh()
+        return True
 
-# --- Virtual sensors & ML ---
-def virtual_moisture(pump_runtime_sec: float, temp_c: float = 24.0, rainfall_mm: float = 3.0) -> float:
-    """ML-based soil moisture prediction using trained models."""
-    crop = get_setting("crop", "tomato")
-    stage = get_setting("stage", "flowering")
-    
-    if HAS_ML_MODELS:
+    def drop(self, reason: str):
+        """Close the port after an I/O error; the reader thread reconnects."""
+        with self.lock:
+            handle, self.port = self.port, None
+        if handle is None:
+            return
         try:
-            return ml_predictor.predict_soil_moisture(
-                temperature_c=temp_c,
-                humidity_percent=75.0,  # Good humidity
-                rainfall_mm=rainfall_mm,
-                light_hours=12.0,  # Good daylight
-                pump_runtime_sec=pump_runtime_sec,
-                crop=crop,
-                stage=stage
+            handle.close()
+        except Exception:
+            pass
+        print(f"🔌 [{self.field}] Serial disconnected: {reason}")
+        self.link.update(connected=False, last_error=reason)
+        self.link["reconnects"] += 1
+        request_status_refresh()
+
+    def link_info(self) -> dict:
+        info = dict(self.link)
+        info["connected"] = self.connected()
+        return info
+
+    def write(self, data: bytes):
+        """Write raw bytes to the ESP32; raises if the port is not open."""
+        with self.lock:
+            handle = self.port
+            if not (handle and handle.is_open):
+                raise serial.SerialException("Serial port not connected")
+            try:
+                handle.write(data)
+                handle.flush()
+                return
+            except Exception as e:
+                error = e
+        self.drop(f"write failed: {error}")
+        raise error
+
+    def send_commands(self, cmds: list) -> list:
+        """Send several commands pipelined; returns one result dict per command."""
+        if SERIAL_ACK:
+            results = self.channel.send_many(cmds)
+        else:
+            # Firmware without acknowledgements: fire and forget, as before
+            results = []
+            for cmd in cmds:
+                started = time.perf_counter()
+                try:
+                    self.write((cmd.strip() + "\n").encode())
+                    ok = True
+                except Exception as e:
+                    print(f"❌ Failed to send command '{cmd}': {e}")
+                    ok = False
+                results.append({
+                    "cmd": cmd.strip(), "seq": None, "ok": ok, "acked": False, "attempts": 1,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 2), "state": {},
+                })
+        for r in results:
+            mark = "✅" if r["ok"] else "❌"
+            print(f"{mark} [{self.field}] {r['cmd']}: acked={r['acked']} attempts={r['attempts']} "
+                  f"latency={r['latency_ms']} ms")
+        return results
+
+    def handle_frame(self, data: dict):
+        """Apply one JSON frame from the ESP32 (sensor readings, command acks,
+        runtime reports)."""
+        sensors = data.get("sensors")
+        if isinstance(sensors, dict):
+            # The most frequent frame: in-memory only, the status engine picks it up
+            self.sensors.add(sensors)
+            return
+        if "ack" in data:
+            self.channel.resolve(data)
+            return
+        device = data.get("device", "")
+        if device in ("motor", "light") and "runtime" in data:
+            try:
+                runtime = int(data["runtime"])
+            except (TypeError, ValueError):
+                return
+            if runtime >= 0:
+                log_usage(device, runtime, self.field)
+                self.last_runtimes[device] = runtime
+                request_status_refresh()
+
+    def reader(self):
+        """Background: own the ESP32 port. Reconnect with exponential backoff,
+        read lines, parse JSON runtime, store in DB."""
+        framer = LineFramer()
+        backoff = SERIAL_RECONNECT_MIN
+        while True:
+            handle = self.port
+            if not (handle and handle.is_open):
+                if self.open():
+                    framer = LineFramer()
+                    backoff = SERIAL_RECONNECT_MIN
+                else:
+                    self.link["retry_in"] = backoff
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, SERIAL_RECONNECT_MAX)
+                continue
+            try:
+                # Blocks until at least one byte arrives or SERIAL_TIMEOUT passes
+                data = handle.read(handle.in_waiting or 1)
+            except Exception as e:
+                self.drop(f"read failed: {e}")
+                continue
+            if not data:
+                continue
+            self.link["last_seen"] = time.time()
+            for line in framer.feed(data):
+                kind, payload = parse_frame(line)
+                try:
+                    if kind == FRAME_JSON:
+                        self.handle_frame(payload)
+                    elif payload:
+                        self.firmware_log.append(payload)
+                except Exception as e:
+                    print(f"❌ [{self.field}] Failed to handle serial frame {payload!r}: {e}")
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.reader, name=f"serial-{self.field}", daemon=True)
+            self.thread.start()
+
+
+def claimed_ports(exclude: Controller = None) -> set:
+    """Ports configured for, or currently held by, the other controllers."""
+    taken = set()
+    for ctl in list(controllers.values()):
+        if ctl is exclude:
+            continue
+        if ctl.com_port:
+            taken.add(ctl.com_port)
+        if ctl.connected() and ctl.link["port"]:
+            taken.add(ctl.link["port"])
+    return taken
+
+
+def field_configs() -> list:
+    """config["fields"], always including the default field."""
+    fields = [dict(f) for f in config.get("fields", []) if f.get("id")]
+    if not any(f["id"] == DEFAULT_FIELD for f in fields):
+        fields.insert(0, {"id": DEFAULT_FIELD, "name": "Main Field"})
+    return fields
+
+
+def load_fields():
+    """Sync config["fields"] into the fields table and create a Controller for
+    every registered field (fields added to farm.db directly are picked up too)."""
+    with db() as conn:
+        for f in field_configs():
+            conn.execute(
+                "INSERT INTO fields (id, name, com_port, vid, pid) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET name = excluded.name, com_port = excluded.com_port, "
+                "vid = excluded.vid, pid = excluded.pid",
+                (f["id"], f.get("name") or f["id"], f.get("com_port"),
+                 str(f["vid"]) if f.get("vid") is not None else None,
+                 str(f["pid"]) if f.get("pid") is not None else None),
             )
-        except Exception as e:
-            print(f"Error in ML moisture prediction: {e}")
-            sys.exit(1)
-    else:
-        sys.exit(1)
+            for key, default in (("crop", "tomato"), ("stage", "flowering")):
+                conn.execute(
+                    "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                    (field_key(f["id"], key), f.get(key, default)),
+                )
+        rows = conn.execute("SELECT id, name, com_port, vid, pid FROM fields ORDER BY rowid").fetchall()
+    with controllers_lock:
+        for r in rows:
+            ctl = controllers.get(r["id"])
+            if ctl is None:
+                controllers[r["id"]] = Controller(r["id"], r["name"], r["com_port"], r["vid"], r["pid"])
+            else:
+                ctl.name, ctl.com_port, ctl.vid, ctl.pid = r["name"], r["com_port"], r["vid"], r["pid"]
+    load_settings()  # pick up the per-field defaults inserted above
 
 
-def power_kwh(seconds: float, watt: float) -> float:
-    return seconds * watt / 3600000.0
+def get_controller(field: str = DEFAULT_FIELD):
+    return controllers.get(field)
 
 
-def water_liters(runtime_sec: float) -> float:
-    return runtime_sec / 60.0 * FLOW_RATE_L_PER_MIN
+def serial_connected(field: str = DEFAULT_FIELD) -> bool:
+    ctl = controllers.get(field)
+    return bool(ctl and ctl.connected())
 
 
-def crop_stress_index(moisture: float, stage: str) -> float:
-    """ML-based crop stress index prediction."""
-    crop = get_setting("crop", "tomato")
-    
-    if HAS_ML_MODELS:
-        try:
-            return ml_predictor.predict_crop_stress(
-                temperature_c=24.0,  # Optimal temperature
-                humidity_percent=75.0,  # Good humidity
-                rainfall_mm=3.0,  # Moderate rainfall
-                light_hours=12.0,  # Good daylight
-                pump_runtime_sec=1800,  # Default pump runtime
-                soil_moisture=moisture,
-                crop=crop,
-                stage=stage
-            )
-        except Exception as e:
-            print(f"Error in ML crop stress prediction: {e}")
-            sys.exit(1)
-    else:
-        sys.exit(1)
+def start_controllers(interactive: bool = False):
+    """Start one reader per controller; the default field may prompt once first."""
+    for ctl in list(controllers.values()):
+        if ctl.field == DEFAULT_FIELD:
+            ctl.open(interactive=interactive)
+        ctl.start()
 
 
-def get_aggregates(hours: int = 24):
+# --- Virtual sensors & ML ---
+# Environmental inputs for fields without (fresh) sensor readings
+DEFAULT_ENVIRONMENT = {
+    "temperature_c": 24.0,  # Optimal temperature
+    "humidity_percent": 75.0,  # Good humidity
+    "rainfall_mm": 3.0,  # Moderate rainfall
+    "light_hours": 12.0,  # Good daylight
+}
+
+
+def field_environment(ctl: Controller, now: float = None) -> tuple:
+    """Environment inputs for a field from its sensors: smoothed temperature
+    and humidity reported within SENSOR_STALE_SEC, light hours and rainfall
+    once a day of readings is logged; DEFAULT_ENVIRONMENT for the rest.
+    Returns (environment, {input: "sensor" | "default"}, soil probe or None)."""
+    now = time.time() if now is None else now
+    latest = ctl.sensors.values(now, SENSOR_STALE_SEC)
+    measured = dict(ctl.sensors.daily(now), temperature_c=latest.get("temperature_c"),
+                    humidity_percent=latest.get("humidity_percent"))
+    environment, sources = {}, {}
+    for name, default in DEFAULT_ENVIRONMENT.items():
+        value = measured.get(name)
+        environment[name] = default if value is None else round(value, 2)
+        sources[name] = "default" if value is None else "sensor"
+    return environment, sources, latest.get("soil_moisture")
+
+
+def get_aggregates(hours: int = 24, ctl: Controller = None):
     """Sum motor/light runtimes in last N hours for virtual sensors.
     Includes both completed runtimes from DB and current active runtime."""
-    rows = get_recent_usage(hours)
-    motor_sec = sum(r["runtime_sec"] for r in rows if r["device"] == "motor")
-    light_sec = sum(r["runtime_sec"] for r in rows if r["device"] == "light")
+    ctl = ctl or controllers[DEFAULT_FIELD]
+    if usage_counters_ready and hours * 3600 == USAGE_COUNTER_WINDOW_SEC:
+        motor_sec = ctl.usage_counters["motor"].total()
+        light_sec = ctl.usage_counters["light"].total()
+    else:
+        totals = get_runtime_totals(hours * 3600, ctl.field)
+        motor_sec = totals["motor"]
+        light_sec = totals["light"]
     
     # Add current active runtime if relay is ON
     current_time = datetime.utcnow().timestamp()
+    relay_state, relay_start_times = ctl.relay_state, ctl.relay_start_times
     if relay_state["motor"] and relay_start_times["motor"]:
         active_motor_sec = int(current_time - relay_start_times["motor"])
         motor_sec += active_motor_sec
@@ -475,139 +1523,1695 @@ def get_aggregates(hours: int = 24):
     return motor_sec, light_sec
 
 
-def get_predictions():
-    """ML-based predictions for next-day water and power usage."""
-    motor_sec, light_sec = get_aggregates(24)
-    crop = get_setting("crop", "tomato")
-    stage = get_setting("stage", "flowering")
-    
-    if HAS_ML_MODELS:
+def get_forecast(ctl: Controller) -> dict:
+    """Next-24 h runtime forecast for a field plus the water and power it means.
+    Recomputed only after a new usage event or hour; cached otherwise."""
+    forecast = ctl.usage_history.forecast()
+    motor_sec = forecast["devices"]["motor"]["runtime_sec"]
+    light_sec = forecast["devices"]["light"]["runtime_sec"]
+    if motor_sec is None or light_sec is None:
+        return dict(forecast, water_liters=None, power_kwh=None)
+    return dict(
+        forecast,
+        water_liters=round(water_liters(motor_sec), 1),
+        power_kwh=round(power_kwh(motor_sec, MOTOR_WATT) + power_kwh(light_sec, LIGHT_WATT), 2),
+    )
+
+
+def get_predictions(ctl: Controller) -> dict:
+    """Next-day water and power usage forecast from the field's usage history;
+    None (source None) until the history covers a day."""
+    forecast = get_forecast(ctl)
+    if forecast["water_liters"] is None:
+        return {"water_liters": None, "power_kwh": None, "source": None}
+    return {
+        "water_liters": forecast["water_liters"],
+        "power_kwh": forecast["power_kwh"],
+        "source": "history",
+    }
+
+
+# --- Prediction cache ---
+# LRU of single-row model outputs keyed on (model, crop, stage, quantized inputs).
+# Rows are scored with the quantized values so a cached output is exactly what
+# the model would return for the key.
+prediction_cache = OrderedDict()
+prediction_cache_lock = threading.Lock()
+prediction_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+prediction_cache_generation = model_generation
+
+
+def cache_get(key):
+    global prediction_cache_generation
+    with prediction_cache_lock:
+        if prediction_cache_generation != model_generation:
+            # Models were reloaded: every cached output is stale
+            if prediction_cache:
+                prediction_cache.clear()
+                prediction_cache_stats["invalidations"] += 1
+            prediction_cache_generation = model_generation
+        value = prediction_cache.get(key)
+        if value is None:
+            prediction_cache_stats["misses"] += 1
+            return None
+        prediction_cache.move_to_end(key)
+        prediction_cache_stats["hits"] += 1
+        return value
+
+
+def cache_put(key, value: float, generation: int):
+    """Store a value scored by model `generation`; dropped if a newer version
+    was swapped in while it was being computed."""
+    if PREDICTION_CACHE_SIZE <= 0:
+        return
+    with prediction_cache_lock:
+        if generation != model_generation:
+            return
+        prediction_cache[key] = value
+        prediction_cache.move_to_end(key)
+        while len(prediction_cache) > PREDICTION_CACHE_SIZE:
+            prediction_cache.popitem(last=False)
+            prediction_cache_stats["evictions"] += 1
+
+
+def prediction_cache_info() -> dict:
+    with prediction_cache_lock:
+        stats = dict(prediction_cache_stats)
+        size = len(prediction_cache)
+    lookups = stats["hits"] + stats["misses"]
+    return dict(
+        stats,
+        size=size,
+        max_size=PREDICTION_CACHE_SIZE,
+        hit_rate=round(stats["hits"] / lookups, 4) if lookups else None,
+        model_generation=model_generation,
+    )
+
+
+# --- Inference workers ---
+# Optional process pool (ml.workers > 0) that runs SmartFarmPredictor outside
+# the web process. Cache misses for one model are sent as a single task. A row
+# that another thread is already waiting on is not sent twice: both wait on the
+# same future. Every call has a deadline (ml.timeout_ms); a worker that crashes
+# or hangs raises PredictionError and the pool is rebuilt in the background;
+# until it is ready, calls fail fast with "models loading".
+class PredictionError(RuntimeError):
+    """Model scoring failed or timed out."""
+
+
+ml_pool = None
+ml_pool_starting = False
+ml_pool_lock = threading.Lock()
+ml_inflight = {}
+ml_inflight_lock = threading.Lock()
+ml_worker_stats = {
+    "tasks": 0,
+    "rows": 0,
+    "coalesced": 0,
+    "timeouts": 0,
+    "failures": 0,
+    "restarts": 0,
+    "fallbacks": 0,
+}
+
+
+def new_ml_pool(generation: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=ML_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=ml_worker.init_worker,
+        initargs=(MODEL_PATH, generation, FLAT_MODEL_PATH),
+    )
+
+
+def start_ml_workers():
+    """Start the worker pool and wait until a worker has loaded the models;
+    the pool is only handed to score_remote() after that."""
+    global ml_pool, ml_pool_starting
+    if ML_WORKERS <= 0:
+        return
+    with ml_pool_lock:
+        if ml_pool is not None or ml_pool_starting:
+            return
+        ml_pool_starting = True
+    try:
+        pool = new_ml_pool(model_generation)
         try:
-            # Predict water usage with optimal parameters
-            pred_water = ml_predictor.predict_water_usage(
-                temperature_c=24.0,  # Optimal temperature
-                humidity_percent=75.0,  # Good humidity
-                rainfall_mm=3.0,  # Moderate rainfall
-                light_hours=12.0,  # Good daylight
-                soil_moisture=0.7,  # High moisture
-                crop=crop,
-                stage=stage
-            )
-            
-            # Predict power usage
-            pred_power = ml_predictor.predict_power_usage(
-                temperature_c=24.0,  # Optimal temperature
-                humidity_percent=75.0,  # Good humidity
-                light_hours=12.0,  # Good daylight
-                pump_runtime_sec=motor_sec,
-                light_runtime_sec=light_sec,
-                crop=crop,
-                stage=stage
-            )
-            
-            return {
-                "water_liters": round(pred_water * 0.005, 1),  # Scale down significantly for demo
-                "power_kwh": round(pred_power, 2),
-            }
+            models_state["format"] = pool.submit(ml_worker.model_format).result()
+        except Exception:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        with ml_pool_lock:
+            ml_pool = pool
+    finally:
+        with ml_pool_lock:
+            ml_pool_starting = False
+    print(f"🧠 ML worker pool ready ({ML_WORKERS} processes)")
+
+
+def start_ml_workers_background():
+    """Start the pool on its own thread; callers never wait for models to load."""
+    def run():
+        try:
+            start_ml_workers()
+        except Exception as e:
+            print(f"❌ ML worker pool failed to start: {e}")
+    threading.Thread(target=run, name="ml-workers-start", daemon=True).start()
+
+
+def stop_ml_workers(kill: bool = False):
+    """Shut the pool down; kill=True also terminates workers stuck in a call."""
+    global ml_pool
+    with ml_pool_lock:
+        pool, ml_pool = ml_pool, None
+    if pool is None:
+        return
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=not kill, cancel_futures=True)
+    if kill:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+
+def swap_ml_workers(generation: int):
+    """Switch to a new pool once one of its workers has loaded `generation`.
+    The old pool finishes the calls already submitted to it, then exits."""
+    global ml_pool
+    pool = new_ml_pool(generation)
+    try:
+        pool.submit(ml_worker.ping).result(timeout=max(ML_TIMEOUT, 60.0))
+    except Exception:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    with ml_pool_lock:
+        old, ml_pool = ml_pool, pool
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def restart_ml_workers(reason: str):
+    """Kill the pool and start a fresh one in the background; until it is up
+    score_remote() reports the models as loading."""
+    print(f"❌ Restarting ML workers: {reason}")
+    ml_worker_stats["restarts"] += 1
+    stop_ml_workers(kill=True)
+    start_ml_workers_background()
+
+
+def _settle(keys: list, task):
+    """Hand a finished task's values (or its error) to every waiter."""
+    with ml_inflight_lock:
+        futures = [ml_inflight.pop(key, None) for key in keys]
+    error = task.exception()
+    for i, future in enumerate(futures):
+        if future is None:
+            continue  # evicted after a timeout
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(task.result()[i])
+
+
+def score_remote(method_name: str, keys: list, columns: dict, generation: int) -> np.ndarray:
+    """Score the rows of {argument: array} `columns`, one per cache key, on the
+    worker pool; returns their values in order."""
+    with ml_pool_lock:
+        pool = ml_pool
+    if pool is None:
+        # Being (re)started in the background; never load models on this thread
+        raise PredictionError("models loading")
+    waiting, fresh = {}, []
+    with ml_inflight_lock:
+        for i, key in enumerate(keys):
+            future = ml_inflight.get(key)
+            if future is None:
+                future = Future()
+                ml_inflight[key] = future
+                fresh.append(i)
+            else:
+                ml_worker_stats["coalesced"] += 1
+            waiting[key] = future
+    if fresh:
+        fresh_keys = [keys[i] for i in fresh]
+        ml_worker_stats["tasks"] += 1
+        ml_worker_stats["rows"] += len(fresh)
+        try:
+            task = pool.submit(ml_worker.score, generation, method_name,
+                               {name: values[fresh] for name, values in columns.items()}, len(fresh))
+        except Exception as e:
+            task = Future()
+            task.set_exception(e)
+        task.add_done_callback(lambda t: _settle(fresh_keys, t))
+
+    deadline = time.monotonic() + ML_TIMEOUT
+    values = {}
+    try:
+        for key, future in waiting.items():
+            values[key] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FuturesTimeout:
+        ml_worker_stats["timeouts"] += 1
+        with ml_inflight_lock:
+            for key in waiting:
+                ml_inflight.pop(key, None)
+        restart_ml_workers(f"{method_name} timed out after {ML_TIMEOUT:.1f} s")
+        raise PredictionError(f"{method_name} timed out")
+    except Exception as e:
+        ml_worker_stats["failures"] += 1
+        if isinstance(e, BrokenProcessPool):
+            restart_ml_workers(f"worker died during {method_name}")
+        raise PredictionError(f"{method_name} failed: {e}") from e
+    return np.fromiter((values[key] for key in keys), dtype=float, count=len(keys))
+
+
+def ml_workers_info() -> dict:
+    with ml_pool_lock:
+        running = ml_pool is not None
+    with ml_inflight_lock:
+        inflight = len(ml_inflight)
+    return dict(
+        ml_worker_stats,
+        workers=ML_WORKERS,
+        running=running,
+        inflight=inflight,
+        timeout_ms=int(ML_TIMEOUT * 1000),
+        model_format=models_state["format"],
+    )
+
+
+def warm_up_models():
+    """Background: load the models (in the worker pool when ml.workers > 0,
+    otherwise in this process) and mark them ready. Until then the status
+    payload reports models "loading" instead of predictions. Then hands over
+    to model_watch_thread for hot reloads."""
+    global live_model
+    started = time.perf_counter()
+    stamp = model_stamp()
+    try:
+        if ML_WORKERS > 0:
+            start_ml_workers()
+        else:
+            load_models()
+    except Exception as e:
+        models_state.update(status="failed", error=str(e))
+        print(f"❌ Error loading ML models: {e}")
+    else:
+        models_state.update(status="ready", error=None)
+        models_ready.set()
+        print(f"🧠 ML models ready in {time.perf_counter() - started:.1f} s")
+    models_state["load_ms"] = round((time.perf_counter() - started) * 1000)
+    if models_state["status"] == "ready":
+        record = model_record(stamp, models_state["format"], models_state["load_ms"])
+        record.update(status="live", promoted_at=record["loaded_at"])
+        with models_lock:
+            live_model = record
+    request_status_refresh()
+    threading.Thread(target=model_watch_thread, name="model-watch", daemon=True).start()
+
+
+# Input ranges for the scenarios export_models() checks the flat artifact on
+EXPORT_CHECK_RANGES = {
+    "temperature_c": (5.0, 45.0),
+    "humidity_percent": (10.0, 100.0),
+    "rainfall_mm": (0.0, 50.0),
+    "light_hours": (0.0, 16.0),
+    "pump_runtime_sec": (0.0, 3600.0),
+    "light_runtime_sec": (0.0, 3600.0),
+    "soil_moisture": (0.0, 1.0),
+    "crop_stress_index": (0.0, 1.0),
+}
+
+
+def export_models(rows: int = 200) -> bool:
+    """Write FLAT_MODEL_PATH from the pickled models and check that it gives
+    bit-identical results: per ensemble on split-boundary inputs, then through
+    every predictor method on random scenarios. Returns True if all match."""
+    import tree_models
+    from prediction_functions import SmartFarmPredictor
+    if not FLAT_MODEL_PATH:
+        print("❌ ml.flat_model is not set in config.json")
+        return False
+    original = SmartFarmPredictor(MODEL_PATH)
+    summary = tree_models.export(original, FLAT_MODEL_PATH, MODEL_PATH)
+    trees = sum(e["trees"] for e in summary["ensembles"])
+    print(f"✅ Wrote {FLAT_MODEL_PATH}: {len(summary['ensembles'])} ensembles, {trees} trees, "
+          f"{summary['bytes'] / 1024:.0f} KiB")
+    flat = tree_models.load(FLAT_MODEL_PATH, MODEL_PATH)
+    ok = True
+    for name, n, identical in tree_models.verify(original, flat):
+        print(f"  {'✅' if identical else '❌'} {name}: {n} boundary rows")
+        ok = ok and identical
+
+    rng = np.random.default_rng(0)
+    crops = sorted({f.get("crop", "tomato") for f in config.get("fields", [])} | {"tomato"})
+    stages = sorted(STAGE_WEIGHTS)
+    for model, (method_name, inputs) in MODEL_INPUTS.items():
+        expected, got = [], []
+        for _ in range(rows):
+            kwargs = {c: float(rng.uniform(*EXPORT_CHECK_RANGES.get(c, (0.0, 100.0)))) for c in inputs}
+            kwargs.update(crop=str(rng.choice(crops)), stage=str(rng.choice(stages)))
+            expected.append(float(getattr(original, method_name)(**kwargs)))
+            got.append(float(getattr(flat, method_name)(**kwargs)))
+        identical = tree_models.same_bits(expected, got)
+        print(f"  {'✅' if identical else '❌'} {method_name}: {rows} scenarios")
+        ok = ok and identical
+    return ok
+
+
+# --- Batched inference ---
+# Model inputs and the chained pipeline live in farm_model.py (shared with
+# simulate.py); these run them against the live predictor and its cache.
+def score_model(model: str, columns: dict, n: int) -> np.ndarray:
+    """Run one model over n rows. Rows are snapped to QUANTIZE_STEPS and each
+    distinct scenario is looked up once in the prediction cache
+    (ml_worker.distinct_rows). The misses are scored together by
+    ml_worker.call_rows() (one array call when the predictor method takes
+    arrays, row by row otherwise), in one worker-pool task when ML_WORKERS is
+    set."""
+    if not models_ready.is_set():
+        raise PredictionError(f"models {models_state['status']}")
+    predictor, generation = live_predictor()
+    method_name, inputs = MODEL_INPUTS[model]
+    missing = [c for c in inputs + CATEGORICAL_INPUTS if c not in columns]
+    if missing:
+        raise KeyError(f"{model}: missing input column(s) {', '.join(missing)}")
+    keys, arguments, inverse = ml_worker.distinct_rows(columns, inputs, QUANTIZE_STEPS)
+    keys = [(model,) + key for key in keys]
+    values = np.empty(len(keys))
+    misses = []
+    for i, key in enumerate(keys):
+        value = cache_get(key)
+        if value is None:
+            misses.append(i)
+        else:
+            values[i] = value
+    if misses:
+        started = time.perf_counter()
+        rows = {name: column[misses] for name, column in arguments.items()}
+        if ML_WORKERS > 0:
+            fresh = score_remote(method_name, [keys[i] for i in misses], rows, generation)
+        else:
+            try:
+                fresh = ml_worker.call_rows(predictor, method_name, rows, len(misses))
+            except Exception as e:
+                raise PredictionError(f"{method_name} failed: {e}") from e
+        record_model_latency(model_latency, model, len(misses), time.perf_counter() - started)
+        values[misses] = fresh
+        for i, value in zip(misses, fresh.tolist()):
+            cache_put(keys[i], value, generation)
+    return values[inverse]
+
+
+def score_direct(predictor, model: str, columns: dict, n: int) -> np.ndarray:
+    """Run one model over n rows on `predictor` itself, bypassing the cache and
+    the worker pool (used to shadow-score a candidate version)."""
+    method_name, inputs = MODEL_INPUTS[model]
+    keys, arguments, inverse = ml_worker.distinct_rows(columns, inputs, QUANTIZE_STEPS)
+    return ml_worker.call_rows(predictor, method_name, arguments, len(keys))[inverse]
+
+
+def predict_batch(batch, models=None) -> dict:
+    """Score a columnar batch of scenarios with several models; each model
+    scores the batch's distinct scenarios together (see score_model).
+
+    `batch` is a pandas DataFrame or a mapping of column -> array (scalars are
+    broadcast to the batch length). Returns {model: float array}, one entry per
+    name in `models` (default: all of MODEL_INPUTS)."""
+    columns, n = as_columns(batch)
+    return {model: score_model(model, columns, n) for model in (models or MODEL_INPUTS)}
+
+
+def predict_pipeline(batch, score=score_model, outputs=PIPELINE_OUTPUTS) -> dict:
+    """farm_model.predict_pipeline, scored by the live models by default."""
+    return farm_model.predict_pipeline(batch, score, outputs)
+
+
+def run_pipeline(pump_runtime_sec: float, light_runtime_sec: float, crop: str, stage: str,
+                 environment: dict = None) -> dict:
+    """Single-scenario pipeline pass; returns {output: float}."""
+    batch = dict(environment or DEFAULT_ENVIRONMENT)
+    batch.update(
+        pump_runtime_sec=pump_runtime_sec,
+        light_runtime_sec=light_runtime_sec,
+        crop=crop,
+        stage=stage,
+    )
+    outputs = predict_pipeline(batch)
+    return {name: float(values[0]) for name, values in outputs.items()}
+
+
+# --- Model registry ---
+# Swaps in new model versions without a restart, so serial and relay state
+# survive. model_watch_thread polls model/ and, once a change has settled for
+# one poll, loads the new version as a candidate beside the live one, shadow-
+# scores it on the live status batches (ml.reload.shadow_batches) and promotes
+# it: model_generation moves on, so cached outputs of the old version are
+# dropped, and with ml.workers a new pool that has already loaded the version
+# replaces the old one, which finishes the calls it has in flight.
+live_model = None
+candidate_model = None
+model_history = deque(maxlen=10)
+# Latency totals per model for the live version (cache misses only)
+model_latency = {}
+model_versions = itertools.count(1)
+model_reload_stats = {"checks": 0, "reloads": 0, "promoted": 0, "rejected": 0, "failures": 0, "last_error": None}
+model_reload_requested = threading.Event()
+# Latest (batch, live outputs) from the status engine while a candidate is shadowed
+shadow_batches = deque(maxlen=1)
+shadow_batch_ready = threading.Event()
+
+
+def model_fingerprint(stamp: dict) -> str:
+    return hashlib.sha1(json.dumps(stamp, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def model_record(stamp: dict, fmt: str = None, load_ms: int = None) -> dict:
+    return {
+        "version": next(model_versions),
+        "fingerprint": model_fingerprint(stamp),
+        "files": len(stamp),
+        "format": fmt,
+        "load_ms": load_ms,
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+        "status": "candidate",
+    }
+
+
+def record_model_latency(stats: dict, model: str, rows: int, seconds: float):
+    entry = stats.setdefault(model, {"calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0})
+    ms = seconds * 1000
+    entry["calls"] += 1
+    entry["rows"] += rows
+    entry["total_ms"] += ms
+    entry["max_ms"] = max(entry["max_ms"], ms)
+
+
+def latency_summary(stats: dict) -> dict:
+    return {
+        model: {
+            "calls": e["calls"],
+            "rows": e["rows"],
+            "mean_ms": round(e["total_ms"] / e["calls"], 3),
+            "per_row_ms": round(e["total_ms"] / e["rows"], 3),
+            "max_ms": round(e["max_ms"], 3),
+        }
+        for model, e in list(stats.items()) if e["calls"]
+    }
+
+
+def offer_shadow_batch(batch: dict, outputs: dict):
+    """Status engine hook: pass the live batch and its outputs to the candidate."""
+    if candidate_model is not None:
+        shadow_batches.append((batch, outputs))
+        shadow_batch_ready.set()
+
+
+def shadow_score(predictor, record: dict):
+    """Score `predictor` on up to SHADOW_BATCHES live status batches and store
+    the divergence from the live outputs and its latency in record["shadow"]."""
+    diffs = {name: {"max_abs": 0.0, "sum_abs": 0.0} for name in PIPELINE_OUTPUTS}
+    latency = {}
+    batches = rows = 0
+
+    def timed(model, columns, n):
+        started = time.perf_counter()
+        values = score_direct(predictor, model, columns, n)
+        record_model_latency(latency, model, n, time.perf_counter() - started)
+        return values
+
+    shadow_batches.clear()
+    request_status_refresh()
+    deadline = time.monotonic() + SHADOW_TIMEOUT
+    while batches < SHADOW_BATCHES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not shadow_batch_ready.wait(remaining):
+            break
+        shadow_batch_ready.clear()
+        try:
+            batch, live = shadow_batches.popleft()
+        except IndexError:
+            continue
+        outputs = predict_pipeline(batch, score=timed)
+        for name in PIPELINE_OUTPUTS:
+            diff = np.abs(outputs[name] - live[name])
+            diffs[name]["max_abs"] = max(diffs[name]["max_abs"], float(diff.max()))
+            diffs[name]["sum_abs"] += float(diff.sum())
+        batches += 1
+        rows += len(outputs[PIPELINE_OUTPUTS[0]])
+        record["shadow"] = {
+            "batches": batches,
+            "rows": rows,
+            "divergence": {
+                name: {"max_abs": round(d["max_abs"], 6), "mean_abs": round(d["sum_abs"] / rows, 6)}
+                for name, d in diffs.items()
+            },
+            "latency": latency_summary(latency),
+        }
+
+
+def promote_model(predictor, record: dict):
+    """Make `record` the live version: swap the predictor (or the worker pool)
+    and move model_generation on in one step."""
+    global ml_predictor, HAS_ML_MODELS, model_generation, live_model, candidate_model, model_latency
+    if ML_WORKERS > 0:
+        swap_ml_workers(model_generation + 1)
+        predictor = None
+    now = datetime.now().isoformat(timespec="seconds")
+    with models_lock:
+        retired, latency = live_model, model_latency
+        ml_predictor = predictor
+        HAS_ML_MODELS = True
+        model_generation += 1
+        live_model, candidate_model, model_latency = record, None, {}
+    record.update(status="live", promoted_at=now)
+    if retired is not None:
+        retired.update(status="retired", retired_at=now, latency=latency_summary(latency))
+        model_history.appendleft(retired)
+    models_state.update(status="ready", error=None, format=record["format"], load_ms=record["load_ms"])
+    models_ready.set()
+    model_reload_stats["promoted"] += 1
+    print(f"🧠 Model version {record['version']} is live ({record['format']})")
+    request_status_refresh()
+
+
+def retire_candidate(record: dict, status: str, error: str):
+    global candidate_model
+    candidate_model = None
+    record.update(status=status, error=error)
+    model_history.appendleft(record)
+    model_reload_stats["rejected" if status == "rejected" else "failures"] += 1
+    model_reload_stats["last_error"] = error
+    print(f"❌ Model version {record['version']} {status}: {error}")
+
+
+def reload_models(stamp: dict) -> dict:
+    """Load the version currently in model/, shadow-score it and promote it.
+    Returns its record; the live version is untouched if any step fails."""
+    global candidate_model
+    model_reload_stats["reloads"] += 1
+    started = time.perf_counter()
+    try:
+        predictor, fmt = ml_worker.open_predictor(MODEL_PATH, FLAT_MODEL_PATH, fresh=True)
+    except Exception as e:
+        record = model_record(stamp)
+        retire_candidate(record, "failed", f"load failed: {e}")
+        return record
+    record = model_record(stamp, fmt, round((time.perf_counter() - started) * 1000))
+    print(f"🧠 Model version {record['version']} loaded ({fmt}, {record['load_ms']} ms)")
+    candidate_model = record
+    try:
+        if live_model is not None and SHADOW_BATCHES > 0:
+            shadow_score(predictor, record)
+    except Exception as e:
+        retire_candidate(record, "rejected", f"shadow scoring failed: {e}")
+        return record
+    divergence = (record.get("shadow") or {}).get("divergence", {})
+    worst = max((d["mean_abs"] for d in divergence.values()), default=0.0)
+    if SHADOW_MAX_DIVERGENCE is not None and worst > SHADOW_MAX_DIVERGENCE:
+        retire_candidate(record, "rejected", f"mean divergence {worst:g} > {SHADOW_MAX_DIVERGENCE:g}")
+        return record
+    try:
+        promote_model(predictor, record)
+    except Exception as e:
+        retire_candidate(record, "failed", f"promotion failed: {e}")
+    return record
+
+
+def model_watch_thread():
+    """Background: reload when the files in model/ change (every
+    ml.reload.poll_ms when watching) or when /api/models/reload asks to."""
+    pending = rejected = None
+    while True:
+        requested = model_reload_requested.wait(MODEL_POLL_SEC if MODEL_WATCH else None)
+        model_reload_requested.clear()
+        try:
+            stamp = model_stamp()
+        except OSError as e:
+            print(f"❌ Cannot read {MODEL_PATH}: {e}")
+            continue
+        model_reload_stats["checks"] += 1
+        fingerprint = model_fingerprint(stamp)
+        if not requested:
+            live = live_model["fingerprint"] if live_model else None
+            if fingerprint in (live, rejected):
+                pending = None
+                continue
+            if fingerprint != pending:
+                pending = fingerprint  # wait one more poll for a copy in progress
+                continue
+        pending = None
+        record = reload_models(stamp)
+        rejected = fingerprint if record["status"] in ("failed", "rejected") else None
+
+
+def models_info() -> dict:
+    with models_lock:
+        live = dict(live_model) if live_model else None
+        latency = latency_summary(model_latency)
+    if live is not None:
+        live["latency"] = latency
+    return {
+        "status": models_state["status"],
+        "live": live,
+        "candidate": dict(candidate_model) if candidate_model else None,
+        "history": list(model_history),
+        "reload": dict(
+            model_reload_stats,
+            watch=MODEL_WATCH,
+            poll_ms=int(MODEL_POLL_SEC * 1000),
+            shadow_batches=SHADOW_BATCHES,
+            max_divergence=SHADOW_MAX_DIVERGENCE,
+        ),
+    }
+
+
+# --- Status engine ---
+# One immutable snapshot per field per tick, shared by every client of that
+# field. All fields are scored in one predict_pipeline batch, so a tick costs
+# one pass per model however many controllers there are.
+StatusSnapshot = namedtuple("StatusSnapshot", ["version", "etag", "body", "payload"])
+status_snapshots = {}
+status_lock = threading.Lock()
+status_changed = threading.Condition(status_lock)
+status_wakeup = threading.Event()
+# Set once the engine runs; without it (create_app(services=False)) snapshots
+# are recomputed on every request
+status_engine_running = threading.Event()
+# Comment line sent to idle /api/stream clients so proxies keep the socket open
+STREAM_KEEPALIVE_SEC = 15.0
+# Pipeline outputs of the last successful tick per field, served while ML is down
+last_good_outputs = {}
+
+
+def field_batch(ctls: list) -> tuple:
+    """Pipeline inputs for the given controllers' fields, one row each, with
+    each field's sensed environment and soil probe (NaN where it has none).
+    Returns (batch, 24 h (motor, light) aggregates, crops, stages,
+    field_environment() results)."""
+    now = time.time()
+    aggregates = [get_aggregates(24, ctl) for ctl in ctls]
+    crops = [ctl.setting("crop", "tomato") for ctl in ctls]
+    stages = [ctl.setting("stage", "flowering") for ctl in ctls]
+    environments = [field_environment(ctl, now) for ctl in ctls]
+    batch = {name: [env[name] for env, _, _ in environments] for name in DEFAULT_ENVIRONMENT}
+    batch.update(
+        pump_runtime_sec=[a[0] for a in aggregates],
+        light_runtime_sec=[a[1] for a in aggregates],
+        crop=crops,
+        stage=stages,
+    )
+    probes = [probe for _, _, probe in environments]
+    if any(probe is not None for probe in probes):
+        batch["soil_moisture"] = [np.nan if probe is None else probe for probe in probes]
+    return batch, aggregates, crops, stages, environments
+
+
+def build_statuses(fields: list = None) -> dict:
+    """Compute the /api/status payload (aggregates, virtual sensors, ML) for
+    each field in `fields` (default: every registered field)."""
+    ctls = [controllers[f] for f in (fields or list(controllers)) if f in controllers]
+    if not ctls:
+        return {}
+    batch, aggregates, crops, stages, environments = field_batch(ctls)
+    columns = None
+    if models_ready.is_set():
+        try:
+            columns = predict_pipeline(batch)
+            offer_shadow_batch(batch, columns)
+        except Exception as e:
+            # Serve the last good prediction per field rather than failing the tick
+            print(f"❌ Error in ML pipeline: {e}")
+            ml_worker_stats["fallbacks"] += 1
+    payloads = {}
+    for i, ctl in enumerate(ctls):
+        motor_sec, light_sec = aggregates[i]
+        probe = environments[i][2]
+        if columns is not None:
+            outputs = {name: float(values[i]) for name, values in columns.items()}
+            last_good_outputs[ctl.field] = outputs
+        else:
+            outputs = last_good_outputs.get(ctl.field)
+        payloads[ctl.field] = {
+            "field": ctl.field,
+            "field_name": ctl.name,
+            "relay": dict(ctl.relay_state),
+            "motor_name": config["devices"]["motor"]["name"],
+            "light_name": config["devices"]["light"]["name"],
+            "crop": crops[i],
+            "stage": stages[i],
+            "last_runtimes": dict(ctl.last_runtimes),
+            "environment": dict(environments[i][0], source=environments[i][1],
+                                soil_probe=round(probe, 3) if probe is not None else None),
+            "virtual": {
+                "soil_moisture": round(outputs["soil_moisture"], 3) if outputs else None,
+                "soil_source": "probe" if probe is not None else "model",
+                "csi": round(outputs["crop_stress_index"], 3) if outputs else None,
+                "water_liters_24h": round(water_liters(motor_sec), 1),
+                "power_kwh_24h": round(
+                    power_kwh(motor_sec, MOTOR_WATT) + power_kwh(light_sec, LIGHT_WATT), 2
+                ),
+            },
+            "predictions": get_predictions(ctl),
+            "ml_ok": columns is not None,
+            "models": models_state["status"],
+            "serial_connected": ctl.connected(),
+            "auto_irrigation": irrigation_enabled(ctl),
+            "scheduled": scheduler_enabled(ctl),
+        }
+    return payloads
+
+
+def build_status(field: str = DEFAULT_FIELD) -> dict:
+    return build_statuses([field])[field]
+
+
+def publish_status(payload: dict, field: str = DEFAULT_FIELD) -> StatusSnapshot:
+    """Serialize payload once and swap it in; unchanged payloads keep their version."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    with status_lock:
+        current = status_snapshots.get(field)
+        if current is not None and current.etag == etag:
+            return current
+        version = current.version + 1 if current is not None else 1
+        snapshot = StatusSnapshot(version, etag, body, payload)
+        status_snapshots[field] = snapshot
+        status_changed.notify_all()
+        return snapshot
+
+
+def refresh_status(fields: list = None) -> dict:
+    """Rebuild and publish snapshots; returns {field: StatusSnapshot}."""
+    return {field: publish_status(payload, field) for field, payload in build_statuses(fields).items()}
+
+
+def patch_status(field: str = DEFAULT_FIELD, **changes) -> StatusSnapshot:
+    """Publish the current snapshot with a few keys replaced, without recomputing ML.
+    Used for relay changes so stream clients see them before the next full refresh."""
+    current = get_status_snapshot(field)
+    return publish_status(dict(current.payload, **changes), field)
+
+
+def wait_for_status(after_version: int, timeout: float, field: str = DEFAULT_FIELD):
+    """Block until a snapshot newer than after_version is published (or timeout)."""
+    def newer():
+        snapshot = status_snapshots.get(field)
+        return snapshot if snapshot is not None and snapshot.version > after_version else None
+
+    with status_changed:
+        status_changed.wait_for(newer, timeout)
+        return newer()
+
+
+def request_status_refresh():
+    """Wake the status engine now (relay toggle, new runtime, settings change)."""
+    status_wakeup.set()
+
+
+def get_status_snapshot(field: str = DEFAULT_FIELD) -> StatusSnapshot:
+    snapshot = status_snapshots.get(field)
+    if snapshot is None or not status_engine_running.is_set():
+        snapshot = refresh_status([field])[field]
+    return snapshot
+
+
+def status_engine_thread():
+    """Background: recompute every field's snapshot each tick or when woken."""
+    status_engine_running.set()
+    while True:
+        status_wakeup.wait(STATUS_TICK_SEC)
+        status_wakeup.clear()
+        try:
+            refresh_status()
         except Exception as e:
-            print(f"Error in ML predictions: {e}")
-            sys.exit(1)
+            print(f"❌ Status refresh failed: {e}")
+
+
+# --- Auto-irrigation ---
+# Closed loop on the predicted soil moisture and crop stress. Every
+# IRRIGATION_INTERVAL_SEC the fields with auto irrigation on are scored in one
+# predict_pipeline batch (the same cached inputs the status engine uses, so a
+# tick is mostly cache hits) and the pump is switched with hysteresis around
+# the stage's target moisture, minimum on/off times, a maximum run time and
+# rolling 24 h water/energy budgets. Switches, and holds whose reason changed,
+# are logged to irrigation_log.
+IRRIGATION_OUTPUTS = ("soil_moisture", "crop_stress_index")
+# Per field: motor state last seen, when it last changed, last logged reason
+irrigation_state = {}
+irrigation_stats = {"ticks": 0, "decisions": 0, "switches": 0, "failed": 0, "errors": 0,
+                    "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0}
+
+
+def irrigation_enabled(ctl: Controller) -> bool:
+    return ctl.setting("auto_irrigation", "1" if IRRIGATION_AUTO else "0") == "1"
+
+
+def irrigation_target(stage: str) -> float:
+    """Target soil moisture for a stage: IDEAL_MOISTURE scaled by its weight."""
+    return min(1.0, IDEAL_MOISTURE * STAGE_WEIGHTS.get(stage, 1.0))
+
+
+def irrigation_band(stage: str) -> tuple:
+    """(low, high) moisture the pump switches at for a stage."""
+    target = irrigation_target(stage)
+    return target - IRRIGATION_HYSTERESIS / 2, target + IRRIGATION_HYSTERESIS / 2
+
+
+def over_budget(water_24h: float, energy_24h: float):
+    """Reason the 24 h water/energy budget is used up, or None."""
+    if IRRIGATION_WATER_BUDGET is not None and water_24h >= IRRIGATION_WATER_BUDGET:
+        return "water budget reached"
+    if IRRIGATION_ENERGY_BUDGET is not None and energy_24h >= IRRIGATION_ENERGY_BUDGET:
+        return "energy budget reached"
+    return None
+
+
+def irrigation_decision(motor_on: bool, since_change: float, moisture, csi, stage: str,
+                        water_24h: float, energy_24h: float) -> tuple:
+    """("on" | "off" | "hold", reason) for one field. The pump starts when the
+    moisture falls below the target band or the stage-weighted stress reaches
+    IRRIGATION_STRESS_ON, and stops above the band; budgets and the maximum run
+    time stop it regardless of the prediction."""
+    low, high = irrigation_band(stage)
+    budget = over_budget(water_24h, energy_24h)
+    if motor_on:
+        if budget:
+            return "off", budget
+        if since_change >= IRRIGATION_MAX_ON_SEC:
+            return "off", "max run time"
+        if moisture is None:
+            return "hold", "no prediction"
+        if since_change < IRRIGATION_MIN_ON_SEC:
+            return "hold", "min on time"
+        if moisture >= high:
+            return "off", "moisture at target"
+        return "hold", "irrigating"
+    if moisture is None:
+        return "hold", "no prediction"
+    if moisture <= low:
+        reason = "dry soil"
+    elif moisture < high and csi is not None and csi * STAGE_WEIGHTS.get(stage, 1.0) >= IRRIGATION_STRESS_ON:
+        reason = "crop stress"
     else:
-        sys.exit(1)
+        return "hold", "moisture ok"
+    if budget:
+        return "hold", budget
+    if since_change < IRRIGATION_MIN_OFF_SEC:
+        return "hold", "min off time"
+    return "on", reason
+
+
+def motor_since_change(ctl: Controller, now: float) -> float:
+    """Seconds since the field's pump last switched (manually or by the loop)."""
+    on = ctl.relay_state["motor"]
+    state = irrigation_state.setdefault(ctl.field, {"motor": on, "changed": 0.0, "reason": None})
+    if state["motor"] != on:
+        state["motor"] = on
+        state["changed"] = now
+    if on and ctl.relay_start_times["motor"]:
+        state["changed"] = ctl.relay_start_times["motor"]
+    return now - state["changed"]
+
+
+def irrigation_tick() -> list:
+    """Decide (and switch) every auto-irrigated field once; returns the log rows."""
+    started = time.perf_counter()
+    ctls = [ctl for ctl in list(controllers.values()) if irrigation_enabled(ctl) and not scheduler_enabled(ctl)]
+    if not ctls:
+        return []
+    batch, aggregates, _, stages, _ = field_batch(ctls)
+    columns = None
+    if models_ready.is_set():
+        try:
+            columns = predict_pipeline(batch, outputs=IRRIGATION_OUTPUTS)
+        except Exception as e:
+            print(f"❌ Auto-irrigation prediction failed: {e}")
+            irrigation_stats["errors"] += 1
+    now = time.time()
+    decisions = []
+    for i, ctl in enumerate(ctls):
+        motor_sec, light_sec = aggregates[i]
+        moisture = float(columns["soil_moisture"][i]) if columns is not None else None
+        csi = float(columns["crop_stress_index"][i]) if columns is not None else None
+        water_24h = water_liters(motor_sec)
+        energy_24h = power_kwh(motor_sec, MOTOR_WATT) + power_kwh(light_sec, LIGHT_WATT)
+        action, reason = irrigation_decision(ctl.relay_state["motor"], motor_since_change(ctl, now),
+                                             moisture, csi, stages[i], water_24h, energy_24h)
+        decisions.append((ctl, action, reason, moisture, csi, irrigation_target(stages[i]), water_24h, energy_24h))
+    decision_ms = (time.perf_counter() - started) * 1000
+    irrigation_stats["ticks"] += 1
+    irrigation_stats["decisions"] += len(decisions)
+    irrigation_stats["last_ms"] = round(decision_ms, 3)
+    irrigation_stats["max_ms"] = round(max(irrigation_stats["max_ms"], decision_ms), 3)
+    irrigation_stats["total_ms"] += decision_ms
+
+    rows = []
+    for ctl, action, reason, moisture, csi, target, water_24h, energy_24h in decisions:
+        state = irrigation_state[ctl.field]
+        command_ms, ok = None, True
+        if action != "hold" and not ctl.connected():
+            action, reason = "hold", "serial disconnected"
+        elif action != "hold" and now < state.get("retry_at", 0):
+            action, reason = "hold", "retry pending"
+        if action != "hold":
+            result = set_relays(ctl, {"motor": action == "on"})[0]
+            command_ms, ok = result["latency_ms"], result["ok"]
+            if ok:
+                irrigation_stats["switches"] += 1
+                print(f"🌱 {ctl.field}: pump {action.upper()} ({reason})")
+            else:
+                # Let the reader reconnect before trying again
+                state["retry_at"] = now + max(IRRIGATION_INTERVAL_SEC, SERIAL_RECONNECT_MAX)
+                irrigation_stats["failed"] += 1
+                print(f"⚠️ {ctl.field}: pump {action.upper()} not confirmed ({reason})")
+        elif reason == state["reason"]:
+            continue
+        state["reason"] = reason
+        rows.append((
+            int(now), ctl.field, action, reason, int(ctl.relay_state["motor"]),
+            moisture, csi, round(target, 4), round(water_24h, 1), round(energy_24h, 3),
+            round(decision_ms, 3), command_ms, int(ok),
+        ))
+    if rows:
+        with db() as conn:
+            conn.executemany(
+                "INSERT INTO irrigation_log (ts, field, action, reason, motor, soil_moisture, csi, target, "
+                "water_liters_24h, power_kwh_24h, decision_ms, command_ms, ok) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+    return rows
+
+
+def irrigation_thread():
+    """Background: run irrigation_tick() on a fixed cadence."""
+    next_tick = time.monotonic()
+    while True:
+        next_tick += IRRIGATION_INTERVAL_SEC
+        try:
+            irrigation_tick()
+        except Exception as e:
+            irrigation_stats["errors"] += 1
+            print(f"❌ Auto-irrigation tick failed: {e}")
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+def prune_irrigation_log(retention_days: int = None) -> int:
+    retention_days = RAW_RETENTION_DAYS if retention_days is None else retention_days
+    if not retention_days or retention_days <= 0:
+        return 0
+    with db() as conn:
+        return conn.execute(
+            "DELETE FROM irrigation_log WHERE ts < ?", (int(time.time()) - retention_days * 86400,)
+        ).rowcount
+
+
+def irrigation_info(ctl: Controller, limit: int = 20) -> dict:
+    with db() as conn:
+        log = conn.execute(
+            "SELECT * FROM irrigation_log WHERE field = ? ORDER BY ts DESC, rowid DESC LIMIT ?",
+            (ctl.field, limit),
+        ).fetchall()
+    ticks = irrigation_stats["ticks"]
+    return {
+        "field": ctl.field,
+        "enabled": irrigation_enabled(ctl),
+        "motor": ctl.relay_state["motor"],
+        "target": round(irrigation_target(ctl.setting("stage", "flowering")), 4),
+        "settings": {
+            "interval_ms": int(IRRIGATION_INTERVAL_SEC * 1000),
+            "hysteresis": IRRIGATION_HYSTERESIS,
+            "stress_on": IRRIGATION_STRESS_ON,
+            "min_on_sec": IRRIGATION_MIN_ON_SEC,
+            "min_off_sec": IRRIGATION_MIN_OFF_SEC,
+            "max_on_sec": IRRIGATION_MAX_ON_SEC,
+            "daily_water_liters": IRRIGATION_WATER_BUDGET,
+            "daily_energy_kwh": IRRIGATION_ENERGY_BUDGET,
+        },
+        "stats": dict(irrigation_stats, total_ms=round(irrigation_stats["total_ms"], 3),
+                      mean_ms=round(irrigation_stats["total_ms"] / ticks, 3) if ticks else None),
+        "log": [dict(r) for r in log],
+    }
+
+
+# --- Tariff scheduler ---
+# Plans the next 24 h of pump and light runtime into the cheapest tariff slots
+# (schedule_planner.py) and runs the plan through the relay commands. The pump
+# must keep the trailing-24 h runtime the models need for the auto-irrigation
+# band, found by scoring a grid of runtimes in one cached pipeline batch; the
+# light gets the forecast daily runtime (or scheduler.light_minutes) inside
+# scheduler.light_hours. Plans are rebuilt every SCHEDULER_REPLAN_SEC. While a
+# field is scheduled the plan owns its relays and the auto-irrigation loop
+# leaves it alone; relays are only switched at window edges, so a manual toggle
+# holds until the next one.
+schedule_state = {}
+schedule_stats = {"plans": 0, "switches": 0, "failed": 0, "errors": 0, "last_plan_ms": 0.0, "max_plan_ms": 0.0}
+
+
+def scheduler_enabled(ctl: Controller) -> bool:
+    return ctl.setting("scheduler", "1" if SCHEDULER_AUTO else "0") == "1"
+
+
+def pump_requirement(crop: str, stage: str, light_sec: float, environment: dict = None) -> tuple:
+    """(trailing-24 h pump seconds that keep the predicted moisture in the
+    stage's band, reachable?) - the smallest runtime on a SCHEDULER_STEP_MINUTES
+    grid up to SCHEDULER_MAX_PUMP_MINUTES. Stressed scenarios need the top of
+    the band, as in irrigation_decision(). `environment` is the field's
+    (field_environment()), DEFAULT_ENVIRONMENT if not given."""
+    grid = np.arange(0, SCHEDULER_MAX_PUMP_MINUTES + SCHEDULER_STEP_MINUTES, SCHEDULER_STEP_MINUTES) * 60.0
+    batch = dict(environment or DEFAULT_ENVIRONMENT)
+    batch.update(pump_runtime_sec=grid, light_runtime_sec=light_sec, crop=crop, stage=stage)
+    outputs = predict_pipeline(batch, outputs=IRRIGATION_OUTPUTS)
+    moisture = outputs["soil_moisture"]
+    stressed = outputs["crop_stress_index"] * STAGE_WEIGHTS.get(stage, 1.0) >= IRRIGATION_STRESS_ON
+    low, high = irrigation_band(stage)
+    ok = np.flatnonzero((moisture >= low) & (~stressed | (moisture >= high)))
+    return (float(grid[ok[0]]), True) if len(ok) else (float(grid[-1]), False)
+
+
+def plan_schedule(ctl: Controller, now: float = None) -> dict:
+    """Next-24 h pump and light plan for a field with its cost and that of
+    running the same pump deadlines just in time."""
+    started = time.perf_counter()
+    now = int(now if now is not None else time.time())
+    slots = schedule_planner.build_slots(datetime.fromtimestamp(now), SCHEDULER_TARIFF, SCHEDULER_SLOT_MINUTES)
+    crop, stage = ctl.setting("crop", "tomato"), ctl.setting("stage", "flowering")
+    forecast = get_forecast(ctl)
+    motor_sec, light_sec = get_aggregates(24, ctl)
+
+    # Pump seconds from the last 24 h still inside the window at each slot end
+    first_hour, history = ctl.usage_history.recent(24, now)
+    hour_starts = first_hour + 3600.0 * np.arange(len(history))
+    slot_ends = np.array([slot["end"].timestamp() for slot in slots])
+    overlap = np.clip((hour_starts[None, :] + 3600 - (slot_ends[:, None] - 86400)) / 3600, 0, 1)
+    past = overlap @ history[:, 0]
+    if ctl.relay_state["motor"] and ctl.relay_start_times["motor"]:
+        past += now - ctl.relay_start_times["motor"]
+
+    required, reachable, source = None, True, None
+    deadlines = [0.0] * len(slots)
+    if models_ready.is_set():
+        try:
+            required, reachable = pump_requirement(crop, stage, light_sec, field_environment(ctl, now)[0])
+            source = "model"
+            deadlines = np.maximum.accumulate(np.maximum(required - past, 0.0) / 60).tolist()
+        except Exception as e:
+            print(f"❌ Schedule requirement failed: {e}")
+    if source is None and forecast["devices"]["motor"]["runtime_sec"] is not None:
+        source = "forecast"
+        deadlines[-1] = forecast["devices"]["motor"]["runtime_sec"] / 60
+    min_run = IRRIGATION_MIN_ON_SEC / 60
+    pump, shortfall = schedule_planner.cover(slots, deadlines, SCHEDULER_STEP_MINUTES, min_run)
+    if IRRIGATION_WATER_BUDGET is not None:
+        # Pumping already in the trailing 24 h counts against the budget; past
+        # only shrinks at later slot ends, so fitting past[0] fits every window
+        budget = max(0.0, IRRIGATION_WATER_BUDGET / FLOW_RATE_L_PER_MIN - past[0] / 60)
+        if sum(pump) > budget:
+            pump = schedule_planner.trim(slots, pump, budget, SCHEDULER_STEP_MINUTES, min_run)
+            shortfall = max(shortfall, deadlines[-1] - sum(pump))
+    baseline = schedule_planner.just_in_time(slots, deadlines)
+
+    light_minutes = SCHEDULER_LIGHT_MINUTES
+    if light_minutes is None:
+        light_minutes = (forecast["devices"]["light"]["runtime_sec"] or 0) / 60
+    open_slots = [i for i, slot in enumerate(slots) if schedule_planner.allowed(slot, SCHEDULER_LIGHT_HOURS)]
+    light = [0.0] * len(slots)
+    if open_slots and light_minutes > 0:
+        sub = [slots[i] for i in open_slots]
+        alloc, _ = schedule_planner.cover(sub, [0.0] * (len(sub) - 1) + [light_minutes], SCHEDULER_STEP_MINUTES)
+        for i, minutes in zip(open_slots, alloc):
+            light[i] = minutes
+
+    pump_cost = schedule_planner.cost(slots, pump, MOTOR_WATT)
+    light_cost = schedule_planner.cost(slots, light, LIGHT_WATT)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    schedule_stats["plans"] += 1
+    schedule_stats["last_plan_ms"] = round(elapsed_ms, 3)
+    schedule_stats["max_plan_ms"] = round(max(schedule_stats["max_plan_ms"], elapsed_ms), 3)
+    return {
+        "created": now,
+        "source": source,
+        "required_runtime_sec": required,
+        "feasible": reachable and shortfall <= 1e-6,
+        "shortfall_min": round(shortfall, 1),
+        "pump_min": round(sum(pump), 1),
+        "light_min": round(sum(light), 1),
+        "water_liters": round(water_liters(sum(pump) * 60), 1),
+        "power_kwh": round(power_kwh(sum(pump) * 60, MOTOR_WATT) + power_kwh(sum(light) * 60, LIGHT_WATT), 2),
+        "cost": round(pump_cost + light_cost, 2),
+        "just_in_time_cost": round(schedule_planner.cost(slots, baseline, MOTOR_WATT) + light_cost, 2),
+        "windows": {
+            device: [[start.timestamp(), end.timestamp()] for start, end in schedule_planner.windows(slots, alloc)]
+            for device, alloc in (("motor", pump), ("light", light))
+        },
+        "slots": [
+            {"start": slot["start"].strftime("%H:%M"), "price": round(slot["price"], 4),
+             "pump_min": round(p, 1), "light_min": round(l, 1)}
+            for slot, p, l in zip(slots, pump, light)
+        ],
+        "plan_ms": round(elapsed_ms, 3),
+    }
+
+
+def scheduled_states(plan: dict, now: float) -> dict:
+    return {device: any(start <= now < end for start, end in runs) for device, runs in plan["windows"].items()}
+
+
+def scheduler_tick():
+    """Re-plan fields whose plan is due and switch relays at window edges."""
+    now = time.time()
+    for ctl in list(controllers.values()):
+        if not scheduler_enabled(ctl):
+            schedule_state.pop(ctl.field, None)
+            continue
+        state = schedule_state.get(ctl.field)
+        if state is None:
+            # Relays already in the wanted position are not switched again
+            state = schedule_state[ctl.field] = {"plan": None, "applied": dict(ctl.relay_state), "retry_at": 0.0}
+        if state["plan"] is None or now - state["plan"]["created"] >= SCHEDULER_REPLAN_SEC:
+            state["plan"] = plan_schedule(ctl, now)
+        wanted = scheduled_states(state["plan"], now)
+        changes = {d: on for d, on in wanted.items() if state["applied"].get(d) != on}
+        if not changes or not ctl.connected() or now < state["retry_at"]:
+            continue
+        results = set_relays(ctl, changes)
+        for (device, on), result in zip(changes.items(), results):
+            if result["ok"]:
+                state["applied"][device] = on
+                schedule_stats["switches"] += 1
+                print(f"🕒 {ctl.field}: {device} {'ON' if on else 'OFF'} (schedule)")
+            else:
+                state["retry_at"] = now + max(SCHEDULER_TICK_SEC, SERIAL_RECONNECT_MAX)
+                schedule_stats["failed"] += 1
+                print(f"⚠️ {ctl.field}: scheduled {device} {'ON' if on else 'OFF'} not confirmed")
+
+
+def scheduler_thread():
+    """Background: run scheduler_tick() on a fixed cadence."""
+    next_tick = time.monotonic()
+    while True:
+        next_tick += SCHEDULER_TICK_SEC
+        try:
+            scheduler_tick()
+        except Exception as e:
+            schedule_stats["errors"] += 1
+            print(f"❌ Scheduler tick failed: {e}")
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+def schedule_info(ctl: Controller) -> dict:
+    state = schedule_state.get(ctl.field, {})
+    plan = state.get("plan")
+    if plan is None and not scheduler_enabled(ctl):
+        plan = plan_schedule(ctl)  # preview
+    return {
+        "field": ctl.field,
+        "enabled": scheduler_enabled(ctl),
+        "tariff": [[f"{m // 60:02d}:{m % 60:02d}", price] for m, price in SCHEDULER_TARIFF],
+        "applied": state.get("applied", {}),
+        "plan": plan,
+        "stats": dict(schedule_stats),
+    }
+
+
+# --- Simulation jobs ---
+# POST /api/simulate queues a season backtest (simulate.py) and returns a job
+# id. Jobs run one at a time on a single background thread, on at most
+# SIMULATION_MAX_WORKERS processes of the simulation pool that simulate.py
+# keeps between runs; at most SIMULATION_MAX_JOBS are queued or running.
+# Results stay readable at GET /api/simulate/<job> until SIMULATION_JOBS_KEPT
+# newer jobs have finished.
+SIMULATION_JOBS_KEPT = 20
+simulation_jobs = OrderedDict()
+simulation_jobs_lock = threading.Lock()
+simulation_queue = queue.Queue()
+simulation_thread = None
+
+
+def submit_simulation(field: str, run_args: dict, sort, top: int):
+    """Queue a simulate.run(**run_args) job; returns its id, or None when the queue is full."""
+    global simulation_thread
+    with simulation_jobs_lock:
+        active = sum(job["status"] in ("queued", "running") for job in simulation_jobs.values())
+        if active >= SIMULATION_MAX_JOBS:
+            return None
+        job_id = os.urandom(8).hex()
+        simulation_jobs[job_id] = {"job": job_id, "field": field, "status": "queued", "created": time.time()}
+        if simulation_thread is None:
+            simulation_thread = threading.Thread(target=simulation_worker, name="simulate", daemon=True)
+            simulation_thread.start()
+    simulation_queue.put((job_id, run_args, sort, top))
+    return job_id
+
+
+def simulation_worker():
+    while True:
+        run_simulation_job(*simulation_queue.get())
+
+
+def run_simulation_job(job_id: str, run_args: dict, sort, top: int):
+    import simulate
+    with simulation_jobs_lock:
+        simulation_jobs[job_id].update(status="running", started=time.time())
+    try:
+        out = simulate.run(**run_args)
+        update = {"status": "done", "stats": out["stats"], "results": sorted(out["results"], key=sort)[:top]}
+    except Exception as e:
+        print(f"❌ Simulation {job_id} failed: {e}")
+        update = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    with simulation_jobs_lock:
+        simulation_jobs[job_id].update(update, finished=time.time())
+        finished = [i for i, job in simulation_jobs.items() if job["status"] in ("done", "failed")]
+        for old in finished[:-SIMULATION_JOBS_KEPT]:
+            del simulation_jobs[old]
+    print(f"📊 Simulation {job_id} {update['status']}")
 
 
 # --- API ---
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
 
-@app.route("/api/status")
+def unknown_field(field: str):
+    return jsonify({"ok": False, "error": f"Unknown field: {field}"}), 404
+
+
+def status_response(field: str):
+    if field not in controllers:
+        return unknown_field(field)
+    snapshot = get_status_snapshot(field)
+    response = Response(snapshot.body, mimetype="application/json")
+    response.set_etag(snapshot.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+@bp.route("/api/status")
 def api_status():
-    motor_sec, light_sec = get_aggregates(24)
-    # Realistic environmental data for healthy crops
-    temp_c = 24.0  # Optimal temperature
-    rainfall_mm = 3.0  # Moderate rainfall
-    humidity_percent = 75.0  # Good humidity
-    light_hours = 12.0  # Good daylight
-    
-    moisture = virtual_moisture(motor_sec, temp_c, rainfall_mm)
-    stage = get_setting("stage", "flowering")
-    csi = round(crop_stress_index(moisture, stage), 3)
-    predictions = get_predictions()
+    return status_response(DEFAULT_FIELD)
+
+
+def sse_event(event: str, version: int, data: bytes) -> bytes:
+    return b"event: %s\nid: %d\ndata: %s\n\n" % (event.encode(), version, data)
+
+
+@bp.route("/api/stream")
+def api_stream():
+    """Server-sent events: one full `status` event, then `delta` events holding
+    only the top-level keys that changed since the last event sent.
+    ?field=<id> streams another field (default: the default field)."""
+    field = request.args.get("field", DEFAULT_FIELD)
+    if field not in controllers:
+        return unknown_field(field)
+
+    def events():
+        snapshot = get_status_snapshot(field)
+        sent = snapshot.payload
+        yield b"retry: 2000\n" + sse_event("status", snapshot.version, snapshot.body)
+        while True:
+            newer = wait_for_status(snapshot.version, STREAM_KEEPALIVE_SEC, field)
+            if newer is None:
+                yield b": keepalive\n\n"
+                continue
+            snapshot = newer
+            delta = {k: v for k, v in snapshot.payload.items() if sent.get(k) != v}
+            sent = snapshot.payload
+            if delta:
+                data = json.dumps(delta, sort_keys=True, separators=(",", ":")).encode()
+                yield sse_event("delta", snapshot.version, data)
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@bp.route("/api/ml/cache")
+def api_ml_cache():
+    return jsonify(prediction_cache_info())
+
+
+@bp.route("/api/ml/workers")
+def api_ml_workers():
+    return jsonify(ml_workers_info())
+
+
+@bp.route("/api/models")
+def api_models():
+    """Live model version, its per-model latency, the candidate being shadow-
+    scored (with divergence from the live outputs) and recent versions."""
+    return jsonify(models_info())
+
+
+@bp.route("/api/models/reload", methods=["POST"])
+def api_models_reload():
+    """Load model/ again now, even if no file changed."""
+    model_reload_requested.set()
+    return jsonify({"requested": True}), 202
+
+
+@bp.route("/api/usage")
+def api_usage():
+    """Usage analytics: ?window=1h|24h|7d|30d|season|<n>h|<n>d&bucket=hour|day&field=<id>"""
+    window = request.args.get("window", "24h")
+    bucket = request.args.get("bucket", "hour")
+    field = request.args.get("field", DEFAULT_FIELD)
+    try:
+        seconds = parse_window(window)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if bucket not in USAGE_BUCKETS:
+        return jsonify({"ok": False, "error": "Invalid bucket"}), 400
+    if field not in controllers:
+        return unknown_field(field)
+    rows = get_usage_rollup(seconds, bucket, field)
+    fields = ("runtime_sec", "events", "water_liters", "power_kwh")
+    totals = {d: dict.fromkeys(fields, 0) for d in ("motor", "light")}
+    for r in rows:
+        for f in fields:
+            totals[r["device"]][f] += r[f]
+        r["water_liters"] = round(r["water_liters"], 1)
+        r["power_kwh"] = round(r["power_kwh"], 3)
+    for t in totals.values():
+        t["water_liters"] = round(t["water_liters"], 1)
+        t["power_kwh"] = round(t["power_kwh"], 3)
     return jsonify({
-        "relay": relay_state,
-        "motor_name": config["devices"]["motor"]["name"],
-        "light_name": config["devices"]["light"]["name"],
-        "crop": get_setting("crop", "tomato"),
-        "stage": stage,
-        "last_runtimes": dict(last_runtimes),
-        "virtual": {
-            "soil_moisture": round(moisture, 3),
-            "csi": csi,
-            "water_liters_24h": round(water_liters(motor_sec), 1),
-            "power_kwh_24h": round(
-                power_kwh(motor_sec, MOTOR_WATT) + power_kwh(light_sec, LIGHT_WATT), 2
-            ),
-        },
-        "predictions": predictions,
-        "serial_connected": open_serial(),
+        "ok": True,
+        "field": field,
+        "window": window,
+        "window_sec": seconds,
+        "bucket": bucket,
+        "totals": totals,
+        "buckets": rows,
     })
 
 
-@app.route("/api/toggle", methods=["POST"])
-def api_toggle():
+@bp.route("/api/forecast")
+def api_forecast():
+    """Next-24 h forecast for ?field=<id>: runtime per device with the method
+    and features behind it, the water/power it implies, and cache counters."""
+    field = request.args.get("field", DEFAULT_FIELD)
+    ctl = get_controller(field)
+    if ctl is None:
+        return unknown_field(field)
+    return jsonify(dict(get_forecast(ctl), field=field, stats=ctl.usage_history.info()))
+
+
+@bp.route("/api/sensors")
+def api_sensors():
+    """Sensor readings for ?field=<id>: latest and smoothed values, the
+    environment fed to the models, and the minute or hourly series over
+    ?window= (?bucket=minute|hour)."""
+    window = request.args.get("window", "1h")
+    bucket = request.args.get("bucket", "minute")
+    field = request.args.get("field", DEFAULT_FIELD)
+    try:
+        seconds = parse_window(window)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if bucket not in SENSOR_BUCKETS:
+        return jsonify({"ok": False, "error": "Invalid bucket"}), 400
+    ctl = get_controller(field)
+    if ctl is None:
+        return unknown_field(field)
+    environment, sources, soil_probe = field_environment(ctl)
+    return jsonify({
+        "ok": True,
+        "field": field,
+        "window": window,
+        "bucket": bucket,
+        "environment": environment,
+        "source": sources,
+        "soil_probe": soil_probe,
+        "daily": ctl.sensors.daily(),
+        "ingest": ctl.sensors.info(),
+        "writer": dict(sensor_writer_stats, pending=len(sensor_pending), flush_ms=SENSOR_FLUSH_SEC * 1000),
+        "series": get_sensor_series(seconds, bucket, field),
+    })
+
+
+@bp.route("/api/simulate", methods=["POST"])
+def api_simulate():
+    """Queue a season backtest of schedules (simulate.py); returns 202 with a
+    job id to poll at GET /api/simulate/<job>. JSON body: "schedules" and/or
+    "grid": true, "weather" (hourly rows; default synthetic with "days" and
+    "seed"), "crop"/"stages" (default: the field's crop and crop calendar),
+    "sort", "top", "trajectory", "workers" (capped at simulation.max_workers)."""
+    import simulate
+    data = request.get_json(silent=True) or {}
+    field = data.get("field", DEFAULT_FIELD)
+    ctl = get_controller(field)
+    if ctl is None:
+        return unknown_field(field)
+    try:
+        if data.get("weather"):
+            weather = simulate.weather_from_rows(data["weather"])
+        else:
+            weather = simulate.synthetic_weather(int(data.get("days", SEASON_DAYS)), int(data.get("seed", 0)))
+        specs = list(data.get("schedules", []))
+        if data.get("grid") or not specs:
+            specs.extend(simulate.schedule_grid())
+        sort = simulate.SORT_KEYS[data.get("sort", "yield")]
+        top = int(data.get("top", 20))
+        stages = data.get("stages")
+        simulate.stage_hours(stages, len(weather["temperature_c"]))
+        workers = min(int(data.get("workers") or SIMULATION_MAX_WORKERS), SIMULATION_MAX_WORKERS)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"ok": False, "error": f"{type(e).__name__}: {e}"}), 400
+    run_args = {
+        "weather": weather, "specs": specs, "crop": data.get("crop") or ctl.setting("crop", "tomato"),
+        "stage_plan": stages, "workers": workers, "trajectory": bool(data.get("trajectory")),
+    }
+    job_id = submit_simulation(field, run_args, sort, top)
+    if job_id is None:
+        return jsonify({"ok": False, "error": "Too many simulations queued"}), 429
+    return jsonify({"ok": True, "field": field, "job": job_id, "status": "queued"}), 202
+
+
+@bp.route("/api/simulate/<job_id>")
+def api_simulate_job(job_id):
+    """State of a simulation job; "stats" and "results" once it is done."""
+    with simulation_jobs_lock:
+        job = simulation_jobs.get(job_id)
+        job = dict(job) if job is not None else None
+    if job is None:
+        return jsonify({"ok": False, "error": f"Unknown simulation job: {job_id}"}), 404
+    return jsonify(dict(job, ok=True))
+
+
+def irrigation_response(ctl: Controller):
+    """GET: auto-irrigation state, settings, decision latency and recent log.
+    POST {"enabled": bool}: switch the loop on or off for the field."""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        if "enabled" not in data:
+            return jsonify({"ok": False, "error": "No 'enabled' given"}), 400
+        set_setting(field_key(ctl.field, "auto_irrigation"), "1" if data["enabled"] else "0")
+        irrigation_state.pop(ctl.field, None)
+    return jsonify(dict(irrigation_info(ctl), ok=True))
+
+
+@bp.route("/api/irrigation", methods=["GET", "POST"])
+def api_irrigation():
+    field = request.args.get("field", DEFAULT_FIELD)
+    ctl = get_controller(field)
+    if ctl is None:
+        return unknown_field(field)
+    return irrigation_response(ctl)
+
+
+def schedule_response(ctl: Controller):
+    """GET: tariff, current plan (a preview while off) and stats. POST
+    {"enabled": bool} switches the scheduler for the field, {"replan": true}
+    rebuilds the plan now."""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        if "enabled" in data:
+            set_setting(field_key(ctl.field, "scheduler"), "1" if data["enabled"] else "0")
+            schedule_state.pop(ctl.field, None)
+        if data.get("replan") and ctl.field in schedule_state:
+            schedule_state[ctl.field]["plan"] = plan_schedule(ctl)
+    return jsonify(dict(schedule_info(ctl), ok=True))
+
+
+@bp.route("/api/schedule", methods=["GET", "POST"])
+def api_schedule():
+    field = request.args.get("field", DEFAULT_FIELD)
+    ctl = get_controller(field)
+    if ctl is None:
+        return unknown_field(field)
+    return schedule_response(ctl)
+
+
+@bp.route("/api/usage/writer")
+def api_usage_writer():
+    return jsonify(usage_writer_info())
+
+
+@bp.route("/api/serial")
+def api_serial():
+    return jsonify(controllers[DEFAULT_FIELD].link_info())
+
+
+def apply_relay_state(ctl: Controller, device: str, state: bool):
+    ctl.relay_state[device] = state
+    # Track start time when turning ON
+    if state:
+        ctl.relay_start_times[device] = datetime.utcnow().timestamp()
+    # Clear start time when turning OFF (runtime will be logged by ESP32)
+    else:
+        ctl.relay_start_times[device] = None
+
+
+def set_relays(ctl: Controller, states: dict) -> list:
+    """Switch several relays with pipelined commands; relay_state follows the
+    state each acknowledgement confirms."""
+    devices = list(states)
+    results = ctl.send_commands([f"{d.upper()}_{'ON' if states[d] else 'OFF'}" for d in devices])
+    for device, result in zip(devices, results):
+        if result["ok"]:
+            apply_relay_state(ctl, device, result["state"].get(device, bool(states[device])))
+    if any(r["ok"] for r in results):
+        # Push the relay change to stream clients now; ML catches up on the refresh
+        patch_status(ctl.field, relay=dict(ctl.relay_state))
+        request_status_refresh()
+    return results
+
+
+def toggle_response(ctl: Controller):
     data = request.get_json() or {}
     device = data.get("device")
-    state = data.get("state")
+    state = bool(data.get("state"))
     if device not in ("motor", "light"):
         return jsonify({"ok": False, "error": "Invalid device"}), 400
-    cmd = f"{device.upper()}_{ 'ON' if state else 'OFF'}"
-    ok = send_command(cmd)
-    if ok:
-        relay_state[device] = state
-        # Track start time when turning ON
-        if state:
-            relay_start_times[device] = datetime.utcnow().timestamp()
-        # Clear start time when turning OFF (runtime will be logged by ESP32)
-        else:
-            relay_start_times[device] = None
-    return jsonify({"ok": ok, "relay": relay_state})
+    result = set_relays(ctl, {device: state})[0]
+    return jsonify({
+        "ok": result["ok"],
+        "relay": ctl.relay_state,
+        "confirmed": result["acked"],
+        "latency_ms": result["latency_ms"],
+        "attempts": result["attempts"],
+    })
+
+
+def relays_response(ctl: Controller):
+    data = request.get_json() or {}
+    states = {d: bool(data[d]) for d in ("motor", "light") if d in data}
+    if not states:
+        return jsonify({"ok": False, "error": "No devices given"}), 400
+    results = set_relays(ctl, states)
+    return jsonify({
+        "ok": all(r["ok"] for r in results),
+        "relay": ctl.relay_state,
+        "results": dict(zip(states, results)),
+    })
+
+
+@bp.route("/api/toggle", methods=["POST"])
+def api_toggle():
+    return toggle_response(controllers[DEFAULT_FIELD])
+
+
+@bp.route("/api/relays", methods=["POST"])
+def api_relays():
+    """Set several relays in one pipelined round trip: {"motor": true, "light": false}"""
+    return relays_response(controllers[DEFAULT_FIELD])
+
+
+@bp.route("/api/fields")
+def api_fields():
+    fields = []
+    for ctl in list(controllers.values()):
+        fields.append({
+            "id": ctl.field,
+            "name": ctl.name,
+            "default": ctl.field == DEFAULT_FIELD,
+            "crop": ctl.setting("crop", "tomato"),
+            "stage": ctl.setting("stage", "flowering"),
+            "relay": dict(ctl.relay_state),
+            "serial": ctl.link_info(),
+        })
+    return jsonify({"ok": True, "fields": fields})
+
 
+@bp.route("/api/fields/<field>/status")
+def api_field_status(field):
+    if field not in controllers:
+        return unknown_field(field)
+    return status_response(field)
 
-@app.route("/api/rename", methods=["POST"])
+
+@bp.route("/api/fields/<field>/toggle", methods=["POST"])
+def api_field_toggle(field):
+    if field not in controllers:
+        return unknown_field(field)
+    return toggle_response(controllers[field])
+
+
+@bp.route("/api/fields/<field>/relays", methods=["POST"])
+def api_field_relays(field):
+    if field not in controllers:
+        return unknown_field(field)
+    return relays_response(controllers[field])
+
+
+@bp.route("/api/fields/<field>/irrigation", methods=["GET", "POST"])
+def api_field_irrigation(field):
+    if field not in controllers:
+        return unknown_field(field)
+    return irrigation_response(controllers[field])
+
+
+@bp.route("/api/fields/<field>/schedule", methods=["GET", "POST"])
+def api_field_schedule(field):
+    if field not in controllers:
+        return unknown_field(field)
+    return schedule_response(controllers[field])
+
+
+@bp.route("/api/rename", methods=["POST"])
 def api_rename():
     data = request.get_json() or {}
     motor_name = data.get("motor_name")
     light_name = data.get("light_name")
+    names = {}
     if motor_name is not None:
-        set_setting("motor_name", str(motor_name).strip() or "Bore Pump")
+        names["motor_name"] = str(motor_name).strip() or "Bore Pump"
     if light_name is not None:
-        set_setting("light_name", str(light_name).strip() or "Grow Light")
+        names["light_name"] = str(light_name).strip() or "Grow Light"
+    if names:
+        set_settings(names)
     return jsonify({"ok": True})
 
 
-@app.route("/api/debug", methods=["GET"])
+@bp.route("/api/debug", methods=["GET"])
 def api_debug():
     """Debug endpoint to print ESP32 data, model inputs, and outputs to terminal"""
+    field = request.args.get("field", DEFAULT_FIELD)
+    ctl = controllers.get(field)
+    if ctl is None:
+        return unknown_field(field)
+    last_runtimes, relay_state, firmware_log = ctl.last_runtimes, ctl.relay_state, ctl.firmware_log
     
     print("\n" + "="*80)
     print("🔍 SMART FARM DEBUG - DATA FLOW ANALYSIS")
     print("="*80)
     
     # Get current settings
-    crop = get_setting("crop", "tomato")
-    stage = get_setting("stage", "flowering")
+    crop = ctl.setting("crop", "tomato")
+    stage = ctl.setting("stage", "flowering")
     
     print(f"\n📋 CURRENT SETTINGS:")
+    print(f"  Field: {ctl.name} ({field})")
     print(f"  Crop: {crop}")
     print(f"  Stage: {stage}")
     print(f"  Motor Name: {get_setting('motor_name', 'Bore Pump')}")
     print(f"  Light Name: {get_setting('light_name', 'Grow Light')}")
     
     # Get ESP32 data (recent usage and last runtimes)
-    motor_sec, light_sec = get_aggregates(24)
-    recent_usage = get_recent_usage(24)
+    motor_sec, light_sec = get_aggregates(24, ctl)
+    recent_usage = get_recent_usage(24, field)
     
     print(f"\n📡 ESP32 DATA RECEIVED:")
     print(f"  Motor runtime (24h): {motor_sec} seconds ({motor_sec/60:.1f} minutes)")
@@ -622,113 +3226,59 @@ def api_debug():
         for i, record in enumerate(recent_usage[:5]):
             print(f"    {i+1}. {record['time']} - {record['device']}: {record['runtime_sec']}s")
     
-    # Environmental data (currently simulated)
-    temp_c, rainfall_mm = 28.0, 0.0
-    humidity_percent = 60.0
-    light_hours = 12.0
-    
-    print(f"\n🌤️  ENVIRONMENTAL DATA:")
-    print(f"  Temperature: {temp_c}°C")
-    print(f"  Humidity: {humidity_percent}%")
-    print(f"  Rainfall: {rainfall_mm} mm")
-    print(f"  Light hours: {light_hours} hours")
+    # Show last 5 firmware log lines
+    if firmware_log:
+        print(f"  Last 5 firmware log lines:")
+        for line in list(firmware_log)[-5:]:
+            print(f"    {line}")
     
-    # Model inputs for each prediction
-    print(f"\n🧠 ML MODEL INPUTS:")
+    # Environmental data (sensor frames, defaults where none are fresh)
+    environment, sources, soil_probe = field_environment(ctl)
+    temp_c, rainfall_mm = environment["temperature_c"], environment["rainfall_mm"]
+    humidity_percent = environment["humidity_percent"]
+    light_hours = environment["light_hours"]
     
-    # Soil moisture model inputs
-    moisture_inputs = {
-        'temperature_c': temp_c,
-        'humidity_percent': humidity_percent,
-        'rainfall_mm': rainfall_mm,
-        'light_hours': light_hours,
-        'pump_runtime_sec': motor_sec,
-        'crop': crop,
-        'stage': stage
-    }
-    print(f"  🌱 Soil Moisture Model Inputs:")
-    for key, value in moisture_inputs.items():
-        print(f"    {key}: {value}")
-    
-    # Crop stress model inputs
-    stress_inputs = {
-        'temperature_c': temp_c,
-        'humidity_percent': humidity_percent,
-        'rainfall_mm': rainfall_mm,
-        'light_hours': light_hours,
-        'pump_runtime_sec': motor_sec,
-        'soil_moisture': 0.0,  # Will be calculated
-        'crop': crop,
-        'stage': stage
-    }
-    print(f"  🌾 Crop Stress Model Inputs:")
-    for key, value in stress_inputs.items():
-        print(f"    {key}: {value}")
+    print(f"\n🌤️  ENVIRONMENTAL DATA:")
+    print(f"  Temperature: {temp_c}°C ({sources['temperature_c']})")
+    print(f"  Humidity: {humidity_percent}% ({sources['humidity_percent']})")
+    print(f"  Rainfall: {rainfall_mm} mm ({sources['rainfall_mm']})")
+    print(f"  Light hours: {light_hours} hours ({sources['light_hours']})")
+    print(f"  Soil probe: {soil_probe if soil_probe is not None else 'none'}")
     
-    # Water usage model inputs
-    water_inputs = {
+    # Shared pipeline inputs (each model reads its own subset)
+    pipeline_inputs = {
         'temperature_c': temp_c,
         'humidity_percent': humidity_percent,
         'rainfall_mm': rainfall_mm,
         'light_hours': light_hours,
-        'soil_moisture': 0.0,  # Will be calculated
-        'crop': crop,
-        'stage': stage
-    }
-    print(f"  💧 Water Usage Model Inputs:")
-    for key, value in water_inputs.items():
-        print(f"    {key}: {value}")
-    
-    # Power usage model inputs
-    power_inputs = {
-        'temperature_c': temp_c,
-        'humidity_percent': humidity_percent,
-        'light_hours': light_hours,
+        'soil_moisture': np.nan if soil_probe is None else soil_probe,
         'pump_runtime_sec': motor_sec,
         'light_runtime_sec': light_sec,
         'crop': crop,
         'stage': stage
     }
-    print(f"  ⚡ Power Usage Model Inputs:")
-    for key, value in power_inputs.items():
+    print(f"\n🧠 ML PIPELINE INPUTS:")
+    print(f"  Shared inputs:")
+    for key, value in pipeline_inputs.items():
         print(f"    {key}: {value}")
+    print(f"  Columns read by each model:")
+    for model, (_, inputs) in MODEL_INPUTS.items():
+        print(f"    {model}: {', '.join(inputs)}")
     
-    # Execute models and capture outputs
+    # Execute the chained pipeline and capture outputs
     print(f"\n🎯 ML MODEL OUTPUTS:")
     
     try:
-        # Soil moisture prediction
-        moisture_output = ml_predictor.predict_soil_moisture(**moisture_inputs)
+        outputs = predict_pipeline(pipeline_inputs)
+        moisture_output = float(outputs['soil_moisture'][0])
+        stress_output = float(outputs['crop_stress_index'][0])
+        water_output = float(outputs['water_usage'][0])
+        power_output = float(outputs['power_usage'][0])
+        yield_output = float(outputs['yield'][0])
         print(f"  🌱 Soil Moisture: {moisture_output:.4f} (0-1 scale)")
-        
-        # Update stress and water inputs with actual moisture
-        stress_inputs['soil_moisture'] = moisture_output
-        water_inputs['soil_moisture'] = moisture_output
-        
-        # Crop stress prediction
-        stress_output = ml_predictor.predict_crop_stress(**stress_inputs)
         print(f"  🌾 Crop Stress Index: {stress_output:.4f}")
-        
-        # Water usage prediction
-        water_output = ml_predictor.predict_water_usage(**water_inputs)
         print(f"  💧 Water Usage: {water_output:.2f} liters")
-        
-        # Power usage prediction
-        power_output = ml_predictor.predict_power_usage(**power_inputs)
         print(f"  ⚡ Power Usage: {power_output:.4f} kWh")
-        
-        # Yield prediction
-        yield_inputs = {
-            'temperature_c': temp_c,
-            'humidity_percent': humidity_percent,
-            'rainfall_mm': rainfall_mm,
-            'light_hours': light_hours,
-            'soil_moisture': moisture_output,
-            'crop_stress_index': stress_output,
-            'crop': crop,
-            'stage': stage
-        }
-        yield_output = ml_predictor.predict_yield(**yield_inputs)
         print(f"  🌾 Yield Prediction: {yield_output:.2f} units")
         
         print(f"\n✅ All ML models executed successfully!")
@@ -745,8 +3295,8 @@ def api_debug():
     
     # Serial connection status
     print(f"\n🔗 CONNECTION STATUS:")
-    print(f"  Serial Connected: {open_serial()}")
-    print(f"  ESP32 Port: {find_esp32_port() or 'Not found'}")
+    print(f"  Serial Connected: {ctl.connected()}")
+    print(f"  ESP32 Port: {ctl.link['port'] or 'Not found'}")
     
     print("="*80)
     print("🔍 END DEBUG ANALYSIS")
@@ -761,15 +3311,20 @@ def api_debug():
             "light_runtime_24h": light_sec,
             "last_motor_runtime": last_runtimes.get('motor', 0),
             "last_light_runtime": last_runtimes.get('light', 0),
-            "recent_usage_count": len(recent_usage)
+            "recent_usage_count": len(recent_usage),
+            "firmware_log": list(firmware_log)[-5:]
         },
         "environmental": {
             "temperature_c": temp_c,
             "humidity_percent": humidity_percent,
             "rainfall_mm": rainfall_mm,
-            "light_hours": light_hours
+            "light_hours": light_hours,
+            "soil_probe": soil_probe,
+            "source": sources
         },
+        "sensors": ctl.sensors.info(),
         "settings": {
+            "field": field,
             "crop": crop,
             "stage": stage
         },
@@ -781,12 +3336,30 @@ def api_debug():
             "yield_prediction": yield_output if 'yield_output' in locals() else None
         },
         "relay_states": relay_state,
-        "serial_connected": open_serial()
+        "serial_connected": ctl.connected(),
+        "serial": ctl.link_info()
     })
 
 
+def maintenance_thread():
+    """Background: compact raw usage into rollups every few hours."""
+    while True:
+        time.sleep(6 * 3600)
+        try:
+            compact_usage()
+            prune_irrigation_log()
+            prune_sensor_minutes()
+        except Exception as e:
+            print(f"❌ Usage compaction failed: {e}")
+
+
 def keyboard_monitor():
     """Monitor keyboard input for 'q' key to print QR code and URL."""
+    try:
+        import keyboard
+    except Exception as e:
+        print(f"⚠️ Keyboard shortcuts unavailable: {e}")
+        return
     print("💡 Press 'q' to display QR code and URL")
     while True:
         try:
@@ -857,11 +3430,66 @@ def print_network_url(port=5000):
     print(sep + "\n", file=sys.stderr)
 
 
+# --- Application factory ---
+def start_services(interactive: bool = False):
+    """Start the background services: usage writer, one serial reader per
+    field, sensor writer, status engine, auto-irrigation, tariff scheduler,
+    maintenance and model warm-up. farm.db must be open (init_db)."""
+    # Start the batched usage writer; flush whatever is queued on exit
+    start_usage_writer()
+    atexit.register(stop_usage_writer)
+    atexit.register(flush_sensor_readings, final=True)
+    atexit.register(stop_ml_workers)
+    # Models load in the background; /api/status says "loading" meanwhile
+    threading.Thread(target=warm_up_models, name="model-warm-up", daemon=True).start()
+    # One serial reader per field controller; the default field's ESP32 may be
+    # picked once on the console, the readers reconnect from then on
+    start_controllers(interactive=interactive)
+
+    # Move finished sensor minutes to farm.db
+    threading.Thread(target=sensor_writer_thread, name="sensor-writer", daemon=True).start()
+
+    # Start status engine thread
+    threading.Thread(target=status_engine_thread, daemon=True).start()
+
+    # Start the auto-irrigation loop (idle until a field has it switched on)
+    threading.Thread(target=irrigation_thread, name="irrigation", daemon=True).start()
+    # Start the tariff scheduler (idle until a field is scheduled)
+    threading.Thread(target=scheduler_thread, name="scheduler", daemon=True).start()
+
+    # Start storage maintenance thread
+    threading.Thread(target=maintenance_thread, daemon=True).start()
+
+
+def create_app(services: bool = True, interactive: bool = False) -> Flask:
+    """Build the Flask app. farm.db is always opened and migrated and the
+    field controllers registered, so every route works; services=False (tests
+    and tools) starts no background threads and opens no serial ports, and
+    status snapshots are then computed on request."""
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    init_db()
+    if services:
+        start_services(interactive)
+    return flask_app
+
+
 # --- Main ---
 if __name__ == "__main__":
-    init_db()
-    # Start serial reader thread
-    threading.Thread(target=serial_reader_thread, daemon=True).start()
+    args = parse_arguments()
+    if args.list_ports:
+        list_com_ports()
+        sys.exit(0)
+    if args.export_models:
+        sys.exit(0 if export_models() else 1)
+    # Override config with command line arguments
+    if args.port:
+        config["serial"]["com_port"] = args.port
+        config["serial"]["auto_detect"] = False
+        print(f"🔧 Using command-line COM port: {args.port}")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    app = create_app(interactive=sys.stdin.isatty())
     
     # Start keyboard monitor thread
     threading.Thread(target=keyboard_monitor, daemon=True).start()
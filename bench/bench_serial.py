@@ -0,0 +1,130 @@
+"""
+Smart Farm — serial framing benchmark
+Replays an ESP32 serial stream through the LineFramer and through the old
+split-the-whole-buffer loop, at line rate for several baud rates and flat out.
+
+The default stream is synthesized from the log lines and runtime frames that
+hw/esp.ino prints. Pass --capture to replay a real capture instead:
+    python bench/bench_serial.py
+    python bench/bench_serial.py --capture esp32.log --bauds 115200 921600
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from serial_framing import FRAME_JSON, LineFramer, parse_frame  # noqa: E402
+
+# Output of one MOTOR_ON / MOTOR_OFF cycle in hw/esp.ino, plus a firmware
+# line containing "}" ahead of the newline.
+FIRMWARE_LINES = [
+    "📥 Received command: {device}_ON",
+    "🔧 Turning {device} ON",
+    "⚙️ setMotor(true)",
+    "🔌 {device} GPIO 25 = LOW (ON)",
+    "📥 Received command: {device}_OFF",
+    "🔧 Turning {device} OFF",
+    "⚙️ setMotor(false) {{state}} done",
+]
+
+
+def synthetic_stream(n_cycles: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n_cycles):
+        device = rng.choice(["motor", "light"])
+        for line in FIRMWARE_LINES:
+            out.append(line.format(device=device.upper()))
+        out.append(json.dumps({"device": device, "runtime": rng.randint(0, 3600)}, separators=(",", ":")))
+        out.append("🔌 {0} GPIO 26 = HIGH (OFF)".format(device.upper()))
+    return ("\r\n".join(out) + "\r\n").encode()
+
+
+def chunks(stream: bytes, baud: int, tick_s: float = 0.01):
+    """Split the stream the way a UART delivers it: baud/10 bytes per second,
+    read every tick_s (0 = read in 4 KiB blocks)."""
+    size = max(1, int(baud / 10 * tick_s)) if baud else 4096
+    for i in range(0, len(stream), size):
+        yield stream[i:i + size]
+
+
+def frame_new(pieces):
+    framer = LineFramer()
+    frames = runtimes = 0
+    for data in pieces:
+        for line in framer.feed(data):
+            frames += 1
+            kind, payload = parse_frame(line)
+            if kind == FRAME_JSON and "runtime" in payload:
+                runtimes += 1
+    return frames, runtimes
+
+
+def frame_old(pieces):
+    """The reader loop from app.py before the framing engine."""
+    buffer = b""
+    frames = runtimes = 0
+    for data in pieces:
+        buffer += data
+        while b"\n" in buffer or b"}" in buffer:
+            frames += 1
+            line = buffer.split(b"\n")[0].decode("utf-8", errors="ignore").strip()
+            if "}" in line:
+                line = line[: line.index("}") + 1]
+            buffer = buffer[buffer.find(b"\n") + 1:] if b"\n" in buffer else b""
+            if "device" in line and "runtime" in line:
+                try:
+                    json.loads(line)
+                    runtimes += 1
+                except json.JSONDecodeError:
+                    pass
+    return frames, runtimes
+
+
+def run(name, fn, stream, baud):
+    pieces = list(chunks(stream, baud))
+    started = time.perf_counter()
+    frames, runtimes = fn(pieces)
+    cpu = time.perf_counter() - started
+    line_time = len(stream) * 10 / baud if baud else None
+    mbps = len(stream) / cpu / 1e6
+    label = f"{baud} baud" if baud else "bulk"
+    load = f"{cpu / line_time * 100:6.3f}% of line time" if line_time else ""
+    print(f"  {name:<4} {label:<13} {mbps:8.2f} MB/s  {frames:7d} frames  {runtimes:6d} runtimes  {load}")
+    return frames, runtimes
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Smart Farm serial framing benchmark")
+    parser.add_argument("--capture", help="Raw serial capture file to replay")
+    parser.add_argument("--cycles", type=int, default=20000,
+                        help="Relay cycles in the synthetic stream (default: 20000)")
+    parser.add_argument("--bauds", type=int, nargs="+", default=[115200, 921600, 2000000],
+                        help="Baud rates to replay at (default: 115200 921600 2000000)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            stream = f.read()
+    else:
+        stream = synthetic_stream(args.cycles)
+    lines = stream.count(b"\n")
+    print(f"📊 {len(stream) / 1e6:.2f} MB stream, {lines} lines")
+    for baud in args.bauds + [0]:
+        expected = run("new", frame_new, stream, baud)
+        got = run("old", frame_old, stream, baud)
+        if got != expected:
+            print(f"  ⚠️ old loop mis-framed: {got[0]} frames / {got[1]} runtimes, "
+                  f"expected {expected[0]} / {expected[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Smart Farm — startup benchmark
+Measures how long `import app` takes and, for a freshly launched server, the
+time until /api/status first answers and until the ML models are ready.
+
+Stop any running server first (the benchmark binds the configured port):
+    python bench/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_SNIPPET = (
+    "import sys, time; sys.argv = ['app.py']; t = time.perf_counter(); "
+    "import app; print(time.perf_counter() - t)"
+)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Smart Farm startup benchmark")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/status",
+                        help="Status URL to poll (default: http://127.0.0.1:5000/api/status)")
+    parser.add_argument("--runs", "-n", type=int, default=3,
+                        help="Cold starts to measure (default: 3)")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Give up on a start after this many seconds (default: 120)")
+    return parser.parse_args()
+
+
+def time_import() -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def poll(url: str):
+    """Parsed /api/status payload, or None if the server is not answering yet."""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as resp:
+            return json.loads(resp.read())
+    except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+        return None
+
+
+def time_server(url: str, timeout: float) -> tuple:
+    """(seconds to first response, seconds to models ready) for one cold start."""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first = ready = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            payload = poll(url)
+            now = time.perf_counter() - started
+            if payload is not None:
+                first = first or now
+                # Servers without background warm-up only answer once models are loaded
+                if payload.get("models", "ready") == "ready":
+                    ready = now
+                    break
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    if ready is None:
+        raise RuntimeError(f"server not ready after {timeout:.0f} s")
+    return first, ready
+
+
+def main():
+    args = parse_arguments()
+    if poll(args.url) is not None:
+        print(f"❌ Something is already answering on {args.url}; stop it first")
+        sys.exit(1)
+
+    imports, firsts, readies = [], [], []
+    for i in range(args.runs):
+        imports.append(time_import())
+        first, ready = time_server(args.url, args.timeout)
+        firsts.append(first)
+        readies.append(ready)
+        print(f"  run {i + 1}: import {imports[-1]:.2f} s, first response {first:.2f} s, "
+              f"models ready {ready:.2f} s")
+        time.sleep(0.5)  # let the port be released
+
+    print(f"📊 Median over {args.runs} run(s)")
+    print(f"  import app:          {statistics.median(imports):.2f} s")
+    print(f"  first /api/status:   {statistics.median(firsts):.2f} s")
+    print(f"  models ready:        {statistics.median(readies):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
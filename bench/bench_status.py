@@ -0,0 +1,87 @@
+"""
+Smart Farm — /api/status load benchmark
+Hammers a running server from N client threads and reports requests/sec
+and latency percentiles.
+
+Run it against the server before and after a change:
+    python app.py &
+    python bench/bench_status.py --threads 16 --seconds 10
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Smart Farm /api/status benchmark")
+    parser.add_argument("--url", default="http://127.0.0.1:5000",
+                        help="Server base URL (default: http://127.0.0.1:5000)")
+    parser.add_argument("--path", default="/api/status",
+                        help="Endpoint to request (default: /api/status)")
+    parser.add_argument("--threads", "-t", type=int, default=8,
+                        help="Concurrent clients (default: 8)")
+    parser.add_argument("--seconds", "-s", type=float, default=10.0,
+                        help="Measurement duration (default: 10)")
+    parser.add_argument("--etag", action="store_true",
+                        help="Send If-None-Match like a browser revalidating its cache")
+    return parser.parse_args()
+
+
+def client(url, deadline, use_etag, latencies, errors):
+    etag = None
+    while time.perf_counter() < deadline:
+        req = urllib.request.Request(url)
+        if use_etag and etag:
+            req.add_header("If-None-Match", etag)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                resp.read()
+                etag = resp.headers.get("ETag") or etag
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                errors.append(e.code)
+                continue
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def main():
+    args = parse_arguments()
+    url = args.url.rstrip("/") + args.path
+    # Warm-up request so the first snapshot / model load is not measured
+    urllib.request.urlopen(url, timeout=60).read()
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(url, deadline, args.etag, latencies, errors))
+        for _ in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print(f"❌ No successful requests ({len(errors)} errors)")
+        return
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))] * 1000
+    print(f"📊 {url} — {args.threads} clients, {elapsed:.1f} s")
+    print(f"  Requests:  {len(latencies)} ok, {len(errors)} errors")
+    print(f"  Req/sec:   {len(latencies) / elapsed:.1f}")
+    print(f"  Latency:   mean {statistics.mean(latencies) * 1000:.2f} ms, "
+          f"p50 {pct(50):.2f} ms, p99 {pct(99):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Smart Farm — configuration
+config.json next to this file, written with the defaults on first run. Loaded
+once here, so app.py and the tools that share its helpers (farm_model.py,
+simulate.py) all read the same settings; command-line overrides mutate it.
+"""
+
+import json
+import os
+import sys
+
+
+def load_config():
+    """Load configuration from config.json file."""
+    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"⚠️ Config file not found: {config_path}")
+        print("📝 Creating default config file...")
+        create_default_config()
+        return load_config()
+    except json.JSONDecodeError as e:
+        print(f"❌ Error parsing config.json: {e}")
+        sys.exit(1)
+
+
+def create_default_config():
+    """Create default configuration file."""
+    default_config = {
+        "serial": {
+            "com_port": "COM13",
+            "baud_rate": 115200,
+            "timeout": 0.1,
+            "auto_detect": True,
+            "ack": True,
+            "ack_timeout_ms": 500,
+            "retries": 2,
+            "reconnect_min_ms": 250,
+            "reconnect_max_ms": 10000
+        },
+        "fields": [
+            {"id": "main", "name": "Main Field", "crop": "tomato", "stage": "flowering"}
+        ],
+        "devices": {
+            "motor": {
+                "name": "Bore Pump",
+                "gpio": 25,
+                "active_low": True,
+                "flow_rate_l_per_min": 20.0,
+                "power_watt": 750.0
+            },
+            "light": {
+                "name": "Grow Light",
+                "gpio": 26,
+                "active_low": True,
+                "power_watt": 100.0
+            }
+        },
+        "ml": {
+            "ideal_moisture": 0.65,
+            "stage_weights": {
+                "seedling": 1.2,
+                "vegetative": 1.0,
+                "flowering": 1.1,
+                "fruiting": 1.15
+            },
+            "cache": {
+                "max_size": 4096,
+                "quantize": {
+                    "temperature_c": 0.1,
+                    "humidity_percent": 0.5,
+                    "rainfall_mm": 0.1,
+                    "light_hours": 0.1,
+                    "pump_runtime_sec": 1,
+                    "light_runtime_sec": 1,
+                    "soil_moisture": 0.001,
+                    "crop_stress_index": 0.001
+                }
+            },
+            "workers": 0,
+            "timeout_ms": 5000,
+            "flat_model": "model/predictor.flat",
+            "reload": {
+                "watch": True,
+                "poll_ms": 2000,
+                "shadow_batches": 5,
+                "shadow_timeout_ms": 60000,
+                "max_divergence": None
+            }
+        },
+        "database": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout_ms": 5000,
+            "cached_statements": 256,
+            "pool_size": 8,
+            "writer_batch_size": 64,
+            "writer_flush_ms": 250,
+            "writer_queue_max": 10000
+        },
+        "analytics": {
+            "season_days": 120,
+            "raw_retention_days": 180,
+            "forecast_days": 60,
+            "forecast_min_days": 8
+        },
+        "irrigation": {
+            "auto": False,
+            "interval_ms": 5000,
+            "hysteresis": 0.05,
+            "stress_on": 0.6,
+            "min_on_sec": 120,
+            "min_off_sec": 600,
+            "max_on_sec": 1800,
+            "daily_water_liters": None,
+            "daily_energy_kwh": None
+        },
+        "scheduler": {
+            "enabled": False,
+            "tick_ms": 5000,
+            "replan_ms": 300000,
+            "slot_minutes": 60,
+            "step_minutes": 5,
+            "max_pump_minutes": 240,
+            "light_minutes": None,
+            "light_hours": [[18, 24], [0, 6]],
+            "tariff": [["00:00", 0.08], ["06:00", 0.15], ["18:00", 0.30], ["22:00", 0.08]]
+        },
+        "sensors": {
+            "stale_sec": 300,
+            "smoothing_sec": 30,
+            "daylight_lux": 1000,
+            "flush_ms": 5000,
+            "minute_retention_days": 14
+        },
+        "simulation": {
+            "workers": 0,
+            "max_workers": 2,
+            "max_jobs": 4,
+            "chunk_size": 16,
+            "quantize": {
+                "temperature_c": 0.5,
+                "humidity_percent": 2,
+                "rainfall_mm": 0.5,
+                "light_hours": 0.5,
+                "pump_runtime_sec": 60,
+                "light_runtime_sec": 300,
+                "soil_moisture": 0.005,
+                "crop_stress_index": 0.005
+            }
+        },
+        "ui": {
+            "poll_interval_ms": 2000,
+            "status_tick_ms": 1000,
+            "host": "0.0.0.0",
+            "port": 5000
+        }
+    }
+    
+    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    with open(config_path, 'w') as f:
+        json.dump(default_config, f, indent=2)
+    print(f"✅ Default config created: {config_path}")
+
+
+# Command-line overrides are applied to this dict in app.py's __main__
+config = load_config()
@@ -0,0 +1,111 @@
+"""
+Smart Farm — model inputs and units
+Device constants, the model input layout and the chained prediction pipeline,
+shared by app.py (live models) and simulate.py (season replay) so neither has
+to import the other.
+"""
+
+import os
+
+import numpy as np
+
+from farm_config import config
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "model")
+# Memory-mapped export of the tree ensembles (tree_models.py); used instead of
+# the pickled models whenever it is present and up to date
+FLAT_MODEL_PATH = config["ml"].get("flat_model") or None
+if FLAT_MODEL_PATH:
+    FLAT_MODEL_PATH = os.path.join(os.path.dirname(__file__), FLAT_MODEL_PATH)
+
+FLOW_RATE_L_PER_MIN = config["devices"]["motor"]["flow_rate_l_per_min"]
+MOTOR_WATT = config["devices"]["motor"]["power_watt"]
+LIGHT_WATT = config["devices"]["light"]["power_watt"]
+IDEAL_MOISTURE = config["ml"]["ideal_moisture"]
+STAGE_WEIGHTS = config["ml"]["stage_weights"]
+# Per-input rounding applied before scoring; also the prediction cache key
+QUANTIZE_STEPS = config["ml"].get("cache", {}).get("quantize", {})
+
+
+def power_kwh(seconds: float, watt: float) -> float:
+    return seconds * watt / 3600000.0
+
+
+def water_liters(runtime_sec: float) -> float:
+    return runtime_sec / 60.0 * FLOW_RATE_L_PER_MIN
+
+
+def model_stamp() -> dict:
+    """Size and mtime of every file a model version is loaded from."""
+    import tree_models
+    stamp = tree_models.source_stamp(MODEL_PATH) if os.path.isdir(MODEL_PATH) else {}
+    if FLAT_MODEL_PATH and os.path.exists(FLAT_MODEL_PATH):
+        st = os.stat(FLAT_MODEL_PATH)
+        stamp[os.path.basename(FLAT_MODEL_PATH)] = [st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+# --- Batched inference ---
+# SmartFarmPredictor model -> (scalar method, numeric inputs). Every model also
+# takes the categorical crop/stage columns.
+ENV_INPUTS = ("temperature_c", "humidity_percent", "rainfall_mm", "light_hours")
+MODEL_INPUTS = {
+    "soil_moisture": ("predict_soil_moisture", ENV_INPUTS + ("pump_runtime_sec",)),
+    "crop_stress": ("predict_crop_stress", ENV_INPUTS + ("pump_runtime_sec", "soil_moisture")),
+    "water_usage": ("predict_water_usage", ENV_INPUTS + ("soil_moisture",)),
+    "power_usage": ("predict_power_usage", (
+        "temperature_c", "humidity_percent", "light_hours", "pump_runtime_sec", "light_runtime_sec",
+    )),
+    "yield": ("predict_yield", ENV_INPUTS + ("soil_moisture", "crop_stress_index")),
+}
+CATEGORICAL_INPUTS = ("crop", "stage")
+
+
+def as_columns(batch) -> tuple:
+    """Normalize a DataFrame or {column: array-like/scalar} mapping into
+    equal-length NumPy columns. Returns (columns, n_rows)."""
+    if hasattr(batch, "columns"):
+        batch = {c: batch[c].to_numpy() for c in batch.columns}
+    arrays = {k: np.asarray(v) for k, v in batch.items()}
+    n = max((a.shape[0] for a in arrays.values() if a.ndim), default=1)
+    return {k: np.broadcast_to(a, (n,)) for k, a in arrays.items()}, n
+
+
+# (model, output column) in dependency order
+PIPELINE_STAGES = (
+    ("soil_moisture", "soil_moisture"),
+    ("crop_stress", "crop_stress_index"),
+    ("water_usage", "water_usage"),
+    ("power_usage", "power_usage"),
+    ("yield", "yield"),
+)
+PIPELINE_OUTPUTS = tuple(output for _, output in PIPELINE_STAGES)
+
+
+def predict_pipeline(batch, score, outputs=PIPELINE_OUTPUTS) -> dict:
+    """Chained inference: moisture -> stress -> water/power -> yield.
+
+    The batch is normalized once and each stage's output is written back as an
+    input column for the stages after it, so every model runs once per batch.
+    `score(model, columns, n)` runs one stage; only
+    the stages `outputs` depend on are run, and a stage's output column given
+    in the batch is kept where finite. Returns {output: float array}."""
+    needed = set(outputs)
+    for model, output in reversed(PIPELINE_STAGES):
+        if output in needed:
+            needed.update(MODEL_INPUTS[model][1])
+    columns, n = as_columns(batch)
+    columns = dict(columns)
+    for model, output in PIPELINE_STAGES:
+        if output not in needed:
+            continue
+        # A column the batch already has is measured (e.g. a soil probe): it
+        # wins where it is finite and the model only fills the gaps
+        given = columns.get(output)
+        if given is None:
+            columns[output] = score(model, columns, n)
+            continue
+        given = given.astype(float)
+        measured = np.isfinite(given)
+        columns[output] = given if measured.all() else np.where(measured, given, score(model, columns, n))
+    return {name: columns[name] for name in outputs}
@@ -1,14 +1,30 @@
 #include <ArduinoJson.h>
 #include <HardwareSerial.h>
+#include <Wire.h>
+#include <DHT.h>
+#include <BH1750.h>
 
 // Configuration
 #define RELAY_MOTOR  25
 #define RELAY_LIGHT  26
 #define BAUD        115200
 
+// Sensors
+#define DHT_PIN             4      // DHT22 air temperature / humidity
+#define SOIL_PIN            34     // capacitive soil probe (ADC1)
+#define RAIN_PIN            27     // tipping-bucket rain gauge (reed switch to GND)
+#define SENSOR_INTERVAL_MS  1000   // sensor frame period; 100 = 10 Hz
+#define DHT_INTERVAL_MS     2000   // the DHT22 needs 2 s between reads
+#define SOIL_DRY            3200   // probe ADC reading in dry air
+#define SOIL_WET            1300   // probe ADC reading in water
+#define RAIN_MM_PER_TIP     0.2794
+#define HAS_RAIN_GAUGE      1      // 0 if no gauge is fitted (rain_mm is then left out)
+
 // Global variables
 unsigned long motorOnAt = 0;
 unsigned long lightOnAt = 0;
+bool motorOn = false;
+bool lightOn = false;
 
 // Device configuration
 struct DeviceConfig {
@@ -21,6 +37,16 @@ struct DeviceConfig {
 
 DeviceConfig config;
 
+DHT dht(DHT_PIN, DHT22);
+BH1750 lightMeter;
+bool hasLightMeter = false;
+float airTemp = NAN;
+float airHumidity = NAN;
+unsigned long lastSensorAt = 0;
+unsigned long lastDhtAt = 0;
+volatile unsigned long rainTips = 0;
+volatile unsigned long lastTipAt = 0;
+
 void loadConfig() {
   // Default configuration
   config.motor_gpio = RELAY_MOTOR;
@@ -45,6 +71,7 @@ void setMotor(bool on) {
   Serial.print(on ? "true" : "false");
   Serial.println(")");
   
+  motorOn = on;
   if (on) {
     if (motorOnAt == 0) motorOnAt = millis();
     digitalWrite(config.motor_gpio, config.motor_active_low ? LOW : HIGH);
@@ -70,6 +97,7 @@ void setLight(bool on) {
   Serial.print(on ? "true" : "false");
   Serial.println(")");
   
+  lightOn = on;
   if (on) {
     if (lightOnAt == 0) lightOnAt = millis();
     digitalWrite(config.light_gpio, config.light_active_low ? LOW : HIGH);
@@ -90,10 +118,87 @@ void setLight(bool on) {
   }
 }
 
-void processCommand(const char* cmd) {
+void IRAM_ATTR onRainTip() {
+  unsigned long now = millis();
+  if (now - lastTipAt > 50) {  // debounce the reed switch
+    rainTips++;
+    lastTipAt = now;
+  }
+}
+
+// Soil probe as a 0-1 moisture fraction between the dry and wet calibration
+float readSoil() {
+  long sum = 0;
+  for (int i = 0; i < 8; i++) sum += analogRead(SOIL_PIN);
+  float fraction = (float)(SOIL_DRY - sum / 8) / (SOIL_DRY - SOIL_WET);
+  return constrain(fraction, 0.0, 1.0);
+}
+
+void printReading(const char* key, float value, int digits, bool& first) {
+  if (isnan(value)) return;
+  if (!first) Serial.print(",");
+  Serial.print("\"");
+  Serial.print(key);
+  Serial.print("\":");
+  Serial.print(value, digits);
+  first = false;
+}
+
+// Periodic sensor frame; a sensor whose read failed is left out. rain_mm is
+// the rain since the previous frame:
+// {"sensors":{"temp_c":24.6,"rh":71.2,"soil":0.431,"lux":12500.0,"rain_mm":0.00}}
+void sendSensors() {
+  if (millis() - lastDhtAt >= DHT_INTERVAL_MS) {
+    lastDhtAt = millis();
+    airTemp = dht.readTemperature();
+    airHumidity = dht.readHumidity();
+  }
+  float lux = hasLightMeter ? lightMeter.readLightLevel() : NAN;
+  noInterrupts();
+  unsigned long tips = rainTips;
+  rainTips = 0;
+  interrupts();
+
+  bool first = true;
+  Serial.print("{\"sensors\":{");
+  printReading("temp_c", airTemp, 1, first);
+  printReading("rh", airHumidity, 1, first);
+  printReading("soil", readSoil(), 3, first);
+  printReading("lux", lux >= 0 ? lux : NAN, 1, first);
+  if (HAS_RAIN_GAUGE) printReading("rain_mm", tips * RAIN_MM_PER_TIP, 2, first);
+  Serial.println("}}");
+}
+
+// Acknowledge a sequenced command with the resulting relay state:
+// {"ack":7,"cmd":"MOTOR_ON","ok":true,"motor":true,"light":false}
+void sendAck(long seq, const char* cmd, bool ok) {
+  Serial.print("{\"ack\":");
+  Serial.print(seq);
+  Serial.print(",\"cmd\":\"");
+  Serial.print(cmd);
+  Serial.print("\",\"ok\":");
+  Serial.print(ok ? "true" : "false");
+  Serial.print(",\"motor\":");
+  Serial.print(motorOn ? "true" : "false");
+  Serial.print(",\"light\":");
+  Serial.print(lightOn ? "true" : "false");
+  Serial.println("}");
+}
+
+// Commands are "MOTOR_ON" or "MOTOR_ON#<seq>"; only sequenced commands are acked.
+// Relay commands are idempotent, so a resent command with the same seq is safe.
+void processCommand(char* cmd) {
+  long seq = -1;
+  char* hash = strchr(cmd, '#');
+  if (hash) {
+    *hash = '\0';
+    seq = atol(hash + 1);
+  }
+
   Serial.print("📥 Received command: ");
   Serial.println(cmd);
   
+  bool ok = true;
   if (strcmp(cmd, "MOTOR_ON") == 0) {
     Serial.println("🔧 Turning MOTOR ON");
     setMotor(true);
@@ -112,7 +217,10 @@ void processCommand(const char* cmd) {
   }
   else {
     Serial.println("❌ Unknown command");
+    ok = false;
   }
+
+  if (seq >= 0) sendAck(seq, cmd, ok);
 }
 
 void setup() {
@@ -128,6 +236,15 @@ void setup() {
   digitalWrite(config.light_gpio, config.light_active_low ? HIGH : LOW);
   
   Serial.begin(config.baud_rate);
+
+  // Sensors
+  Wire.begin();
+  dht.begin();
+  hasLightMeter = lightMeter.begin(BH1750::CONTINUOUS_HIGH_RES_MODE);
+  if (HAS_RAIN_GAUGE) {
+    pinMode(RAIN_PIN, INPUT_PULLUP);
+    attachInterrupt(digitalPinToInterrupt(RAIN_PIN), onRainTip, FALLING);
+  }
   
   Serial.println("🚀 Smart Farm ESP32 Started");
   Serial.print("⚙️ Motor GPIO: ");
@@ -138,9 +255,12 @@ void setup() {
   Serial.println(config.motor_active_low && config.light_active_low ? "Yes" : "No");
   Serial.print("📡 Baud Rate: ");
   Serial.println(config.baud_rate);
+  Serial.print("🌡️ Sensor frame every ");
+  Serial.print(SENSOR_INTERVAL_MS);
+  Serial.println(hasLightMeter ? " ms" : " ms (no BH1750 found)");
 }
 
-static char serialBuf[32];
+static char serialBuf[48];
 uint8_t serialIdx = 0;
 
 void loop() {
@@ -157,5 +277,9 @@ void loop() {
       serialBuf[serialIdx++] = c;
     }
   }
+  if (millis() - lastSensorAt >= SENSOR_INTERVAL_MS) {
+    lastSensorAt = millis();
+    sendSensors();
+  }
   delay(10);
 }
@@ -0,0 +1,152 @@
+"""
+Smart Farm — ML inference worker
+Runs SmartFarmPredictor in a separate process so scoring never holds the web
+server's GIL. Each worker loads the models once and reloads them only when the
+parent's model generation moves on.
+
+open_predictor() prefers the memory-mapped flat artifact (tree_models.py), so
+every worker shares one read-only copy of the trees.
+"""
+
+import importlib
+import os
+import sys
+import warnings
+import weakref
+
+import numpy as np
+
+predictor = None
+predictor_format = None
+predictor_generation = None
+model_path = None
+flat_path = None
+
+
+def open_predictor(path: str, flat: str = None, fresh: bool = False) -> tuple:
+    """(predictor, format): the flat artifact at `flat` when it exists and is
+    newer than the files in `path`, otherwise SmartFarmPredictor itself.
+    fresh=True re-imports prediction_functions first (hot reload)."""
+    if path not in sys.path:
+        sys.path.append(path)
+    if fresh and "prediction_functions" in sys.modules:
+        importlib.reload(sys.modules["prediction_functions"])
+    if flat and os.path.exists(flat):
+        import tree_models
+        try:
+            return tree_models.load(flat, path), "flat"
+        except tree_models.StaleArtifact as e:
+            print(f"⚠️ {e}; re-export with: python app.py --export-models")
+    from prediction_functions import SmartFarmPredictor
+    return SmartFarmPredictor(path), "pickle"
+
+
+# predictor -> {method name: does an array call match row-by-row calls?}
+array_methods = weakref.WeakKeyDictionary()
+# Rows an array call is checked on at most (first, middle, last, then one per crop/stage)
+PROBE_ROWS = 8
+
+
+def distinct_rows(columns: dict, inputs: tuple, steps: dict) -> tuple:
+    """Snap the numeric `inputs` of a batch to their quantization `steps` and
+    keep each distinct (crop, stage, snapped inputs) scenario once.
+
+    Returns (keys, arguments, inverse): a hashable (crop, stage, *quantized
+    inputs) key per distinct row, the distinct rows as {argument: array} with
+    the snapped values a model is scored on, and for every batch row the index
+    of its distinct row."""
+    n = len(columns["crop"])
+    quantized = np.empty((n, len(inputs) + 2))
+    for j, name in enumerate(inputs):
+        values = np.asarray(columns[name], dtype=float)
+        step = steps.get(name)
+        quantized[:, j] = np.round(values / step) if step else values
+    labels = []
+    for j, name in enumerate(("crop", "stage"), start=len(inputs)):
+        names, codes = np.unique(np.asarray(columns[name]).astype(str), return_inverse=True)
+        quantized[:, j] = codes.ravel()
+        labels.append(names)
+    distinct, inverse = np.unique(quantized, axis=0, return_inverse=True)
+    arguments = {}
+    for j, name in enumerate(inputs):
+        step = steps.get(name)
+        arguments[name] = np.round(distinct[:, j] * step, 9) if step else distinct[:, j]
+    arguments["crop"] = labels[0][distinct[:, -2].astype(int)]
+    arguments["stage"] = labels[1][distinct[:, -1].astype(int)]
+    keys = [(crop, stage) + tuple(row) for crop, stage, row in
+            zip(arguments["crop"].tolist(), arguments["stage"].tolist(), distinct[:, :-2].tolist())]
+    return keys, arguments, inverse.ravel()
+
+
+def probe_rows(columns: dict, n: int) -> list:
+    """Rows to check an array call on: the first, middle and last, then the
+    first row of each distinct crop and stage, so a method that broadcasts
+    oddly or collapses the categorical columns is caught."""
+    rows = [0, n // 2, n - 1]
+    for name in ("crop", "stage"):
+        if name in columns:
+            _, first = np.unique(np.asarray(columns[name]).astype(str), return_index=True)
+            rows.extend(first.tolist())
+    return list(dict.fromkeys(rows))[:PROBE_ROWS]
+
+
+def call_rows(model, method_name: str, columns: dict, n: int) -> np.ndarray:
+    """Score n rows given as {argument: array} with one method of `model`.
+
+    A method that accepts array arguments is called once for the whole batch.
+    Whether it does is settled on its first batch of two or more rows by
+    comparing the array result with row-by-row calls on probe_rows(), and kept
+    per model object. Otherwise the method is called row by row."""
+    method = getattr(model, method_name)
+    values = {k: np.asarray(v).tolist() for k, v in columns.items()}
+    verdicts = array_methods.setdefault(model, {})
+    if n > 1 and verdicts.get(method_name) is not False:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                out = np.asarray(method(**columns), dtype=float)
+        except Exception:
+            out = None
+        if out is None or out.shape != (n,):
+            verdicts[method_name] = False
+        else:
+            if method_name not in verdicts:
+                probe = probe_rows(columns, n)
+                expected = [float(method(**{k: v[i] for k, v in values.items()})) for i in probe]
+                verdicts[method_name] = bool(np.allclose(out[probe], expected, rtol=1e-9, atol=0.0, equal_nan=True))
+            if verdicts[method_name]:
+                return out
+    return np.fromiter((float(method(**{k: v[i] for k, v in values.items()})) for i in range(n)),
+                       dtype=float, count=n)
+
+
+def init_worker(path: str, generation: int, flat: str = None):
+    """ProcessPoolExecutor initializer: load the models once per worker."""
+    global model_path, flat_path
+    warnings.filterwarnings("ignore", category=UserWarning, module="sklearn.utils.validation")
+    model_path = path
+    flat_path = flat
+    load(generation)
+
+
+def load(generation: int):
+    global predictor, predictor_format, predictor_generation
+    predictor, predictor_format = open_predictor(model_path, flat_path)
+    predictor_generation = generation
+
+
+def score(generation: int, method_name: str, columns: dict, n: int) -> list:
+    """Score n rows given as {argument: array} with one predictor method."""
+    if generation != predictor_generation:
+        load(generation)
+    return call_rows(predictor, method_name, columns, n).tolist()
+
+
+def ping() -> int:
+    """Round trip used to warm up a worker; returns its pid."""
+    return os.getpid()
+
+
+def model_format() -> str:
+    """"flat" or "pickle": how this worker loaded the predictor."""
+    return predictor_format
@@ -0,0 +1,145 @@
+"""
+Smart Farm — tariff-aware pump/light planning
+Places the next 24 h of pump and light runtime into time-of-use tariff slots
+at the lowest energy cost.
+
+The pump has cumulative deadlines: by the end of every slot the runtime still
+inside the trailing 24 h must reach what the soil model needs, and runtime
+from before now keeps ageing out of that window, so the requirement grows
+slot by slot. The light only has a daily total and the hours it may run.
+Both are covered greedily from the cheapest slot open by each deadline; with
+nested deadlines and a linear cost that is optimal, and a plan is a few
+hundred heap operations.
+"""
+
+import heapq
+from datetime import datetime, timedelta
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_tariff(table) -> list:
+    """[["HH:MM", price per kWh], ...] -> [(minute of day, price)] sorted; each
+    price holds until the next start, wrapping past midnight."""
+    if not table:
+        raise ValueError("tariff table is empty")
+    periods = []
+    for start, price in table:
+        hours, _, minutes = str(start).partition(":")
+        minute = int(hours) * 60 + int(minutes or 0)
+        if not 0 <= minute < MINUTES_PER_DAY:
+            raise ValueError(f"tariff start out of range: {start}")
+        periods.append((minute, float(price)))
+    return sorted(periods)
+
+
+def minute_prices(tariff: list) -> list:
+    """Price for every minute of the day."""
+    prices = [tariff[-1][1]] * MINUTES_PER_DAY  # before the first start: the last period wraps
+    for i, (start, price) in enumerate(tariff):
+        end = tariff[i + 1][0] if i + 1 < len(tariff) else MINUTES_PER_DAY
+        prices[start:end] = [price] * (end - start)
+    return prices
+
+
+def build_slots(now: datetime, tariff: list, slot_minutes: int = 60, hours: int = 24) -> list:
+    """Slots covering [now, now + hours): the first runs to the next slot
+    boundary, the rest are slot_minutes long. Each has its mean price."""
+    prices = minute_prices(tariff)
+    end = now + timedelta(hours=hours)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    boundary = midnight + timedelta(minutes=((now - midnight) // timedelta(minutes=slot_minutes) + 1) * slot_minutes)
+    slots, start = [], now
+    while start < end:
+        stop = min(boundary, end)
+        minutes = (stop - start).total_seconds() / 60
+        first = start.hour * 60 + start.minute
+        covered = [prices[(first + m) % MINUTES_PER_DAY] for m in range(max(1, round(minutes)))]
+        slots.append({"start": start, "end": stop, "minutes": minutes, "price": sum(covered) / len(covered)})
+        start, boundary = stop, boundary + timedelta(minutes=slot_minutes)
+    return slots
+
+
+def cover(slots: list, deadlines: list, step: float = 5.0, min_run: float = 0.0) -> tuple:
+    """Minutes per slot such that the running total reaches deadlines[i] by the
+    end of slot i, taking the cheapest open slot first. A slot is used for at
+    least min_run minutes (slots shorter than that are skipped) and in
+    multiples of step. Returns (allocation,
+    shortfall minutes at the worst deadline)."""
+    alloc = [0.0] * len(slots)
+    heap = []
+    total, shortfall = 0.0, 0.0
+    for i, slot in enumerate(slots):
+        heapq.heappush(heap, (slot["price"], i))
+        need = deadlines[i] - total
+        while need > 1e-9 and heap:
+            _, j = heap[0]
+            room = slots[j]["minutes"] - alloc[j]
+            if alloc[j] == 0 and room < min_run - 1e-9:
+                heapq.heappop(heap)  # too short for a minimum run
+                continue
+            take = min(room, max(step * -(-need // step), min_run if alloc[j] == 0 else 0.0))
+            alloc[j] += take
+            total += take
+            need -= take
+            if slots[j]["minutes"] - alloc[j] <= 1e-9:
+                heapq.heappop(heap)
+        shortfall = max(shortfall, need)
+    return alloc, shortfall
+
+
+def just_in_time(slots: list, deadlines: list) -> list:
+    """Baseline: each deadline met in its own slot, without looking at prices
+    (what a run-when-needed loop does)."""
+    alloc, total = [0.0] * len(slots), 0.0
+    for i, slot in enumerate(slots):
+        take = min(slot["minutes"], max(0.0, deadlines[i] - total))
+        alloc[i] = take
+        total += take
+    return alloc
+
+
+def trim(slots: list, alloc: list, limit: float, step: float = 0.0, min_run: float = 0.0) -> list:
+    """Drop minutes from the most expensive (then latest) slots until the
+    total is at most limit. Cuts are whole steps, and a slot that would be
+    left with less than min_run minutes is dropped entirely."""
+    alloc = list(alloc)
+    excess = sum(alloc) - limit
+    for i in sorted(range(len(slots)), key=lambda i: (-slots[i]["price"], -i)):
+        if excess <= 1e-9:
+            break
+        cut = step * -(-(excess - 1e-9) // step) if step else excess
+        cut = min(alloc[i], cut)
+        if 0 < alloc[i] - cut < min_run - 1e-9:
+            cut = alloc[i]
+        alloc[i] -= cut
+        excess -= cut
+    return alloc
+
+
+def allowed(slot: dict, ranges: list) -> bool:
+    """Is the slot's start hour inside any [from, to) hour range (may wrap midnight)?"""
+    hour = slot["start"].hour + slot["start"].minute / 60
+    for lo, hi in ranges:
+        if (lo <= hour < hi) if lo <= hi else (hour >= lo or hour < hi):
+            return True
+    return False
+
+
+def windows(slots: list, alloc: list) -> list:
+    """[(start, end)] runs: each slot's minutes from its start, with runs that
+    touch merged."""
+    runs = []
+    for slot, minutes in zip(slots, alloc):
+        if minutes <= 1e-9:
+            continue
+        start, end = slot["start"], slot["start"] + timedelta(minutes=minutes)
+        if runs and runs[-1][1] >= start:
+            runs[-1] = (runs[-1][0], max(runs[-1][1], end))
+        else:
+            runs.append((start, end))
+    return runs
+
+
+def cost(slots: list, alloc: list, watt: float) -> float:
+    return sum(slot["price"] * minutes / 60 * watt / 1000 for slot, minutes in zip(slots, alloc))
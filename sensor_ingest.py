@@ -0,0 +1,165 @@
+"""
+Smart Farm — sensor ingestion
+Periodic ESP32 sensor frames (air temperature, humidity, soil probe, light,
+rain gauge) downsampled into one-minute buckets per field.
+
+Frames can arrive at tens of Hz per controller, so add() only folds a reading
+into the open bucket of its series and into an exponentially smoothed latest
+value; it never touches the database. Finished minutes (samples, mean, min,
+max) are collected by the writer thread with take_finished(). The last 24 h of
+minutes also give the daily inputs the models want: hours of daylight (minute
+mean above a lux threshold) and rainfall.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+# Frame key -> series name (the pipeline input it feeds, where there is one)
+SENSOR_KEYS = {
+    "temp_c": "temperature_c",
+    "rh": "humidity_percent",
+    "soil": "soil_moisture",
+    "lux": "lux",
+    "rain_mm": "rain_mm",
+}
+SENSORS = tuple(SENSOR_KEYS.values())
+# Plausible readings; anything outside (unplugged probe, bus error) is dropped
+SENSOR_RANGES = {
+    "temperature_c": (-40.0, 85.0),
+    "humidity_percent": (0.0, 100.0),
+    "soil_moisture": (0.0, 1.0),
+    "lux": (0.0, 200000.0),
+    "rain_mm": (0.0, 500.0),
+}
+BUCKET_SEC = 60
+DAY_SEC = 24 * 3600
+# Share of the day's minutes that must be logged before daily values are trusted
+DAY_COVERAGE = 0.9
+
+
+class SensorLog:
+    """Minute buckets, smoothed latest values and a 24 h daily window for one
+    field. add() is O(readings in the frame); everything is under one lock
+    shared by the serial reader, the writer and the status engine."""
+
+    def __init__(self, smoothing_sec: float = 30.0, daylight_lux: float = 1000.0):
+        self.smoothing_sec = smoothing_sec
+        self.daylight_lux = daylight_lux
+        self.open = {}       # series -> [bucket, samples, sum, min, max]
+        self.finished = []   # (bucket, series, samples, mean, min, max) not yet taken
+        self.latest = {}     # series -> (ts, raw, smoothed)
+        # series -> [deque of (bucket, value), running sum]: daylight minutes, rain
+        self.day = {"lux": [deque(), 0.0], "rain_mm": [deque(), 0.0]}
+        self.stats = {"frames": 0, "readings": 0, "rejected": 0, "buckets": 0}
+        self.lock = threading.Lock()
+
+    # --- Ingest ---
+    def add(self, values: dict, ts: float = None) -> int:
+        """Fold one frame {frame key: value} in; returns the readings accepted."""
+        ts = time.time() if ts is None else ts
+        bucket_start = int(ts) // BUCKET_SEC * BUCKET_SEC
+        accepted = 0
+        with self.lock:
+            for key, raw in values.items():
+                series = SENSOR_KEYS.get(key)
+                if series is None:
+                    continue
+                try:
+                    value = float(raw)
+                except (TypeError, ValueError):
+                    continue
+                low, high = SENSOR_RANGES[series]
+                if not low <= value <= high:  # NaN fails too
+                    continue
+                bucket = self.open.get(series)
+                if bucket is None or bucket[0] != bucket_start:
+                    if bucket is not None:
+                        self._close(series, bucket)
+                    bucket = self.open[series] = [bucket_start, 0, 0.0, value, value]
+                bucket[1] += 1
+                bucket[2] += value
+                if value < bucket[3]:
+                    bucket[3] = value
+                elif value > bucket[4]:
+                    bucket[4] = value
+                self.latest[series] = (ts, value, self._smooth(series, ts, value))
+                accepted += 1
+            self.stats["frames"] += 1
+            self.stats["readings"] += accepted
+            self.stats["rejected"] += len(values) - accepted
+        return accepted
+
+    def _smooth(self, series: str, ts: float, value: float) -> float:
+        """Time-aware EMA with a smoothing_sec time constant, so the result
+        does not depend on the frame rate. A long gap restarts it."""
+        last = self.latest.get(series)
+        if last is None or self.smoothing_sec <= 0 or not 0 <= ts - last[0] < 4 * self.smoothing_sec:
+            return value
+        alpha = 1.0 - math.exp(-(ts - last[0]) / self.smoothing_sec)
+        return last[2] + alpha * (value - last[2])
+
+    def _close(self, series: str, bucket: list):
+        start, samples, total, low, high = bucket
+        self.finished.append((start, series, samples, total / samples, low, high))
+        self.stats["buckets"] += 1
+        self._remember(start, series, samples, total / samples)
+
+    def _remember(self, start: int, series: str, samples: int, mean: float):
+        window = self.day.get(series)
+        if window is None:
+            return
+        value = float(mean >= self.daylight_lux) if series == "lux" else mean * samples
+        window[0].append((start, value))
+        window[1] += value
+
+    def take_finished(self, now: float = None) -> list:
+        """Close the buckets before the current minute and hand over every
+        finished (bucket, series, samples, mean, min, max) row."""
+        current = int(time.time() if now is None else now) // BUCKET_SEC * BUCKET_SEC
+        with self.lock:
+            for series, bucket in list(self.open.items()):
+                if bucket[0] < current:
+                    self._close(series, bucket)
+                    del self.open[series]
+            rows, self.finished = self.finished, []
+        return rows
+
+    def load(self, rows):
+        """Restore the daily window from logged (bucket, series, samples, mean) rows."""
+        with self.lock:
+            for window in self.day.values():
+                window[0].clear()
+                window[1] = 0.0
+            for start, series, samples, mean in sorted(rows):
+                self._remember(start, series, samples, mean)
+
+    # --- Readout ---
+    def values(self, now: float = None, max_age: float = 300.0) -> dict:
+        """Smoothed latest value per series reported within max_age seconds."""
+        now = time.time() if now is None else now
+        with self.lock:
+            return {series: smoothed for series, (ts, _, smoothed) in self.latest.items()
+                    if now - ts <= max_age}
+
+    def daily(self, now: float = None) -> dict:
+        """{"light_hours", "rainfall_mm"} over the last 24 h of finished
+        minutes; None while fewer than DAY_COVERAGE of them are logged."""
+        since = int(time.time() if now is None else now) - DAY_SEC
+        out = {}
+        with self.lock:
+            for series, name, scale in (("lux", "light_hours", 1 / 60), ("rain_mm", "rainfall_mm", 1.0)):
+                window = self.day[series]
+                while window[0] and window[0][0][0] < since:
+                    window[1] -= window[0].popleft()[1]
+                covered = len(window[0]) >= DAY_COVERAGE * DAY_SEC / BUCKET_SEC
+                out[name] = max(0.0, window[1] * scale) if covered else None
+        return out
+
+    def info(self, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        with self.lock:
+            latest = {series: {"value": round(raw, 3), "smoothed": round(smoothed, 3), "age_sec": round(now - ts, 1)}
+                      for series, (ts, raw, smoothed) in self.latest.items()}
+            return dict(self.stats, latest=latest, open_buckets=len(self.open), pending=len(self.finished))
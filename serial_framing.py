@@ -0,0 +1,69 @@
+"""
+Smart Farm — ESP32 serial framing
+Newline-delimited frame extraction and JSON / firmware-log classification.
+"""
+
+import json
+
+FRAME_JSON = "json"
+FRAME_LOG = "log"
+
+
+class LineFramer:
+    """Incremental newline framer for the ESP32 byte stream.
+
+    Bytes are appended to one bytearray and only the newly arrived bytes are
+    scanned for b"\\n", so framing costs O(new bytes) no matter how much is
+    buffered. Consumed bytes are released by compacting the buffer once the
+    read offset passes half of it. A line longer than max_line without a
+    newline (noise, wrong baud rate) is discarded instead of growing forever.
+    """
+
+    def __init__(self, max_line: int = 4096):
+        self.buf = bytearray()
+        self.start = 0  # first byte of the pending (incomplete) line
+        self.scan = 0  # first byte not yet searched for a newline
+        self.max_line = max_line
+        self.overflows = 0
+
+    def feed(self, data) -> list:
+        """Add received bytes; return the complete lines (without b"\\n")."""
+        buf = self.buf
+        buf.extend(data)
+        frames = []
+        view = memoryview(buf)
+        try:
+            while True:
+                nl = buf.find(b"\n", self.scan)
+                if nl < 0:
+                    break
+                frames.append(bytes(view[self.start:nl]))
+                self.start = self.scan = nl + 1
+        finally:
+            view.release()
+        self.scan = len(buf)
+        if self.scan - self.start > self.max_line:
+            self.overflows += 1
+            self.start = self.scan
+        if self.start and self.start * 2 >= len(buf):
+            del buf[:self.start]
+            self.scan -= self.start
+            self.start = 0
+        return frames
+
+    def pending(self) -> int:
+        return len(self.buf) - self.start
+
+
+def parse_frame(line: bytes) -> tuple:
+    """Classify one line: (FRAME_JSON, dict) for a JSON object frame,
+    otherwise (FRAME_LOG, text) for firmware log output."""
+    text = line.strip()
+    if text.startswith(b"{") and text.endswith(b"}"):
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                return FRAME_JSON, data
+        except ValueError:
+            pass
+    return FRAME_LOG, text.decode("utf-8", errors="replace")
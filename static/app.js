@@ -1,5 +1,9 @@
 (function () {
   const POLL_MS = 2000;
+  const STREAM_URL = "/api/stream";
+
+  let current = null;
+  let pollTimer = null;
 
   const el = (id) => document.getElementById(id);
 
@@ -145,6 +149,7 @@
     fetch("/api/status")
       .then((r) => r.json())
       .then((d) => {
+        current = d;
         setLoading(false);
         applyStatus(d);
       })
@@ -154,6 +159,39 @@
       });
   }
 
+  function startPolling() {
+    if (pollTimer) return;
+    fetchStatus();
+    pollTimer = setInterval(fetchStatus, POLL_MS);
+  }
+
+  function stopPolling() {
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+
+  // Status is pushed over server-sent events; polling only covers gaps while
+  // the stream is down (EventSource reconnects on its own).
+  function connectStream() {
+    if (!window.EventSource) {
+      startPolling();
+      return;
+    }
+    const source = new EventSource(STREAM_URL);
+    source.addEventListener("status", (e) => {
+      stopPolling();
+      current = JSON.parse(e.data);
+      setLoading(false);
+      applyStatus(current);
+    });
+    source.addEventListener("delta", (e) => {
+      if (!current) return;
+      Object.assign(current, JSON.parse(e.data));
+      applyStatus(current);
+    });
+    source.onerror = () => startPolling();
+  }
+
   function toggle(device, state) {
     fetch("/api/toggle", {
       method: "POST",
@@ -196,6 +234,5 @@
 
   setLoading(true);
   setConnection(false);
-  fetchStatus();
-  setInterval(fetchStatus, POLL_MS);
+  connectStream();
 })();
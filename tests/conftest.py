@@ -0,0 +1,23 @@
+import os
+import queue
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def farm(tmp_path, monkeypatch):
+    """app with a fresh farm.db in tmp_path, its own connection pool, settings
+    cache and controllers; no services are started."""
+    import app
+    monkeypatch.setattr(app, "DB_PATH", str(tmp_path / "farm.db"))
+    monkeypatch.setattr(app, "db_pool", queue.LifoQueue())
+    monkeypatch.setattr(app, "settings_conn", None)
+    monkeypatch.setattr(app, "controllers", {})
+    app.init_db()
+    yield app
+    app.settings_conn.close()
+    while not app.db_pool.empty():
+        app.db_pool.get_nowait().close()
@@ -0,0 +1,93 @@
+import threading
+
+from app import CommandChannel
+
+
+class FakeLink:
+    """write() callable recording frames; acks the attempts listed in ack_on
+    (1 = first transmission) straight away."""
+
+    def __init__(self, ack_on=(1,)):
+        self.ack_on = ack_on
+        self.frames = []
+        self.channel = None
+
+    def write(self, data: bytes):
+        cmd, _, seq = data.decode().strip().partition("#")
+        self.frames.append((cmd, int(seq)))
+        attempt = sum(1 for frame in self.frames if frame[1] == int(seq))
+        if attempt in self.ack_on:
+            self.channel.resolve({"ack": int(seq), "ok": True, "motor": cmd == "MOTOR_ON"})
+
+
+def channel_for(link, timeout=0.05, retries=2):
+    link.channel = CommandChannel(link.write, timeout, retries)
+    return link.channel
+
+
+def test_commands_get_consecutive_seqs():
+    link = FakeLink()
+    channel = channel_for(link)
+    results = channel.send_many(["MOTOR_ON", "LIGHT_OFF"])
+    assert link.frames == [("MOTOR_ON", 1), ("LIGHT_OFF", 2)]
+    assert [r["seq"] for r in results] == [1, 2]
+    assert results[0] == dict(results[0], ok=True, acked=True, attempts=1, state={"motor": True})
+    assert channel.send("MOTOR_OFF")["seq"] == 3
+    assert channel.pending == {}
+
+
+def test_seq_wraps_around():
+    link = FakeLink()
+    channel = channel_for(link)
+    channel.next_seq = 1000000
+    assert [r["seq"] for r in channel.send_many(["MOTOR_ON", "MOTOR_OFF"])] == [1000000, 1]
+
+
+def test_unacked_command_is_resent_with_the_same_seq():
+    link = FakeLink(ack_on=(2,))
+    result = channel_for(link).send("MOTOR_ON")
+    assert link.frames == [("MOTOR_ON", 1), ("MOTOR_ON", 1)]
+    assert result["ok"] and result["attempts"] == 2
+
+
+def test_gives_up_after_retries_and_ignores_late_acks():
+    link = FakeLink(ack_on=())
+    channel = channel_for(link, retries=2)
+    result = channel.send("MOTOR_ON")
+    assert link.frames == [("MOTOR_ON", 1)] * 3
+    assert result == dict(result, ok=False, acked=False, attempts=3, state={})
+    assert channel.pending == {}
+    assert channel.resolve({"ack": 1, "ok": True}) is False
+
+
+def test_malformed_and_unknown_acks_are_ignored():
+    channel = channel_for(FakeLink())
+    assert channel.resolve({"ack": "x"}) is False
+    assert channel.resolve({"ok": True}) is False
+    assert channel.resolve({"ack": 42}) is False
+
+
+def test_pipelined_commands_share_one_round_trip():
+    link = FakeLink(ack_on=())
+    channel = channel_for(link, timeout=2.0)
+    written = threading.Event()
+    write = link.write
+
+    def record(data):
+        write(data)
+        if len(link.frames) == 3:
+            written.set()
+
+    channel.write = record
+
+    def firmware():
+        # Answers only once every command is on the wire, in reverse order
+        written.wait(5)
+        for _, seq in reversed(link.frames):
+            channel.resolve({"ack": seq, "ok": True})
+
+    threading.Thread(target=firmware).start()
+    results = channel.send_many(["MOTOR_ON", "LIGHT_ON", "MOTOR_OFF"])
+    assert [r["ok"] for r in results] == [True, True, True]
+    assert [r["attempts"] for r in results] == [1, 1, 1]
+    assert [seq for _, seq in link.frames] == [1, 2, 3]
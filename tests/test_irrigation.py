@@ -0,0 +1,54 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    for name, value in (("IRRIGATION_HYSTERESIS", 0.1), ("IRRIGATION_STRESS_ON", 0.6),
+                        ("IRRIGATION_MIN_ON_SEC", 120), ("IRRIGATION_MIN_OFF_SEC", 600),
+                        ("IRRIGATION_MAX_ON_SEC", 1800), ("IRRIGATION_WATER_BUDGET", 1000.0),
+                        ("IRRIGATION_ENERGY_BUDGET", None)):
+        monkeypatch.setattr(app, name, value)
+    low, high = app.irrigation_band("flowering")
+    assert high - low == pytest.approx(0.1)
+
+    def decide(motor_on, since_change, moisture, csi=0.0, water=0.0):
+        return app.irrigation_decision(motor_on, since_change, moisture, csi, "flowering", water, 0.0)
+
+    decide.low, decide.high = low, high
+    return decide
+
+
+def test_hysteresis_band(loop):
+    mid = (loop.low + loop.high) / 2
+    assert loop(False, 3600, loop.low + 0.01) == ("hold", "moisture ok")
+    assert loop(False, 3600, loop.low) == ("on", "dry soil")
+    # Inside the band a running pump keeps going and a stopped one stays off
+    assert loop(True, 600, mid) == ("hold", "irrigating")
+    assert loop(False, 3600, mid) == ("hold", "moisture ok")
+    assert loop(True, 600, loop.high) == ("off", "moisture at target")
+
+
+def test_stress_starts_the_pump_below_the_top_of_the_band(loop):
+    stressed = 0.6 / app.STAGE_WEIGHTS["flowering"] + 0.01
+    assert loop(False, 3600, loop.high - 0.01, csi=stressed) == ("on", "crop stress")
+    assert loop(False, 3600, loop.high, csi=stressed) == ("hold", "moisture ok")
+
+
+def test_minimum_on_and_off_times(loop):
+    assert loop(True, 60, loop.high + 0.1) == ("hold", "min on time")
+    assert loop(True, 120, loop.high + 0.1) == ("off", "moisture at target")
+    assert loop(False, 300, loop.low - 0.1) == ("hold", "min off time")
+    assert loop(False, 600, loop.low - 0.1) == ("on", "dry soil")
+
+
+def test_limits_stop_the_pump_regardless_of_the_prediction(loop):
+    assert loop(True, 1800, loop.low - 0.1) == ("off", "max run time")
+    assert loop(True, 60, loop.low - 0.1, water=1000.0) == ("off", "water budget reached")
+    assert loop(False, 3600, loop.low - 0.1, water=1000.0) == ("hold", "water budget reached")
+
+
+def test_no_prediction_holds(loop):
+    assert loop(False, 3600, None) == ("hold", "no prediction")
+    assert loop(True, 600, None) == ("hold", "no prediction")
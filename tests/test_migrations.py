@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "farm.db")
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def v1_database(conn, rows):
+    app.migrate_v1(conn)
+    conn.executemany("INSERT INTO usage (time, device, runtime_sec) VALUES (?, ?, ?)", rows)
+    conn.execute("INSERT INTO settings (key, value) VALUES ('crop', 'wheat')")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+
+
+def test_fresh_database_reaches_current_schema(conn):
+    app.migrate_db(conn)
+    assert version(conn) == app.SCHEMA_VERSION
+    assert {"usage", "settings"} <= tables(conn)
+
+
+def test_migrate_is_idempotent(conn):
+    app.migrate_db(conn)
+    app.migrate_db(conn)
+    assert version(conn) == app.SCHEMA_VERSION
+
+
+def test_v1_timestamps_become_epoch_seconds(conn):
+    v1_database(conn, [
+        ("2026-01-01 10:30:00", "motor", 120),
+        ("2026-01-01 10:45:00", "motor", 60),
+        ("2026-01-02 08:00:00", "light", None),
+        ("not a time", "motor", 30),
+        ("2026-01-03 08:00:00", None, 30),
+    ])
+    app.migrate_db(conn)
+    rows = [tuple(row) for row in conn.execute("SELECT ts, device, runtime_sec FROM usage ORDER BY ts")]
+    assert rows == [(1767263400, "motor", 120), (1767264300, "motor", 60), (1767340800, "light", 0)]
+    assert conn.execute("SELECT value FROM settings WHERE key = 'crop'").fetchone()[0] == "wheat"
+
+
+def test_failed_migration_rolls_back(conn, monkeypatch):
+    def broken(c):
+        c.execute("CREATE TABLE half_done (x)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(app, "MIGRATIONS", app.MIGRATIONS[:1] + [broken])
+    monkeypatch.setattr(app, "SCHEMA_VERSION", 2)
+    with pytest.raises(RuntimeError):
+        app.migrate_db(conn)
+    assert version(conn) == 1
+    assert "half_done" not in tables(conn)
+
+
+def test_rollups_are_back_filled(conn):
+    v1_database(conn, [("2026-01-01 10:30:00", "motor", 120), ("2026-01-01 10:45:00", "motor", 60),
+                       ("2026-01-01 12:00:00", "light", 3600)])
+    app.migrate_db(conn)
+    assert {"usage_hourly", "usage_daily"} <= tables(conn)
+    hourly = [tuple(row) for row in conn.execute(
+        "SELECT device, bucket, runtime_sec, events FROM usage_hourly ORDER BY device")]
+    assert hourly == [("light", 1767268800, 3600, 1), ("motor", 1767261600, 180, 2)]
+    daily = conn.execute("SELECT water_liters, power_kwh FROM usage_daily WHERE device = 'motor'").fetchone()
+    assert daily["water_liters"] == pytest.approx(app.water_liters(180))
+    assert daily["power_kwh"] == pytest.approx(app.power_kwh(180, app.MOTOR_WATT))
+
+
+def test_existing_rows_belong_to_the_default_field(conn):
+    v1_database(conn, [("2026-01-01 10:30:00", "motor", 120)])
+    app.migrate_db(conn)
+    assert [row["id"] for row in conn.execute("SELECT id FROM fields")] == [app.DEFAULT_FIELD]
+    assert conn.execute("SELECT field FROM usage").fetchone()[0] == app.DEFAULT_FIELD
+    for table in ("usage_hourly", "usage_daily"):
+        assert {row[0] for row in conn.execute(f"SELECT field FROM {table}")} == {app.DEFAULT_FIELD}
+
+
+def test_settings_writes_bump_the_revision(conn):
+    app.migrate_db(conn)
+
+    def revision():
+        return conn.execute("SELECT revision FROM settings_revision").fetchone()[0]
+
+    start = revision()
+    conn.execute("INSERT INTO settings (key, value) VALUES ('crop', 'rice')")
+    conn.execute("UPDATE settings SET value = 'maize' WHERE key = 'crop'")
+    conn.execute("DELETE FROM settings WHERE key = 'crop'")
+    conn.commit()
+    assert revision() == start + 3
+    conn.execute("INSERT INTO usage (ts, device, runtime_sec) VALUES (0, 'motor', 5)")
+    conn.commit()
+    assert revision() == start + 3
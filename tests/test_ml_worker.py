@@ -0,0 +1,47 @@
+import numpy as np
+
+import ml_worker
+
+INPUTS = ("temperature_c", "pump_runtime_sec")
+STEPS = {"temperature_c": 0.5}
+
+
+def columns(temperatures, runtimes, crops, stages):
+    return {"temperature_c": np.array(temperatures), "pump_runtime_sec": np.array(runtimes),
+            "crop": np.array(crops, dtype=object), "stage": np.array(stages, dtype=object)}
+
+
+def test_distinct_rows_snaps_and_deduplicates():
+    batch = columns([25.1, 24.9, 25.2, 25.1], [60, 60, 60, 60],
+                    ["tomato", "tomato", "tomato", "rice"], ["flowering"] * 4)
+    keys, arguments, inverse = ml_worker.distinct_rows(batch, INPUTS, STEPS)
+    assert sorted(keys) == [("rice", "flowering", 50.0, 60.0), ("tomato", "flowering", 50.0, 60.0)]
+    assert len(set(inverse[:3])) == 1 and inverse[3] != inverse[0]
+    assert arguments["temperature_c"].tolist() == [25.0, 25.0]
+    assert [keys[i][0] for i in inverse] == ["tomato", "tomato", "tomato", "rice"]
+
+
+class Predictor:
+    def __init__(self, collapse=False):
+        self.collapse = collapse
+        self.calls = 0
+
+    def predict_soil_moisture(self, temperature_c, pump_runtime_sec, crop, stage):
+        self.calls += 1
+        wet = np.asarray(stage) == "fruiting"
+        if self.collapse:  # broadcasts the first row's stage over the batch
+            wet = np.atleast_1d(wet)[0]
+        return np.asarray(temperature_c) / 100 + wet
+
+
+def test_array_calls_are_used_when_they_match_row_by_row():
+    batch = columns(np.arange(20.0), np.zeros(20), ["tomato"] * 20, ["seedling"] * 10 + ["fruiting"] * 10)
+    expected = np.arange(20.0) / 100 + (np.arange(20) >= 10)
+    for collapse in (False, True):
+        model = Predictor(collapse)
+        out = ml_worker.call_rows(model, "predict_soil_moisture", batch, 20)
+        assert np.allclose(out, expected)
+        assert ml_worker.array_methods[model]["predict_soil_moisture"] is (not collapse)
+        calls = model.calls
+        ml_worker.call_rows(model, "predict_soil_moisture", batch, 20)
+        assert model.calls - calls == (1 if not collapse else 20)
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(app, "prediction_cache", OrderedDict())
+    monkeypatch.setattr(app, "prediction_cache_stats", {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+    monkeypatch.setattr(app, "PREDICTION_CACHE_SIZE", 3)
+    monkeypatch.setattr(app, "model_generation", 1)
+    monkeypatch.setattr(app, "prediction_cache_generation", 1)
+    return app
+
+
+def test_least_recently_used_key_is_evicted(cache):
+    for key in ("a", "b", "c"):
+        cache.cache_put(key, 1.0, 1)
+    assert cache.cache_get("a") == 1.0  # "a" is now the most recent
+    cache.cache_put("d", 2.0, 1)
+    assert cache.cache_get("b") is None
+    assert [cache.cache_get(key) for key in ("a", "c", "d")] == [1.0, 1.0, 2.0]
+    info = cache.prediction_cache_info()
+    assert (info["size"], info["evictions"], info["hits"], info["misses"]) == (3, 1, 4, 1)
+
+
+def test_new_model_generation_invalidates(cache):
+    cache.cache_put("a", 1.0, 1)
+    cache.model_generation = 2
+    assert cache.cache_get("a") is None
+    assert cache.prediction_cache_info()["invalidations"] == 1
+    cache.cache_put("b", 1.0, 1)  # scored by the old models while they were swapped
+    assert cache.cache_get("b") is None
+    cache.cache_put("b", 3.0, 2)
+    assert cache.cache_get("b") == 3.0
+
@@ -0,0 +1,50 @@
+from app import RollingCounter
+
+T0 = 1767225600  # minute-aligned
+
+
+def counter():
+    return RollingCounter(window_sec=3600, bucket_sec=60)
+
+
+def test_values_expire_as_the_window_passes():
+    c = counter()
+    c.add(T0, 10)
+    c.add(T0 + 600, 20)
+    assert c.total(now=T0 + 600) == 30
+    assert c.total(now=T0 + 3599) == 30
+    assert c.total(now=T0 + 3600) == 20  # T0's bucket left the window
+    assert c.total(now=T0 + 4200) == 0
+
+
+def test_jump_past_the_whole_window_clears_everything():
+    c = counter()
+    for minute in range(60):
+        c.add(T0 + minute * 60, 1)
+    assert c.total(now=T0 + 3599) == 60
+    assert c.total(now=T0 + 10 * 3600) == 0
+    c.add(T0 + 10 * 3600, 5)
+    assert c.total(now=T0 + 10 * 3600) == 5
+
+
+def test_late_add_inside_the_window_counts():
+    c = counter()
+    c.add(T0 + 1800, 10)
+    c.add(T0 + 600, 7)  # reported late, still within the hour
+    assert c.total(now=T0 + 1800) == 17
+    assert c.total(now=T0 + 4200) == 10  # the late value expires on its own schedule
+
+
+def test_add_older_than_the_window_is_dropped():
+    c = counter()
+    c.add(T0 + 7200, 10)
+    c.add(T0 + 3600, 99)  # exactly one window back
+    c.add(T0, 99)
+    assert c.total(now=T0 + 7200) == 10
+
+
+def test_reset():
+    c = counter()
+    c.add(T0, 10)
+    c.reset()
+    assert c.total(now=T0) == 0
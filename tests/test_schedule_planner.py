@@ -0,0 +1,119 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import schedule_planner as sp
+
+TARIFF = sp.parse_tariff([["06:00", 0.15], ["00:00", 0.08], ["18:00", 0.30], ["22:00", 0.08]])
+
+
+def test_parse_tariff_sorts_and_validates():
+    assert TARIFF == [(0, 0.08), (360, 0.15), (1080, 0.30), (1320, 0.08)]
+    with pytest.raises(ValueError):
+        sp.parse_tariff([])
+    with pytest.raises(ValueError):
+        sp.parse_tariff([["24:30", 0.1]])
+
+
+def test_minute_prices_wrap_past_midnight():
+    prices = sp.minute_prices(sp.parse_tariff([["06:00", 0.2], ["20:00", 0.1]]))
+    assert len(prices) == sp.MINUTES_PER_DAY
+    assert prices[0] == 0.1 and prices[359] == 0.1
+    assert prices[360] == 0.2 and prices[1199] == 0.2
+    assert prices[1200] == 0.1
+
+
+def test_build_slots_cover_the_day_from_now():
+    slots = sp.build_slots(datetime(2026, 1, 1, 17, 30), TARIFF, slot_minutes=60)
+    assert slots[0]["minutes"] == 30 and slots[0]["price"] == 0.15
+    assert slots[1]["start"] == datetime(2026, 1, 1, 18, 0) and slots[1]["price"] == pytest.approx(0.30)
+    assert sum(s["minutes"] for s in slots) == 24 * 60
+    assert slots[-1]["end"] == datetime(2026, 1, 2, 17, 30)
+
+
+def slots_of(prices, minutes=60):
+    start = datetime(2026, 1, 1)
+    return [{"start": start, "end": start, "minutes": minutes, "price": p} for p in prices]
+
+
+def test_cover_meets_each_deadline_from_the_cheapest_open_slot():
+    slots = slots_of([0.3, 0.1, 0.2, 0.05])
+    alloc, shortfall = sp.cover(slots, [0, 30, 30, 90], step=5)
+    assert shortfall == 0
+    assert alloc == [0.0, 30.0, 0.0, 60.0]
+
+
+def test_cover_reports_shortfall_when_slots_are_full():
+    alloc, shortfall = sp.cover(slots_of([0.1, 0.2]), [90, 150], step=5)
+    assert alloc == [60.0, 60.0]
+    assert shortfall == 30
+
+
+def test_just_in_time_ignores_prices():
+    assert sp.just_in_time(slots_of([0.3, 0.1]), [20, 50]) == [20.0, 30.0]
+
+
+def test_trim_cuts_the_most_expensive_minutes_first():
+    slots = slots_of([0.3, 0.1, 0.3])
+    assert sp.trim(slots, [20, 20, 20], 35) == [15, 20, 0]
+
+
+def test_trim_cuts_whole_steps():
+    slots = slots_of([0.1, 0.3])
+    assert sp.trim(slots, [30, 30], 53, step=5) == [30, 20]
+
+
+def test_trim_drops_runs_that_would_fall_below_min_run():
+    slots = slots_of([0.3, 0.1, 0.3])
+    assert sp.trim(slots, [30, 30, 30], 65, step=5, min_run=20) == [30, 30, 0]
+    assert sp.trim(slots, [20, 20, 20], 35, step=5, min_run=20) == [0, 20, 0]
+
+
+def test_allowed_hour_ranges_wrap_midnight():
+    night = [[22, 6]]
+    assert sp.allowed({"start": datetime(2026, 1, 1, 23)}, night)
+    assert sp.allowed({"start": datetime(2026, 1, 1, 2)}, night)
+    assert not sp.allowed({"start": datetime(2026, 1, 1, 12)}, night)
+
+
+def test_windows_merge_touching_runs():
+    start = datetime(2026, 1, 1)
+    slots = [{"start": start.replace(hour=h), "minutes": 60, "price": 0.1} for h in range(3)]
+    runs = sp.windows(slots, [30, 60, 60])
+    assert runs == [(start, start.replace(minute=30)), (start.replace(hour=1), start.replace(hour=3))]
+    assert sp.cost(slots_of([0.2]), [30], 1000) == pytest.approx(0.1)
+
+
+def test_cover_skips_slots_shorter_than_a_minimum_run():
+    slots = slots_of([0.05, 0.1, 0.2])
+    slots[0]["minutes"] = 10
+    alloc, shortfall = sp.cover(slots, [0, 0, 15], step=5, min_run=20)
+    assert alloc == [0.0, 20.0, 0.0]
+    assert shortfall == 0
+
+
+def test_cover_tops_up_a_started_slot_below_min_run():
+    alloc, _ = sp.cover(slots_of([0.1, 0.2]), [25, 55], step=5, min_run=20)
+    assert alloc == [55.0, 0.0]
+
+
+def test_budget_trim_keeps_runs_at_least_min_run(farm, monkeypatch):
+    ctl = farm.controllers[farm.DEFAULT_FIELD]
+    now = time.time()
+    hour = int(now) // 3600
+    # 4 min of pumping in each of the last 24 hours: 96 min forecast for the next day
+    ctl.usage_history.load([((hour - h) * 3600, "motor", 240) for h in range(24)], now=now)
+    monkeypatch.setattr(farm, "IRRIGATION_MIN_ON_SEC", 20 * 60)
+    monkeypatch.setattr(farm, "SCHEDULER_STEP_MINUTES", 5)
+    monkeypatch.setattr(farm, "SCHEDULER_SLOT_MINUTES", 30)
+    unbudgeted = farm.plan_schedule(ctl, now)
+    assert unbudgeted["source"] == "forecast" and unbudgeted["pump_min"] >= 95
+
+    # Allow what is already in the trailing 24 h plus 47 more minutes
+    monkeypatch.setattr(farm, "IRRIGATION_WATER_BUDGET", farm.water_liters((96 + 47) * 60))
+    plan = farm.plan_schedule(ctl, now)
+    runs = [slot["pump_min"] for slot in plan["slots"] if slot["pump_min"] > 0]
+    assert runs and sum(runs) <= 47
+    assert all(minutes >= 20 and minutes % 5 == 0 for minutes in runs)
+    assert not plan["feasible"]
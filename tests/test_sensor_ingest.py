@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+from sensor_ingest import BUCKET_SEC, DAY_SEC, SensorLog
+
+T0 = 1767225600  # minute-aligned
+
+
+def test_minute_buckets():
+    log = SensorLog()
+    assert log.add({"temp_c": 20.0, "rh": 50}, ts=T0 + 1) == 2
+    log.add({"temp_c": 24.0}, ts=T0 + 30)
+    log.add({"temp_c": 22.0}, ts=T0 + 59)
+    assert log.take_finished(now=T0 + 59) == []  # minute still open
+    log.add({"temp_c": 30.0}, ts=T0 + 61)
+    rows = sorted(log.take_finished(now=T0 + 61))
+    assert rows == [(T0, "humidity_percent", 1, 50.0, 50.0, 50.0), (T0, "temperature_c", 3, 22.0, 20.0, 24.0)]
+    assert log.take_finished(now=T0 + 125) == [(T0 + 60, "temperature_c", 1, 30.0, 30.0, 30.0)]
+
+
+def test_bad_readings_are_rejected():
+    log = SensorLog()
+    assert log.add({"temp_c": "x", "rh": 140, "soil": float("nan"), "lux": -1, "unknown": 3, "rain_mm": 0}, ts=T0) == 1
+    assert log.info(now=T0)["rejected"] == 5
+
+
+def test_smoothing_does_not_depend_on_the_frame_rate():
+    def smoothed(hz):
+        log = SensorLog(smoothing_sec=30)
+        log.add({"soil": 0.2}, ts=T0)
+        steps = int(30 * hz)
+        for i in range(1, steps + 1):
+            log.add({"soil": 0.5}, ts=T0 + i / hz)
+        return log.values(now=T0 + 30)["soil_moisture"]
+
+    expected = 0.5 - 0.3 * math.exp(-1)  # one time constant of a step from 0.2 to 0.5
+    assert smoothed(1) == pytest.approx(expected, abs=1e-6)
+    assert smoothed(20) == pytest.approx(expected, abs=1e-6)
+
+
+def test_smoothing_restarts_after_a_gap_and_stale_values_drop_out():
+    log = SensorLog(smoothing_sec=30)
+    log.add({"temp_c": 10.0}, ts=T0)
+    log.add({"temp_c": 30.0}, ts=T0 + 600)
+    assert log.values(now=T0 + 600) == {"temperature_c": 30.0}
+    assert log.values(now=T0 + 1000, max_age=300) == {}
+
+
+def test_daily_rain_window():
+    log = SensorLog()
+    minutes = DAY_SEC // BUCKET_SEC
+    # One reading per minute for a day: 0.01 mm of rain each, daylight for the first 10 h
+    for m in range(minutes):
+        log.add({"rain_mm": 0.01, "lux": 5000 if m < 600 else 0}, ts=T0 + m * BUCKET_SEC)
+    log.take_finished(now=T0 + DAY_SEC)
+    daily = log.daily(now=T0 + DAY_SEC)
+    assert daily["rainfall_mm"] == pytest.approx(minutes * 0.01)
+    assert daily["light_hours"] == pytest.approx(10.0)
+    # Six dry, dark hours later the first six hours have left the window
+    for m in range(minutes, minutes + 360):
+        log.add({"rain_mm": 0.0, "lux": 0}, ts=T0 + m * BUCKET_SEC)
+    later = T0 + DAY_SEC + 6 * 3600
+    log.take_finished(now=later)
+    daily = log.daily(now=later)
+    assert daily["rainfall_mm"] == pytest.approx((minutes - 360) * 0.01)
+    assert daily["light_hours"] == pytest.approx(4.0)
+
+
+def test_daily_needs_most_of_the_day_logged():
+    log = SensorLog()
+    for m in range(600):
+        log.add({"rain_mm": 1.0}, ts=T0 + m * BUCKET_SEC)
+    log.take_finished(now=T0 + 601 * BUCKET_SEC)
+    assert log.daily(now=T0 + 601 * BUCKET_SEC)["rainfall_mm"] is None
+
+
+def test_load_restores_the_daily_window():
+    log = SensorLog()
+    minutes = DAY_SEC // BUCKET_SEC
+    log.load([(T0 + m * BUCKET_SEC, "rain_mm", 2, 0.5) for m in range(minutes)])
+    assert log.daily(now=T0 + DAY_SEC)["rainfall_mm"] == pytest.approx(minutes * 1.0)
@@ -0,0 +1,41 @@
+from serial_framing import FRAME_JSON, FRAME_LOG, LineFramer, parse_frame
+
+
+def test_lines_split_across_reads():
+    framer = LineFramer()
+    assert framer.feed(b'{"device":"mo') == []
+    assert framer.feed(b'tor","runtime":42}\r\n{"ack"') == [b'{"device":"motor","runtime":42}\r']
+    assert framer.feed(b":7}\n") == [b'{"ack":7}']
+    assert framer.pending() == 0
+
+
+def test_several_lines_in_one_read():
+    framer = LineFramer()
+    assert framer.feed(b"a\nb\n\nc") == [b"a", b"b", b""]
+    assert framer.pending() == 1
+    assert framer.feed(b"\n") == [b"c"]
+
+
+def test_consumed_bytes_are_released():
+    framer = LineFramer()
+    for _ in range(1000):
+        framer.feed(b"x" * 50 + b"\n")
+    assert len(framer.buf) < 200
+
+
+def test_overlong_line_is_dropped():
+    framer = LineFramer(max_line=16)
+    assert framer.feed(b"y" * 40) == []
+    assert framer.overflows == 1
+    assert framer.feed(b"tail\nok\n") == [b"tail", b"ok"]
+
+
+def test_parse_json_object_frame():
+    assert parse_frame(b' {"ack":3,"ok":true}\r') == (FRAME_JSON, {"ack": 3, "ok": True})
+
+
+def test_parse_log_lines():
+    assert parse_frame("🚀 Smart Farm ESP32 Started\r".encode()) == (FRAME_LOG, "🚀 Smart Farm ESP32 Started")
+    assert parse_frame(b"{not json}") == (FRAME_LOG, "{not json}")
+    assert parse_frame(b"[1, 2]") == (FRAME_LOG, "[1, 2]")
+    assert parse_frame(b"\xff{x") == (FRAME_LOG, "�{x")
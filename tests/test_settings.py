@@ -0,0 +1,40 @@
+import sqlite3
+
+
+def reload_counter(farm, monkeypatch):
+    calls = []
+    reload = farm._reload_settings_locked
+    monkeypatch.setattr(farm, "_reload_settings_locked", lambda: calls.append(1) or reload())
+    return calls
+
+
+def test_write_from_another_connection_is_picked_up(farm, monkeypatch):
+    reloads = reload_counter(farm, monkeypatch)
+    revision = farm.settings_revision
+    other = sqlite3.connect(farm.DB_PATH)
+    other.execute("UPDATE settings SET value = 'wheat' WHERE key = 'crop'")
+    other.commit()
+    other.close()
+    assert farm.get_setting("crop") == "wheat"
+    assert farm.settings_revision == revision + 1
+    assert len(reloads) == 1
+    assert farm.check_settings() is False
+    assert len(reloads) == 1
+
+
+def test_other_tables_do_not_reload_settings(farm, monkeypatch):
+    reloads = reload_counter(farm, monkeypatch)
+    version = farm.settings_version
+    other = sqlite3.connect(farm.DB_PATH)
+    for ts in range(20):
+        other.execute("INSERT INTO usage (ts, device, runtime_sec) VALUES (?, 'motor', 5)", (ts,))
+        other.commit()
+    other.close()
+    assert farm.check_settings() is False
+    assert reloads == [] and farm.settings_version == version
+
+
+def test_set_setting_is_visible_at_once(farm):
+    farm.set_setting("light_name", "Lamp")
+    assert farm.get_setting("light_name") == "Lamp"
+    assert farm.get_setting("missing", "default") == "default"
@@ -0,0 +1,22 @@
+def test_status_etag_and_304(farm):
+    client = farm.create_app(services=False).test_client()
+    first = client.get("/api/status")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert first.get_json()["field"] == farm.DEFAULT_FIELD
+
+    again = client.get("/api/status", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+    farm.controllers[farm.DEFAULT_FIELD].relay_state["light"] = True
+    changed = client.get("/api/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["relay"]["light"] is True
+
+
+def test_status_of_unknown_field(farm):
+    client = farm.create_app(services=False).test_client()
+    assert client.get("/api/fields/nope/status").status_code == 404
@@ -0,0 +1,99 @@
+import pytest
+
+from usage_forecast import FEATURES, UsageHistory
+
+HOUR = 3600
+NOW = 1767225600 + 1800  # half past midnight, 2026-01-01 UTC
+
+
+def steady(days, per_hour=600.0):
+    """Motor runs per_hour seconds in every hour of the last `days` days, the current hour included."""
+    first = NOW // HOUR - days * 24 + 1
+    return [((first + h) * HOUR, "motor", per_hour) for h in range(days * 24)]
+
+
+def test_no_forecast_before_a_full_day():
+    history = UsageHistory()
+    history.load(steady(0) + [(NOW, "motor", 300)], now=NOW)
+    motor = history.forecast(now=NOW)["devices"]["motor"]
+    assert motor["runtime_sec"] is None and motor["method"] is None
+
+
+def test_mean_rate_until_there_is_enough_to_fit():
+    history = UsageHistory(min_days=8)
+    history.load(steady(2), now=NOW)
+    forecast = history.forecast(now=NOW)
+    assert forecast["history_hours"] == 48
+    motor = forecast["devices"]["motor"]
+    assert (motor["runtime_sec"], motor["method"]) == (24 * 600.0, "mean")
+    assert forecast["devices"]["light"]["runtime_sec"] == 0
+
+
+def test_lag_and_rolling_features():
+    history = UsageHistory()
+    history.load(steady(8), now=NOW)
+    features = history.forecast(now=NOW)["devices"]["motor"]["features"]
+    day = 24 * 600.0
+    assert features == {"last_1h": 600.0, "last_24h": day, "prev_24h": day,
+                        "week_ago_next_24h": day, "mean_7d": day, "std_7d": 0.0}
+    assert set(features) == set(FEATURES)
+
+
+def test_ridge_once_min_days_are_logged():
+    history = UsageHistory(min_days=8)
+    history.load(steady(12), now=NOW)
+    motor = history.forecast(now=NOW)["devices"]["motor"]
+    assert motor["method"] == "ridge"
+    assert motor["training_rows"] >= 24
+    assert motor["runtime_sec"] == pytest.approx(24 * 600.0, rel=1e-3)
+
+
+def test_add_recomputes_only_the_new_rows():
+    history = UsageHistory()
+    history.load(steady(10), now=NOW)
+    history.forecast(now=NOW)
+    rows = history.stats["feature_rows"]
+    history.add(NOW + 60, "motor", 120)
+    features = history.forecast(now=NOW + 60)["devices"]["motor"]["features"]
+    assert history.stats["feature_rows"] - rows == 1
+    assert features["last_1h"] == 720.0
+    history.add(NOW + HOUR, "motor", 30)  # next hour: one new row
+    history.forecast(now=NOW + HOUR)
+    assert history.stats["feature_rows"] - rows == 2
+
+
+def test_forecast_is_cached_until_the_history_changes():
+    history = UsageHistory()
+    history.load(steady(3), now=NOW)
+    first = history.forecast(now=NOW)
+    assert history.forecast(now=NOW + 60) is first
+    assert history.stats["forecasts"] == 1
+    history.add(NOW + 120, "light", 60)
+    assert history.forecast(now=NOW + 120) is not first
+    assert history.stats["forecasts"] == 2
+
+
+def test_late_event_refits():
+    history = UsageHistory(min_days=8)
+    history.load(steady(12), now=NOW)
+    history.forecast(now=NOW)
+    fits = history.stats["fits"]
+    history.add(NOW - 5 * HOUR, "motor", 60)
+    history.forecast(now=NOW)
+    assert history.stats["fits"] == fits + 1
+
+
+
+def test_status_predictions_wait_for_a_day_of_history(monkeypatch):
+    import app
+    ctl = app.Controller("test", "Test")
+    history = ctl.usage_history
+    monkeypatch.setattr(history, "forecast", lambda now=None, forecast=history.forecast: forecast(now=NOW))
+    history.load([(NOW, "motor", 300)], now=NOW)
+    assert app.get_predictions(ctl) == {"water_liters": None, "power_kwh": None, "source": None}
+    history.load(steady(2), now=NOW)
+    assert app.get_predictions(ctl) == {
+        "water_liters": round(app.water_liters(24 * 600.0), 1),
+        "power_kwh": round(app.power_kwh(24 * 600.0, app.MOTOR_WATT), 2),
+        "source": "history",
+    }
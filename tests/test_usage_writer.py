@@ -0,0 +1,54 @@
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def writer(farm, monkeypatch):
+    monkeypatch.setattr(farm, "usage_queue", queue.Queue(maxsize=farm.USAGE_WRITER_QUEUE_MAX))
+    monkeypatch.setattr(farm, "usage_writer_stop", threading.Event())
+    monkeypatch.setattr(farm, "usage_writer", None)
+    monkeypatch.setattr(farm, "usage_writer_stats", dict(farm.usage_writer_stats, written=0, batches=0))
+    yield farm
+    farm.stop_usage_writer()
+
+
+def committed(farm):
+    with sqlite3.connect(farm.DB_PATH) as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(runtime_sec), 0) FROM usage").fetchone()
+
+
+def rows(n, start=1767225600):
+    return [(start + i, "main", "motor" if i % 2 else "light", 10) for i in range(n)]
+
+
+def test_rows_are_written_in_batches(writer):
+    writer.start_usage_writer()
+    for row in rows(200):
+        writer.enqueue_usage(row)
+    writer.stop_usage_writer()
+    assert committed(writer) == (200, 2000)
+    assert writer.usage_writer_stats["written"] == 200
+    assert writer.usage_writer_stats["batches"] < 200
+
+
+def test_stop_drains_rows_still_queued(writer):
+    # A writer that is alive but stuck: rows pile up in the queue
+    release = threading.Event()
+    stuck = threading.Thread(target=release.wait, daemon=True)
+    stuck.start()
+    writer.usage_writer = stuck
+    for row in rows(50):
+        writer.enqueue_usage(row)
+    assert writer.usage_queue.qsize() == 50 and committed(writer) == (0, 0)
+    writer.stop_usage_writer(timeout=0.1)
+    release.set()
+    assert committed(writer) == (50, 500)
+    assert writer.usage_queue.empty() and writer.usage_writer is None
+
+
+def test_rows_are_written_inline_without_a_writer(writer):
+    writer.enqueue_usage(rows(1)[0])
+    assert committed(writer) == (1, 10)
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_app_starts_nothing():
+    # A fresh interpreter, so the tests' own imports do not hide side effects
+    code = "import threading, app; print(hasattr(app, 'app'), [t.name for t in threading.enumerate()])"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.split("\n")[-2] == "False ['MainThread']"
@@ -0,0 +1,416 @@
+"""
+Smart Farm — flat tree-ensemble artifacts
+Exports the scikit-learn tree ensembles inside a fitted predictor as flat NumPy
+arrays in one file, and loads them back memory-mapped read-only so every
+process on the gateway shares the same pages.
+
+File layout (little endian):
+    b"SFFLAT01" | uint64 header length | JSON header | arrays, 64-byte aligned
+
+The rest of the predictor (encoders, column lists, ...) is pickled into the same
+file with each ensemble replaced by a reference; loading it yields the same
+predictor object with FlatEnsemble stand-ins that predict with pure NumPy
+traversal and reproduce scikit-learn's results bit for bit.
+
+    python tree_models.py export --model-dir model
+    python tree_models.py verify --model-dir model
+"""
+
+import io
+import json
+import os
+import pickle
+import sys
+import warnings
+
+import numpy as np
+
+MAGIC = b"SFFLAT01"
+FORMAT_VERSION = 1
+ALIGN = 64
+DEFAULT_ARTIFACT = "predictor.flat"
+
+
+class StaleArtifact(RuntimeError):
+    """The artifact was exported from model files that have since changed."""
+
+
+class FlatEnsemble:
+    """Read-only stand-in for a fitted tree regressor (predict only).
+
+    Nodes of all trees live in shared arrays; a leaf points to itself, so
+    walking max_depth levels from each root lands every row on its leaf. X is
+    rounded to float32 before comparing, as scikit-learn does, and the tree
+    outputs are accumulated in estimator order so the float64 results match
+    the original model exactly."""
+
+    def __init__(self, kind: str, arrays: dict, max_depth: int, n_features: int,
+                 feature_names: list = None, learning_rate: float = 1.0, init: float = 0.0):
+        self.kind = kind
+        self.roots = arrays["roots"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+        self.missing_left = arrays["missing_left"]
+        self.max_depth = max_depth
+        self.n_features_in_ = n_features
+        if feature_names is not None:
+            self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.learning_rate = learning_rate
+        self.init = init
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _as_matrix(self, X) -> np.ndarray:
+        names = getattr(self, "feature_names_in_", None)
+        if names is not None and hasattr(X, "columns"):
+            X = X[list(names)]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, expected {self.n_features_in_}")
+        return X.astype(np.float64)
+
+    def leaf_values(self, X) -> np.ndarray:
+        """(n_samples, n_trees) value of the leaf each row reaches in each tree."""
+        return self._leaves(self._as_matrix(X))
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        n, n_features = X.shape
+        values = X.ravel()
+        # One entry per (row, tree) path; paths that reached a leaf are dropped
+        # once they make up a quarter of the active set (deep forests have
+        # ragged depths, shallow boosting stages rarely pay for the compaction)
+        leaf = np.broadcast_to(self.roots, (n, self.n_trees)).ravel().copy()
+        slot = np.arange(leaf.size)
+        base = np.repeat(np.arange(n) * n_features, self.n_trees)
+        node = leaf
+        for _ in range(self.max_depth):
+            x = values[base + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, self.missing_left[node], go_left)
+            following = np.where(go_left, self.left[node], self.right[node])
+            moving = following != node
+            node = following
+            settled = node.size - np.count_nonzero(moving)
+            if settled == node.size:
+                break
+            if settled * 4 >= node.size:
+                leaf[slot] = node
+                slot, base, node = slot[moving], base[moving], node[moving]
+        leaf[slot] = node
+        return self.value[leaf].reshape(n, self.n_trees)
+
+    def predict(self, X) -> np.ndarray:
+        X = self._as_matrix(X)
+        if self.kind == "boosting" and np.isnan(X).any():
+            raise ValueError("Input X contains NaN; gradient boosting does not accept missing values")
+        leaves = self._leaves(X)
+        if self.kind == "tree":
+            return leaves[:, 0].copy()
+        # cumsum adds strictly left to right, the same order as scikit-learn's
+        # per-estimator accumulation (np.sum would pair terms differently)
+        if self.kind == "forest":
+            return np.cumsum(leaves, axis=1)[:, -1] / self.n_trees
+        terms = np.empty((leaves.shape[0], self.n_trees + 1))
+        terms[:, 0] = self.init
+        np.multiply(self.learning_rate, leaves, out=terms[:, 1:])
+        return np.cumsum(terms, axis=1)[:, -1]
+
+
+# --- Export ---
+def describe(estimator):
+    """(kind, trees, learning_rate, init) for a supported single-output tree
+    regressor, or None if the estimator has to stay pickled."""
+    from sklearn.dummy import DummyRegressor
+    from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.tree import DecisionTreeRegressor, ExtraTreeRegressor
+
+    if getattr(estimator, "n_outputs_", 1) != 1:
+        return None
+    if type(estimator) in (DecisionTreeRegressor, ExtraTreeRegressor) and hasattr(estimator, "tree_"):
+        return "tree", [estimator.tree_], 1.0, 0.0
+    if type(estimator) in (RandomForestRegressor, ExtraTreesRegressor) and hasattr(estimator, "estimators_"):
+        return "forest", [e.tree_ for e in estimator.estimators_], 1.0, 0.0
+    if type(estimator) is GradientBoostingRegressor and hasattr(estimator, "estimators_"):
+        init = estimator.init_
+        if isinstance(init, str) and init == "zero":
+            init_value = 0.0
+        elif type(init) is DummyRegressor and np.size(init.constant_) == 1:
+            init_value = float(np.ravel(init.constant_)[0])
+        else:
+            return None
+        return "boosting", [e.tree_ for e in estimator.estimators_[:, 0]], float(estimator.learning_rate), init_value
+    return None
+
+
+def flatten_trees(trees: list) -> tuple:
+    """Concatenate sklearn Tree objects into shared node arrays; returns (arrays, max_depth)."""
+    roots, left, right, feature, threshold, value, missing_left = [], [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        n = tree.node_count
+        ids = np.arange(offset, offset + n, dtype=np.int64)
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        left.append(np.where(leaf, ids, tree.children_left + offset))
+        right.append(np.where(leaf, ids, tree.children_right + offset))
+        feature.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(np.where(leaf, 0.0, tree.threshold))
+        value.append(tree.value[:, 0, 0].astype(np.float64))
+        mgl = getattr(tree, "missing_go_to_left", None)
+        missing_left.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+        offset += n
+    arrays = {
+        "roots": np.asarray(roots, dtype=np.int64),
+        "left": np.concatenate(left).astype(np.int64),
+        "right": np.concatenate(right).astype(np.int64),
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.concatenate(value),
+        "missing_left": np.concatenate(missing_left),
+    }
+    return arrays, max(int(t.max_depth) for t in trees)
+
+
+class _ExportPickler(pickle.Pickler):
+    def __init__(self, file):
+        super().__init__(file, protocol=5)
+        self.ensembles = []
+        self.seen = {}
+
+    def persistent_id(self, obj):
+        if id(obj) in self.seen:
+            return ("flat", self.seen[id(obj)])
+        try:
+            described = describe(obj)
+        except Exception:
+            described = None
+        if described is None:
+            return None
+        self.seen[id(obj)] = len(self.ensembles)
+        self.ensembles.append((obj, described))
+        return ("flat", len(self.ensembles) - 1)
+
+
+def source_stamp(model_dir: str) -> dict:
+    """{file name: [size, mtime_ns]} of the model files (pickles and the
+    predictor code) an artifact is exported from."""
+    stamp = {}
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path) or name.endswith((".flat", ".tmp", ".pyc")):
+            continue
+        st = os.stat(path)
+        stamp[name] = [st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+def export(predictor, path: str, model_dir: str = None) -> dict:
+    """Write `predictor` with its tree ensembles flattened; returns a summary."""
+    buf = io.BytesIO()
+    pickler = _ExportPickler(buf)
+    pickler.dump(predictor)
+    skeleton = np.frombuffer(buf.getvalue(), dtype=np.uint8)
+
+    blobs, meta = {"skeleton": skeleton}, []
+    for i, (estimator, (kind, trees, learning_rate, init)) in enumerate(pickler.ensembles):
+        arrays, max_depth = flatten_trees(trees)
+        names = getattr(estimator, "feature_names_in_", None)
+        meta.append({
+            "kind": kind,
+            "estimator": type(estimator).__name__,
+            "trees": len(trees),
+            "nodes": int(len(arrays["value"])),
+            "max_depth": max_depth,
+            "n_features": int(estimator.n_features_in_),
+            "feature_names": [str(n) for n in names] if names is not None else None,
+            "learning_rate": learning_rate,
+            "init": init,
+        })
+        for name, array in arrays.items():
+            blobs[f"{i}.{name}"] = np.ascontiguousarray(array)
+
+    layout, offset = {}, 0
+    for name, array in blobs.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        layout[name] = [offset, array.dtype.str, list(array.shape)]
+        offset += array.nbytes
+    header = {
+        "version": FORMAT_VERSION,
+        "ensembles": meta,
+        "arrays": layout,
+        "sources": source_stamp(model_dir) if model_dir else None,
+    }
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, array in blobs.items():
+            f.seek(data_start + layout[name][0])
+            f.write(array.tobytes())
+    os.replace(tmp, path)
+    return {"ensembles": meta, "bytes": os.path.getsize(path), "skeleton_bytes": int(skeleton.nbytes)}
+
+
+# --- Load ---
+def read_header(path: str) -> tuple:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat model artifact")
+        size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(size))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported artifact version {header.get('version')}")
+    data_start = -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+    return header, data_start
+
+
+class _LoadUnpickler(pickle.Unpickler):
+    def __init__(self, file, ensembles):
+        super().__init__(file)
+        self.ensembles = ensembles
+
+    def persistent_load(self, pid):
+        tag, index = pid
+        if tag != "flat":
+            raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
+        return self.ensembles[index]
+
+
+def load(path: str, model_dir: str = None):
+    """Memory-map an artifact and rebuild the predictor it was exported from.
+    With model_dir, raises StaleArtifact if the model files changed since export."""
+    header, data_start = read_header(path)
+    if model_dir and header.get("sources") is not None:
+        if source_stamp(model_dir) != header["sources"]:
+            raise StaleArtifact(f"{os.path.basename(path)} is older than the model files")
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def array(name):
+        offset, dtype, shape = header["arrays"][name]
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape)) if shape else 1
+        return np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+
+    ensembles = []
+    for i, meta in enumerate(header["ensembles"]):
+        arrays = {name: array(f"{i}.{name}") for name in
+                  ("roots", "left", "right", "feature", "threshold", "value", "missing_left")}
+        ensembles.append(FlatEnsemble(
+            meta["kind"], arrays, meta["max_depth"], meta["n_features"],
+            meta["feature_names"], meta["learning_rate"], meta["init"],
+        ))
+    skeleton = array("skeleton")
+    return _LoadUnpickler(io.BytesIO(skeleton.tobytes()), ensembles).load()
+
+
+# --- Verification ---
+def probe_inputs(flat: FlatEnsemble, n: int = 2000, seed: int = 0) -> np.ndarray:
+    """Rows that exercise the split boundaries: every value is a threshold, its
+    float32 neighbours, or a random point around the thresholds of that feature."""
+    rng = np.random.default_rng(seed)
+    internal = flat.left != np.arange(len(flat.left))
+    X = np.empty((n, flat.n_features_in_), dtype=np.float32)
+    for j in range(flat.n_features_in_):
+        cuts = flat.threshold[internal & (flat.feature == j)].astype(np.float32)
+        cuts = cuts[np.isfinite(cuts)]
+        if cuts.size == 0:
+            X[:, j] = rng.uniform(-1, 1, n)
+            continue
+        lo, hi = float(cuts.min()), float(cuts.max())
+        pick = rng.choice(cuts, n)
+        mode = rng.integers(0, 4, n)
+        X[:, j] = np.select(
+            [mode == 0, mode == 1, mode == 2],
+            [pick, np.nextafter(pick, np.float32(np.inf)), np.nextafter(pick, np.float32(-np.inf))],
+            rng.uniform(lo - 1 - abs(lo) * 0.1, hi + 1 + abs(hi) * 0.1, n).astype(np.float32),
+        )
+    return X
+
+
+def same_bits(a, b) -> bool:
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    b = np.ascontiguousarray(b, dtype=np.float64)
+    return a.shape == b.shape and np.array_equal(a.view(np.uint64), b.view(np.uint64))
+
+
+def verify(original, flat_predictor, n: int = 2000) -> list:
+    """Compare every flattened ensemble with the estimator it replaced on
+    boundary-probing inputs. Returns [(estimator name, rows, identical)]."""
+    pickler = _ExportPickler(io.BytesIO())
+    pickler.dump(original)
+    flats = _FlatCollector(io.BytesIO())
+    flats.dump(flat_predictor)
+    if len(flats.found) != len(pickler.ensembles):
+        raise ValueError(f"artifact holds {len(flats.found)} ensembles, predictor has {len(pickler.ensembles)}")
+    results = []
+    for (estimator, _), flat in zip(pickler.ensembles, flats.found):
+        X = probe_inputs(flat, n)
+        names = getattr(estimator, "feature_names_in_", None)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if names is not None:
+                import pandas as pd
+                expected = estimator.predict(pd.DataFrame(X, columns=names))
+            else:
+                expected = estimator.predict(X)
+        results.append((type(estimator).__name__, n, same_bits(expected, flat.predict(X))))
+    return results
+
+
+class _FlatCollector(pickle.Pickler):
+    """Walks a loaded predictor the same way the export did, collecting its FlatEnsembles."""
+
+    def __init__(self, file):
+        super().__init__(file, protocol=5)
+        self.found = []
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, FlatEnsemble):
+            return None
+        if not any(f is obj for f in self.found):
+            self.found.append(obj)
+        return ("flat", next(i for i, f in enumerate(self.found) if f is obj))
+
+
+# --- CLI ---
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Smart Farm flat tree-model artifacts")
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("--model-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "model"))
+    parser.add_argument("--out", help=f"Artifact path (default: <model-dir>/{DEFAULT_ARTIFACT})")
+    parser.add_argument("--rows", type=int, default=2000, help="Probe rows per ensemble (default: 2000)")
+    args = parser.parse_args()
+    path = args.out or os.path.join(args.model_dir, DEFAULT_ARTIFACT)
+
+    sys.path.append(args.model_dir)
+    from prediction_functions import SmartFarmPredictor
+    original = SmartFarmPredictor(args.model_dir)
+    if args.command == "export":
+        summary = export(original, path, args.model_dir)
+        trees = sum(e["trees"] for e in summary["ensembles"])
+        print(f"✅ Wrote {path}: {len(summary['ensembles'])} ensembles, {trees} trees, "
+              f"{summary['bytes'] / 1024:.0f} KiB")
+    flat = load(path, args.model_dir)
+    ok = True
+    for name, rows, identical in verify(original, flat, args.rows):
+        print(f"  {'✅' if identical else '❌'} {name}: {rows} rows {'bit-identical' if identical else 'DIFFER'}")
+        ok = ok and identical
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Smart Farm — usage forecasting
+Next-24-hour pump and light runtime per field, forecast from the logged usage
+history instead of fixed inputs.
+
+UsageHistory keeps the last `days` of hourly runtime per device in NumPy
+arrays, together with a cached frame of lagged and rolling features for every
+hour. A new runtime only touches its own hour, so only the feature rows from
+that hour on are recomputed; the ridge model is refit only when the training
+window changes (a new hour or a late event), and the forecast itself is cached
+until the next change. Everything is vectorized over hours and devices.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+DEVICES = ("motor", "light")
+FEATURES = (
+    "last_1h",            # runtime in the current hour
+    "last_24h",           # the 24 h up to now
+    "prev_24h",           # the 24 h before that
+    "week_ago_next_24h",  # what the next 24 h looked like a week ago
+    "mean_7d",            # daily mean over the last 7 days
+    "std_7d",             # spread of the last 7 daily totals
+)
+# Hours of history a feature row looks back over (7 days of 24 h windows)
+LOOKBACK = 7 * 24
+HORIZON = 24
+
+
+class UsageHistory:
+    """Hourly runtime per device for one field, with cached features and
+    forecast. add() is O(1) apart from advancing to a new hour; forecast()
+    recomputes only what changed since the last call."""
+
+    def __init__(self, days: int = 60, min_days: int = 8, ridge: float = 1.0):
+        self.n = days * 24
+        self.min_rows = max(1, (min_days - 7) * 24)
+        self.ridge = ridge
+        self.runtime = np.zeros((self.n, len(DEVICES)))
+        self.features = np.full((self.n, len(DEVICES), len(FEATURES)), np.nan)
+        self.end = None          # absolute hour number of the newest row + 1
+        self.first_hour = None   # oldest hour with recorded usage
+        self.dirty_from = self.n  # first feature row that needs recomputing
+        self.fit_stale = True
+        self.coefs = None
+        self.version = 0
+        self.forecast_version = None
+        self.cached_forecast = None
+        self.stats = {"events": 0, "feature_rows": 0, "fits": 0, "forecasts": 0}
+        self.lock = threading.Lock()
+
+    # --- Series ---
+    def _advance(self, hour: int):
+        if self.end is None:
+            self.end = hour + 1
+            return
+        shift = hour + 1 - self.end
+        if shift <= 0:
+            return
+        if shift >= self.n:
+            self.runtime[:] = 0
+            self.features[:] = np.nan
+        else:
+            self.runtime[:-shift] = self.runtime[shift:]
+            self.runtime[-shift:] = 0
+            self.features[:-shift] = self.features[shift:]
+        self.end = hour + 1
+        self.dirty_from = max(0, min(self.dirty_from - shift, self.n - shift))
+        self.fit_stale = True
+        self.version += 1
+
+    def _row(self, hour: int) -> int:
+        return hour - (self.end - self.n)
+
+    def add(self, ts: float, device: str, runtime_sec: float):
+        """Add a completed runtime reported at ts (same bucketing as usage_hourly)."""
+        hour = int(ts) // 3600
+        with self.lock:
+            self._advance(hour)
+            row = self._row(hour)
+            if row < 0 or device not in DEVICES:
+                return
+            self.runtime[row, DEVICES.index(device)] += runtime_sec
+            self.first_hour = hour if self.first_hour is None else min(self.first_hour, hour)
+            self.dirty_from = min(self.dirty_from, row)
+            if row < self.n - 1:
+                self.fit_stale = True  # late event inside the training window
+            self.stats["events"] += 1
+            self.version += 1
+
+    def load(self, rows, now: float = None):
+        """Replace the history with (hour_start_ts, device, runtime_sec) rows."""
+        with self.lock:
+            self.runtime[:] = 0
+            self.features[:] = np.nan
+            self.end = None
+            self.first_hour = None
+            self._advance(int(now if now is not None else time.time()) // 3600)
+            for ts, device, runtime_sec in rows:
+                hour = int(ts) // 3600
+                row = self._row(hour)
+                if 0 <= row < self.n and device in DEVICES:
+                    self.runtime[row, DEVICES.index(device)] += runtime_sec
+                    self.first_hour = hour if self.first_hour is None else min(self.first_hour, hour)
+            self.dirty_from = 0
+            self.fit_stale = True
+            self.version += 1
+
+    def recent(self, hours: int, now: float = None) -> tuple:
+        """(start ts of the oldest hour, runtime per hour and device) for the
+        last `hours` hours, the current one included."""
+        with self.lock:
+            self._advance(int(now if now is not None else time.time()) // 3600)
+            return (self.end - hours) * 3600, self.runtime[-hours:].copy()
+
+    # --- Features ---
+    def _refresh_features(self):
+        """Recompute feature rows [dirty_from, n) from a cumulative sum over
+        just the slice they look back on."""
+        start = self.dirty_from
+        if start >= self.n:
+            return
+        lo = max(0, start - LOOKBACK)
+        csum = np.vstack([np.zeros((1, len(DEVICES))), np.cumsum(self.runtime[lo:], axis=0)])
+        rows = np.arange(start, self.n)
+        local = rows - lo
+
+        def window(back: int, length: int) -> np.ndarray:
+            """Sum of `length` hours ending `back` hours before each row."""
+            hi = local - back + 1
+            lo_ = hi - length
+            out = csum[np.clip(hi, 0, None)] - csum[np.clip(lo_, 0, None)]
+            out[lo_ < 0] = np.nan  # window starts before the slice
+            return out
+
+        daily = np.stack([window(24 * k, 24) for k in range(7)])  # (7, rows, devices)
+        frame = np.stack([
+            window(0, 1),
+            daily[0],
+            daily[1],
+            daily[6],
+            daily.sum(axis=0) / 7,
+            daily.std(axis=0),
+        ], axis=-1)
+        # Rows whose look-back reaches before the first recorded usage are unknown
+        if self.first_hour is None:
+            frame[:] = np.nan
+        else:
+            first_row = self._row(self.first_hour)
+            frame[rows - LOOKBACK + 1 < first_row] = np.nan
+        self.features[start:] = frame
+        self.stats["feature_rows"] += len(rows)
+        self.dirty_from = self.n
+
+    def _targets(self) -> np.ndarray:
+        """Runtime in the 24 h after each row; NaN where that is not over yet."""
+        csum = np.vstack([np.zeros((1, len(DEVICES))), np.cumsum(self.runtime, axis=0)])
+        rows = np.arange(self.n)
+        hi = rows + 1 + HORIZON
+        out = np.full((self.n, len(DEVICES)), np.nan)
+        done = hi <= self.n - 1  # the newest row is the hour in progress
+        out[done] = csum[hi[done]] - csum[rows[done] + 1]
+        return out
+
+    # --- Model ---
+    def _fit(self):
+        """Ridge regression per device of the next 24 h on the feature rows."""
+        targets = self._targets()
+        self.coefs = []
+        for d in range(len(DEVICES)):
+            X, y = self.features[:, d, :], targets[:, d]
+            ok = np.isfinite(X).all(axis=1) & np.isfinite(y)
+            if ok.sum() < self.min_rows:
+                self.coefs.append(None)
+                continue
+            X, y = X[ok], y[ok]
+            mean, scale = X.mean(axis=0), X.std(axis=0)
+            scale[scale == 0] = 1.0
+            Z = np.hstack([np.ones((len(X), 1)), (X - mean) / scale])
+            penalty = self.ridge * np.eye(Z.shape[1])
+            penalty[0, 0] = 0.0
+            beta = np.linalg.solve(Z.T @ Z + penalty, Z.T @ y)
+            self.coefs.append((mean, scale, beta, int(ok.sum())))
+        self.fit_stale = False
+        self.stats["fits"] += 1
+
+    def forecast(self, now: float = None) -> dict:
+        """Next-24 h runtime per device: {"history_hours", "devices": {device:
+        {"runtime_sec", "method", "training_rows", "features"}}}. method is
+        "ridge" once min_days of history exist, "mean" (recorded daily mean)
+        from the first full day and None before that."""
+        with self.lock:
+            self._advance(int(now if now is not None else time.time()) // 3600)
+            if self.forecast_version == self.version:
+                return self.cached_forecast
+            self._refresh_features()
+            if self.fit_stale:
+                self._fit()
+            recorded = 0 if self.first_hour is None else self.end - max(self.first_hour, self.end - self.n)
+            current = self.features[-1]
+            devices = {}
+            for d, device in enumerate(DEVICES):
+                value, method, rows = None, None, 0
+                if self.coefs[d] is not None and np.isfinite(current[d]).all():
+                    mean, scale, beta, rows = self.coefs[d]
+                    value = float(beta[0] + ((current[d] - mean) / scale) @ beta[1:])
+                    method = "ridge"
+                elif recorded >= HORIZON:
+                    value = float(self.runtime[-recorded:, d].sum() * HORIZON / recorded)
+                    method = "mean"
+                devices[device] = {
+                    "runtime_sec": round(max(0.0, value), 1) if value is not None else None,
+                    "method": method,
+                    "training_rows": rows,
+                    "features": {name: (round(float(v), 1) if np.isfinite(v) else None)
+                                 for name, v in zip(FEATURES, current[d])},
+                }
+            self.stats["forecasts"] += 1
+            self.cached_forecast = {"history_hours": int(recorded), "devices": devices}
+            self.forecast_version = self.version
+            return self.cached_forecast
+
+    def info(self) -> dict:
+        with self.lock:
+            return dict(self.stats, version=self.version, hours=self.n)
@@ -0,0 +1,11 @@
+"""
+Smart Farm — WSGI entry point
+    gunicorn -w 1 --threads 8 wsgi:app
+    flask --app wsgi run --host 0.0.0.0
+Builds the full app with its serial readers and background services; keep a
+single worker process, since each ESP32 port can only be opened once.
+"""
+
+from app import create_app
+
+app = create_app()